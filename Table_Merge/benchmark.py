@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+"""
+合并引擎性能基准
+- 生成合成的表1/表2：行数、表2键基数、重复率、键长度、中文字符比例均可配置（同一随机种子结果一致）
+- 场景：exact 完全相同单键 / fuzzy 模糊单键 / multi 完全相同双键 / multi_fuzzy 模糊 + 完全相同双键
+- 每个场景端到端运行 process_merge，记录总耗时、吞吐量与各阶段耗时（读取、清洗与索引、匹配、写出）
+- 结果追加写入 JSON Lines 文件（含版本标签与 git 提交号），--compare 按版本对比同一场景的耗时
+用法：
+    python benchmark.py --rows 10000,100000,1000000 --scenarios exact,fuzzy,multi --label v2
+    python benchmark.py --compare
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from queue import Queue
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from merge_runner import PHASES, process_merge
+from table_reader import HAS_PYARROW, TABLE_CACHE
+
+RESULTS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_results.jsonl")
+ASCII_CHARS = np.array(list("abcdefghijklmnopqrstuvwxyz0123456789"))
+CHINESE_CHARS = np.array(list("北京上海天津重庆河北山西辽宁吉林黑龙江苏浙安徽福建江西山东河南湖北湖南广东海南四川贵州云南陕西甘肃"
+                              "青海台湾内蒙古广西西藏宁夏新疆香港澳门市县区镇乡村街道路号楼公司集团有限责任股份科技"))
+REGIONS = np.array(["华北", "华东", "华南", "华中", "西南", "西北", "东北"])
+
+# 场景：{名称: 匹配对}；fuzzy 用表1的 key_part（表2键去掉首字符，为其子串）匹配表2的 key
+SCENARIOS: Dict[str, List[Dict]] = {
+    "exact": [{"col1": "key", "col2": "key", "rule": "exact"}],
+    "fuzzy": [{"col1": "key_part", "col2": "key", "rule": "fuzzy"}],
+    "multi": [{"col1": "key", "col2": "key", "rule": "exact"},
+              {"col1": "region", "col2": "region", "rule": "exact"}],
+    "multi_fuzzy": [{"col1": "key_part", "col2": "key", "rule": "fuzzy"},
+                    {"col1": "region", "col2": "region", "rule": "exact"}],
+}
+
+
+def random_strings(rng: np.random.Generator, n: int, length: int, chinese_ratio: float) -> np.ndarray:
+    """n 个长度为 length 的随机字符串，每个字符以 chinese_ratio 的概率取自常用汉字"""
+    chinese = rng.random((n, length)) < chinese_ratio
+    chars = np.where(chinese, rng.choice(CHINESE_CHARS, (n, length)), rng.choice(ASCII_CHARS, (n, length)))
+    return np.array(["".join(row) for row in chars], dtype=object)
+
+
+def generate_tables(rows: int, ref_rows: int, cardinality: int, dup_rate: float, key_length: int,
+                    chinese_ratio: float, hit_rate: float = 0.8, seed: int = 0) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """生成表1（rows 行）与表2（ref_rows 行）
+
+    表2的 key 共 cardinality 个不同取值，其中 dup_rate 比例的行重复已有取值；
+    表1的 key 以 hit_rate 的概率取自表2取值（其余为表2中不存在的新值），key 的重复程度由 rows/cardinality 决定。
+    """
+    rng = np.random.default_rng(seed)
+    cardinality = max(1, min(cardinality, ref_rows))
+    # 多生成一些用于表1未命中的值；去重保证表2恰有 cardinality 个取值
+    vocab = pd.unique(random_strings(rng, cardinality * 2 + 16, key_length, chinese_ratio))
+    ref_vocab, miss_vocab = vocab[:cardinality], vocab[cardinality:]
+
+    unique_rows = max(cardinality, int(round(ref_rows * (1 - dup_rate))))
+    ref_keys = np.concatenate([ref_vocab, rng.choice(ref_vocab, max(ref_rows - unique_rows, 0))])
+    ref_keys = ref_keys[rng.permutation(len(ref_keys))][:ref_rows]
+    df2 = pd.DataFrame({
+        "key": ref_keys,
+        "region": rng.choice(REGIONS, len(ref_keys)),
+        "value": rng.normal(size=len(ref_keys)).round(4),
+        "label": random_strings(rng, len(ref_keys), 6, chinese_ratio),
+    })
+
+    hit = rng.random(rows) < hit_rate
+    keys1 = np.where(hit, rng.choice(ref_vocab, rows), rng.choice(miss_vocab, rows)).astype(object)
+    df1 = pd.DataFrame({
+        "id": np.arange(1, rows + 1),
+        "key": keys1,
+        "key_part": np.array([k[1:] if len(k) > 2 else k for k in keys1], dtype=object),
+        "region": rng.choice(REGIONS, rows),
+        "amount": rng.integers(0, 10000, rows),
+    })
+    return df1, df2
+
+
+def write_input(df: pd.DataFrame, path: str):
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".parquet":
+        df.to_parquet(path, index=False)
+    elif ext == ".csv":
+        df.to_csv(path, index=False, encoding="utf-8-sig")
+    else:
+        df.to_excel(path, index=False)
+
+
+def run_case(file1: str, file2: str, output: str, match_pairs: List[Dict], options: Dict) -> Dict:
+    """端到端运行一次合并（清空表格缓存，读取阶段包含文件解析），返回耗时与各阶段耗时"""
+    TABLE_CACHE.clear()
+    progress_queue, log_queue = Queue(), Queue()
+    start = time.perf_counter()
+    process_merge(file1, file2, output, match_pairs, ["value", "label"], progress_queue, log_queue,
+                  **options)
+    seconds = time.perf_counter() - start
+    messages = list(progress_queue.queue)
+    errors = [msg["msg"] for msg in messages if msg["type"] == "error"]
+    if errors:
+        raise RuntimeError(errors[0])
+    phases = next((msg["seconds"] for msg in messages if msg["type"] == "phases"), {})
+    return {"seconds": round(seconds, 4), "phases": {name: round(sec, 4) for name, sec in phases.items()}}
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(__file__),
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return None
+
+
+def run_benchmarks(args) -> List[Dict]:
+    fmt = args.format or ("parquet" if HAS_PYARROW else "csv")
+    options = {"workers": args.workers, "low_memory": True, "reuse_index": False, "log_level": "summary",
+               "merge_mode": args.merge_mode}
+    work_dir = tempfile.mkdtemp(prefix="merge_bench_")
+    results = []
+    try:
+        for rows in args.rows:
+            ref_rows = args.ref_rows or max(rows // 10, 1)
+            cardinality = args.cardinality or max(int(ref_rows * (1 - args.dup_rate)), 1)
+            params = {"rows": rows, "ref_rows": ref_rows, "cardinality": cardinality, "dup_rate": args.dup_rate,
+                      "key_length": args.key_length, "chinese_ratio": args.chinese_ratio, "hit_rate": args.hit_rate,
+                      "format": fmt, "seed": args.seed}
+            start = time.perf_counter()
+            df1, df2 = generate_tables(rows, ref_rows, cardinality, args.dup_rate, args.key_length,
+                                       args.chinese_ratio, args.hit_rate, args.seed)
+            file1 = os.path.join(work_dir, f"table1.{fmt}")
+            file2 = os.path.join(work_dir, f"table2.{fmt}")
+            write_input(df1, file1)
+            write_input(df2, file2)
+            del df1, df2
+            print(f"生成数据：表1 {rows}行，表2 {ref_rows}行（{cardinality}个不同键），"
+                  f"耗时{time.perf_counter() - start:.1f}秒", flush=True)
+
+            for scenario in args.scenarios:
+                output = os.path.join(work_dir, f"out_{scenario}.{args.output_format}")
+                for repeat in range(args.repeat):
+                    timing = run_case(file1, file2, output, SCENARIOS[scenario], options)
+                    result = {
+                        "label": args.label, "commit": git_commit(), "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+                        "python": platform.python_version(), "pandas": pd.__version__, "cpu_count": os.cpu_count(),
+                        "scenario": scenario, "repeat": repeat, **params, "options": options,
+                        "output_format": args.output_format, **timing,
+                        "rows_per_sec": round(rows / timing["seconds"], 1) if timing["seconds"] else None,
+                    }
+                    results.append(result)
+                    phases = "，".join(f"{PHASES.get(k, k)}{v:.2f}" for k, v in timing["phases"].items())
+                    print(f"  {scenario:<12}{rows:>10}行  {timing['seconds']:8.2f}秒  "
+                          f"{result['rows_per_sec']:>12,.0f}行/秒  （{phases}）", flush=True)
+    finally:
+        TABLE_CACHE.clear()
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return results
+
+
+def save_results(results: List[Dict], path: str):
+    with open(path, "a", encoding="utf-8") as f:
+        for result in results:
+            f.write(json.dumps(result, ensure_ascii=False) + "\n")
+
+
+def compare(path: str, labels: Optional[List[str]] = None):
+    """按（场景, 行数）列出各版本标签的最短耗时，与第一个标签相比的倍数"""
+    if not os.path.exists(path):
+        print(f"没有基准结果：{path}")
+        return
+    best: Dict[Tuple[str, int], Dict[str, float]] = defaultdict(dict)
+    order: List[str] = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            result = json.loads(line)
+            label = result.get("label") or result.get("commit") or "?"
+            if labels and label not in labels:
+                continue
+            if label not in order:
+                order.append(label)
+            key = (result["scenario"], result["rows"])
+            best[key][label] = min(best[key].get(label, float("inf")), result["seconds"])
+    order = [label for label in (labels or order) if label in order]
+    if not order:
+        print("没有符合条件的基准结果")
+        return
+    print(f"{'场景':<14}{'行数':>10}" + "".join(f"{label:>16}" for label in order))
+    for (scenario, rows), by_label in sorted(best.items()):
+        base = by_label.get(order[0])
+        cells = []
+        for label in order:
+            sec = by_label.get(label)
+            if sec is None:
+                cells.append(f"{'-':>16}")
+            elif base and label != order[0]:
+                cells.append(f"{f'{sec:.2f}s({sec / base:.2f}x)':>16}")
+            else:
+                cells.append(f"{f'{sec:.2f}s':>16}")
+        print(f"{scenario:<14}{rows:>10}" + "".join(cells))
+
+
+def _int_list(text: str) -> List[int]:
+    return [int(float(x)) for x in text.split(",") if x.strip()]
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="表格合并引擎性能基准")
+    parser.add_argument("--rows", type=_int_list, default=[10000, 100000], help="表1行数列表，如 10000,1e6,1e7")
+    parser.add_argument("--ref-rows", type=int, default=None, help="表2行数（默认为表1的1/10）")
+    parser.add_argument("--cardinality", type=int, default=None, help="表2键的不同取值数（默认由重复率推算）")
+    parser.add_argument("--dup-rate", type=float, default=0.1, help="表2中重复键的行比例")
+    parser.add_argument("--key-length", type=int, default=8, help="键的字符数")
+    parser.add_argument("--chinese-ratio", type=float, default=0.5, help="键中汉字的比例（其余为字母数字）")
+    parser.add_argument("--hit-rate", type=float, default=0.8, help="表1键在表2中存在的比例")
+    parser.add_argument("--scenarios", type=lambda s: s.split(","), default=["exact", "fuzzy", "multi"],
+                        help=f"场景列表，可选：{','.join(SCENARIOS)}")
+    parser.add_argument("--format", choices=["parquet", "csv", "xlsx"], default=None,
+                        help="输入文件格式（默认 parquet，未安装 pyarrow 时为 csv）")
+    parser.add_argument("--output-format", choices=["parquet", "csv", "xlsx"], default="csv", help="输出文件格式")
+    parser.add_argument("--merge-mode", default="first", help="合并方式：first/all/aggregate")
+    parser.add_argument("--workers", type=int, default=1, help="匹配进程数")
+    parser.add_argument("--repeat", type=int, default=1, help="每个场景重复次数（对比时取最短耗时）")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--label", default=None, help="版本标签（默认为 git 提交号）")
+    parser.add_argument("--results", default=RESULTS_FILE, help="结果文件（JSON Lines，追加写入）")
+    parser.add_argument("--compare", nargs="*", metavar="标签", default=None,
+                        help="不运行基准，按版本标签对比已保存的结果（不指定标签时对比全部）")
+    args = parser.parse_args(argv)
+
+    if args.compare is not None:
+        compare(args.results, args.compare or None)
+        return 0
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"未知的场景：{unknown}")
+    args.label = args.label or git_commit() or "local"
+    results = run_benchmarks(args)
+    save_results(results, args.results)
+    print(f"结果已追加至：{args.results}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
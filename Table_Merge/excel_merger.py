@@ -1,11 +1,52 @@
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk, font
-import pandas as pd
+import math
 import os
 import threading
-from queue import Queue  # 线程安全队列（替换多进程队列）
+from collections import deque
+from queue import Queue, Empty  # 线程安全队列（替换多进程队列）
 import time
-from typing import List, Dict
+from typing import List, Dict, Optional, Tuple
+from merge_engine import DEFAULT_SIMILARITY, MERGE_MODES, AGGREGATIONS, LOG_LEVELS
+from table_reader import FILE_TYPES, TABLE_CACHE, ALL_SHEETS, sheet_names
+from table_writer import OUTPUT_FORMATS, OUTPUT_FILE_TYPES
+from preview_grid import PreviewGrid
+from merge_runner import process_merge, explain_merge, estimate_merge, parse_rows
+
+QUEUE_POLL_MS = 100  # 界面每帧处理进度/日志队列的间隔（毫秒）
+LOG_VIEW_LINES = 500  # 日志窗口最多保留的行数，完整日志写入输出文件旁的日志文件
+LOG_SUFFIX = ".log"
+ETA_SMOOTHING_SECONDS = 10.0  # 吞吐量指数平滑的时间常数（秒）
+
+
+def format_duration(seconds: float) -> str:
+    """秒数格式化为 mm:ss（超过1小时为 h:mm:ss）"""
+    minutes, secs = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{secs:02d}" if hours else f"{minutes:02d}:{secs:02d}"
+
+
+class ThroughputMeter:
+    """由进度估计吞吐量与剩余时间：瞬时速率按时间间隔做指数平滑，避免每批行数与耗时波动导致跳动"""
+
+    def __init__(self, smoothing_seconds: float = ETA_SMOOTHING_SECONDS):
+        self.smoothing_seconds = smoothing_seconds
+        self.rate: Optional[float] = None  # 平滑后的行/秒
+        self._last: Optional[Tuple[float, int]] = None  # 上次更新的（时间, 已处理行数）
+
+    def update(self, processed: int, total: int, now: Optional[float] = None) -> Dict:
+        """返回 {"rows_per_sec", "eta_seconds"}（尚无法估计时为 None）"""
+        now = time.monotonic() if now is None else now
+        if self._last is None or processed < self._last[1]:
+            self._last = (now, processed)
+        elif now > self._last[0]:
+            elapsed = now - self._last[0]
+            instant = (processed - self._last[1]) / elapsed
+            weight = 1 - math.exp(-elapsed / self.smoothing_seconds)
+            self.rate = instant if self.rate is None else self.rate + weight * (instant - self.rate)
+            self._last = (now, processed)
+        eta = (total - processed) / self.rate if self.rate else None
+        return {"rows_per_sec": self.rate, "eta_seconds": eta}
 
 
 class ExcelMergerPro:
@@ -23,6 +64,18 @@ class ExcelMergerPro:
         self.file1_path = tk.StringVar()
         self.file2_path = tk.StringVar()
         self.output_path = tk.StringVar(value="合并结果.xlsx")
+        self.workers_var = tk.IntVar(value=1)  # 匹配进程数
+        self.low_memory_var = tk.BooleanVar(value=True)  # 低内存模式
+        self.output_format_var = tk.StringVar(value="xlsx")  # 输出格式
+        self.out_of_core_var = tk.BooleanVar(value=False)  # 外存连接模式
+        self.reuse_index_var = tk.BooleanVar(value=True)  # 表2索引持久化复用
+        self.incremental_var = tk.BooleanVar(value=False)  # 增量合并
+        self.merge_mode_var = tk.StringVar(value=MERGE_MODES["first"])  # 多行匹配时的合并方式
+        self.aggregation_var = tk.StringVar(value=AGGREGATIONS["first"])  # 聚合方式下各合并列的聚合函数
+        self.log_level_var = tk.StringVar(value=LOG_LEVELS["sample"])  # 逐行日志级别
+        self.explain_rows_var = tk.StringVar()  # 需解释匹配过程的表1行号
+        self.sheets = {1: 0, 2: 0}  # 各文件的工作表选择：序号/名称、名称元组（多个）或 ALL_SHEETS
+        self.sheet_labels = {1: tk.StringVar(value=self._sheet_desc(0)), 2: tk.StringVar(value=self._sheet_desc(0))}
         self.df1 = None  # 预览用
         self.df2 = None  # 预览用
         self.selected_cols = []
@@ -30,19 +83,23 @@ class ExcelMergerPro:
         self.start_time = 0
         self.total_rows = 0
         self.processed_rows = 0
+        self.meter = ThroughputMeter()
 
         # 线程间通信（用queue替代multiprocessing.Queue）
         self.progress_queue = Queue()
-        self.control_queue = Queue()
         self.log_queue = Queue()
+        self.cancel_event = threading.Event()  # 取消事件：界面只置位，合并线程在匹配内核中检查
         self.merge_thread = None  # 合并线程（原进程）
+        self.log_spool = None  # 本次合并的完整日志文件
 
         # 匹配配置
         self.match_pairs: List[Dict] = []
 
         self.create_widgets()
-        self.start_progress_listener()
-        self.start_log_listener()
+        # 界面定时任务的 after 编号，窗口关闭时取消
+        self.poll_job = self.root.after(QUEUE_POLL_MS, self._pump_queues)
+        self.status_job = None
+        self.root.bind("<Destroy>", self._on_destroy, add="+")
 
     def create_widgets(self):
         # 主滚动区域
@@ -72,22 +129,26 @@ class ExcelMergerPro:
         file_frame.pack(fill=tk.X, padx=20, pady=5)
 
         # 第一个文件
-        tk.Label(file_frame, text="第一个Excel文件：", font=self.font).grid(row=0, column=0, padx=5, pady=5, sticky=tk.W)
+        tk.Label(file_frame, text="第一个表格文件：", font=self.font).grid(row=0, column=0, padx=5, pady=5, sticky=tk.W)
         tk.Entry(file_frame, textvariable=self.file1_path, width=60, font=self.font).grid(row=0, column=1, padx=5,
                                                                                           pady=5)
         tk.Button(file_frame, text="浏览", command=self.browse_file1, font=self.font).grid(row=0, column=2, padx=5,
                                                                                            pady=5)
         tk.Button(file_frame, text="预览", command=self.preview_file1, font=self.small_font).grid(row=0, column=3,
                                                                                                   padx=2, pady=5)
+        tk.Button(file_frame, textvariable=self.sheet_labels[1], command=lambda: self.choose_sheets(1),
+                  font=self.small_font).grid(row=0, column=4, padx=2, pady=5, sticky=tk.W)
 
         # 第二个文件
-        tk.Label(file_frame, text="第二个Excel文件：", font=self.font).grid(row=1, column=0, padx=5, pady=5, sticky=tk.W)
+        tk.Label(file_frame, text="第二个表格文件：", font=self.font).grid(row=1, column=0, padx=5, pady=5, sticky=tk.W)
         tk.Entry(file_frame, textvariable=self.file2_path, width=60, font=self.font).grid(row=1, column=1, padx=5,
                                                                                           pady=5)
         tk.Button(file_frame, text="浏览", command=self.browse_file2, font=self.font).grid(row=1, column=2, padx=5,
                                                                                            pady=5)
         tk.Button(file_frame, text="预览", command=self.preview_file2, font=self.small_font).grid(row=1, column=3,
                                                                                                   padx=2, pady=5)
+        tk.Button(file_frame, textvariable=self.sheet_labels[2], command=lambda: self.choose_sheets(2),
+                  font=self.small_font).grid(row=1, column=4, padx=2, pady=5, sticky=tk.W)
 
         # 输出文件
         tk.Label(file_frame, text="输出文件路径：", font=self.font).grid(row=2, column=0, padx=5, pady=5, sticky=tk.W)
@@ -96,6 +157,46 @@ class ExcelMergerPro:
         tk.Button(file_frame, text="选择路径", command=self.browse_output, font=self.font).grid(row=2, column=2, padx=5,
                                                                                                 pady=5)
 
+        # 运行选项：并行进程数（1为单线程逐行匹配）、低内存模式
+        tk.Label(file_frame, text="运行选项：", font=self.font).grid(row=3, column=0, padx=5, pady=5, sticky=tk.W)
+        option_frame = tk.Frame(file_frame)
+        option_frame.grid(row=3, column=1, padx=5, pady=5, sticky=tk.W)
+        tk.Label(option_frame, text="并行进程数", font=self.small_font).pack(side=tk.LEFT)
+        tk.Spinbox(option_frame, from_=1, to=os.cpu_count() or 1, textvariable=self.workers_var, width=5,
+                   font=self.font, state="readonly").pack(side=tk.LEFT, padx=5)
+        tk.Checkbutton(option_frame, text="低内存模式（表2仅读取所需列）", variable=self.low_memory_var,
+                       font=self.small_font).pack(side=tk.LEFT, padx=10)
+        tk.Label(option_frame, text="输出格式", font=self.small_font).pack(side=tk.LEFT)
+        format_combo = ttk.Combobox(option_frame, textvariable=self.output_format_var, values=list(OUTPUT_FORMATS),
+                                    width=8, font=self.small_font, state="readonly")
+        format_combo.pack(side=tk.LEFT, padx=5)
+        format_combo.bind("<<ComboboxSelected>>", self.on_output_format_change)
+        tk.Checkbutton(option_frame, text="外存模式（超大表，仅完全相同/行政区名规则）", variable=self.out_of_core_var,
+                       font=self.small_font).pack(side=tk.LEFT, padx=10)
+        tk.Checkbutton(option_frame, text="复用表2索引", variable=self.reuse_index_var,
+                       font=self.small_font).pack(side=tk.LEFT, padx=10)
+        tk.Checkbutton(option_frame, text="增量合并（仅重新匹配变化行）", variable=self.incremental_var,
+                       font=self.small_font).pack(side=tk.LEFT, padx=10)
+
+        # 合并方式：表2多行同时满足条件时取首行、全部展开或按列聚合
+        tk.Label(file_frame, text="合并方式：", font=self.font).grid(row=4, column=0, padx=5, pady=5, sticky=tk.W)
+        mode_frame = tk.Frame(file_frame)
+        mode_frame.grid(row=4, column=1, padx=5, pady=5, sticky=tk.W)
+        ttk.Combobox(mode_frame, textvariable=self.merge_mode_var, values=list(MERGE_MODES.values()), width=14,
+                     font=self.small_font, state="readonly").pack(side=tk.LEFT, padx=5)
+        tk.Label(mode_frame, text="聚合函数（聚合方式下用于所有合并列）", font=self.small_font).pack(side=tk.LEFT)
+        ttk.Combobox(mode_frame, textvariable=self.aggregation_var, values=list(AGGREGATIONS.values()), width=8,
+                     font=self.small_font, state="readonly").pack(side=tk.LEFT, padx=5)
+        # 逐行日志级别（仅汇总时匹配最快）；指定行号可单独查看其匹配过程
+        tk.Label(mode_frame, text="逐行日志", font=self.small_font).pack(side=tk.LEFT, padx=(10, 0))
+        ttk.Combobox(mode_frame, textvariable=self.log_level_var, values=list(LOG_LEVELS.values()), width=10,
+                     font=self.small_font, state="readonly").pack(side=tk.LEFT, padx=5)
+        tk.Label(mode_frame, text="表1行号", font=self.small_font).pack(side=tk.LEFT, padx=(10, 0))
+        tk.Entry(mode_frame, textvariable=self.explain_rows_var, width=14, font=self.small_font).pack(side=tk.LEFT,
+                                                                                                        padx=5)
+        self.explain_btn = tk.Button(mode_frame, text="解释匹配", command=self.start_explain, font=self.small_font)
+        self.explain_btn.pack(side=tk.LEFT)
+
         # 匹配设置区域
         match_frame = tk.LabelFrame(scrollable_frame, text="匹配规则设置（所有条件必须同时满足）", font=self.font)
         match_frame.pack(fill=tk.X, padx=20, pady=10)
@@ -173,6 +274,10 @@ class ExcelMergerPro:
                                  font=("SimHei", 12, "bold"), width=15, bg="#2196F3", fg="white")
         self.run_btn.pack(side=tk.LEFT, padx=10)
 
+        self.dry_run_btn = tk.Button(btn_frame, text="试运行", command=self.start_dry_run,
+                                     font=("SimHei", 12), width=15, bg="#4CAF50", fg="white")
+        self.dry_run_btn.pack(side=tk.LEFT, padx=10)
+
         self.cancel_btn = tk.Button(btn_frame, text="取消", command=self.cancel_merge,
                                     font=("SimHei", 12), width=15, bg="#ff9800", fg="white", state=tk.DISABLED)
         self.cancel_btn.pack(side=tk.LEFT, padx=10)
@@ -212,8 +317,15 @@ class ExcelMergerPro:
         tk.Label(rule_frame, text="规则：", font=self.small_font).pack(side=tk.LEFT)
         tk.Radiobutton(rule_frame, text="完全相同", variable=rule_var, value="exact", font=("SimHei", 8)).pack(
             side=tk.LEFT)
+        tk.Radiobutton(rule_frame, text="行政区名", variable=rule_var, value="admin_name", font=("SimHei", 8)).pack(
+            side=tk.LEFT)
         tk.Radiobutton(rule_frame, text="模糊匹配", variable=rule_var, value="fuzzy", font=("SimHei", 8)).pack(
             side=tk.LEFT)
+        tk.Radiobutton(rule_frame, text="相似度≥", variable=rule_var, value="similarity", font=("SimHei", 8)).pack(
+            side=tk.LEFT)
+        threshold_var = tk.DoubleVar(value=DEFAULT_SIMILARITY)
+        tk.Spinbox(rule_frame, from_=0.5, to=1.0, increment=0.05, textvariable=threshold_var, width=5,
+                   font=("SimHei", 8), state="readonly").pack(side=tk.LEFT)
         rule_frame.pack(side=tk.LEFT, padx=5)
 
         # 删除按钮
@@ -233,6 +345,7 @@ class ExcelMergerPro:
             "col2_var": col2_var,
             "col2_combo": col2_combo,
             "rule_var": rule_var,
+            "threshold_var": threshold_var,
             "frame": pair_frame
         })
 
@@ -256,30 +369,116 @@ class ExcelMergerPro:
                     pair["col2_var"].set(cols2[0])
 
     def browse_file1(self):
-        path = filedialog.askopenfilename(filetypes=[("Excel文件", "*.xlsx;*.xls")])
+        path = filedialog.askopenfilename(filetypes=FILE_TYPES)
         if path:
             self.file1_path.set(path)
+            self._set_sheet(1, 0)
             self.load_file_info(path, 1)
 
     def browse_file2(self):
-        path = filedialog.askopenfilename(filetypes=[("Excel文件", "*.xlsx;*.xls")])
+        path = filedialog.askopenfilename(filetypes=FILE_TYPES)
         if path:
             self.file2_path.set(path)
+            self._set_sheet(2, 0)
             self.load_file_info(path, 2)
 
     def browse_output(self):
-        path = filedialog.asksaveasfilename(defaultextension=".xlsx", filetypes=[("Excel文件", "*.xlsx")])
+        fmt = self.output_format_var.get()
+        filetypes = sorted(OUTPUT_FILE_TYPES, key=lambda item: item[1] != f"*{OUTPUT_FORMATS[fmt]}")
+        path = filedialog.asksaveasfilename(defaultextension=OUTPUT_FORMATS[fmt], filetypes=filetypes)
         if path:
             self.output_path.set(path)
 
+    def on_output_format_change(self, event=None):
+        """切换输出格式时同步修改输出文件扩展名"""
+        path = self.output_path.get()
+        if path:
+            self.output_path.set(os.path.splitext(path)[0] + OUTPUT_FORMATS[self.output_format_var.get()])
+
+    @staticmethod
+    def _sheet_desc(sheet):
+        if sheet == ALL_SHEETS:
+            return "工作表：全部"
+        if isinstance(sheet, tuple):
+            return f"工作表：{len(sheet)}个"
+        return "工作表：第1个" if sheet == 0 else f"工作表：{sheet}"
+
+    def _set_sheet(self, file_num, sheet):
+        self.sheets[file_num] = sheet
+        self.sheet_labels[file_num].set(self._sheet_desc(sheet))
+
+    def choose_sheets(self, file_num):
+        """选择工作表：单个、多个（纵向拼接）或全部，拼接时增加来源工作表列"""
+        path = (self.file1_path if file_num == 1 else self.file2_path).get()
+        if not path or not os.path.exists(path):
+            messagebox.showinfo("提示", "请先选择有效的文件")
+            return
+        try:
+            names = sheet_names(path)
+        except Exception as e:
+            messagebox.showerror("错误", f"读取工作表失败：{str(e)}")
+            return
+        if not names:
+            messagebox.showinfo("提示", "只有 Excel 文件可以选择工作表")
+            return
+
+        dialog = tk.Toplevel(self.root)
+        dialog.title(f"文件{file_num}：选择工作表")
+        dialog.transient(self.root)
+        tk.Label(dialog, text="可多选，多个工作表将纵向拼接并增加“来源工作表”列", font=self.small_font).pack(padx=10,
+                                                                                                   pady=5)
+        listbox = tk.Listbox(dialog, selectmode=tk.MULTIPLE, height=min(len(names), 15), exportselection=False,
+                             font=self.small_font)
+        listbox.pack(fill=tk.BOTH, expand=True, padx=10)
+        for name in names:
+            listbox.insert(tk.END, name)
+        current = self.sheets[file_num]
+        selected = names if current == ALL_SHEETS else [current] if isinstance(current, str) else \
+            list(current) if isinstance(current, tuple) else [names[current]]
+        for i, name in enumerate(names):
+            if name in selected:
+                listbox.selection_set(i)
+        all_var = tk.BooleanVar(value=current == ALL_SHEETS)
+        tk.Checkbutton(dialog, text="全部工作表（包括以后新增的工作表）", variable=all_var,
+                       font=self.small_font).pack(anchor=tk.W, padx=10)
+
+        def confirm():
+            chosen = tuple(names[i] for i in listbox.curselection())
+            if all_var.get():
+                sheet = ALL_SHEETS
+            elif not chosen:
+                messagebox.showerror("错误", "请至少选择一个工作表", parent=dialog)
+                return
+            else:
+                sheet = chosen[0] if len(chosen) == 1 else chosen
+            dialog.destroy()
+            self._set_sheet(file_num, sheet)
+            self.load_file_info(path, file_num)
+
+        btns = tk.Frame(dialog)
+        btns.pack(pady=8)
+        tk.Button(btns, text="确定", command=confirm, font=self.small_font, width=8).pack(side=tk.LEFT, padx=5)
+        tk.Button(btns, text="取消", command=dialog.destroy, font=self.small_font, width=8).pack(side=tk.LEFT, padx=5)
+
     def load_file_info(self, path, file_num):
+        info_widget = self.info1 if file_num == 1 else self.info2
+        self._update_text(info_widget, f"正在解析：{os.path.basename(path)}...")
+        sheet = self.sheets[file_num]
+
         def load_info():
             try:
-                df = pd.read_excel(path, nrows=100)
+                # 整表只解析一次并放入会话缓存，预览与合并直接复用（多个工作表并行解析）；
+                # 低内存模式下表2只读取前几行，合并时再按所需列解析，避免整表常驻内存
+                if file_num == 2 and self.low_memory_var.get():
+                    df = TABLE_CACHE.peek(path, 100, sheet)
+                else:
+                    df = TABLE_CACHE.head(path, 100, sheet)
                 info = f"文件名：{os.path.basename(path)}\n"
                 info += f"路径：{path}\n"
+                if sheet != 0:
+                    info += f"{self._sheet_desc(sheet)}\n"
                 info += f"列数：{len(df.columns)}\n"
-                total_rows = pd.read_excel(path, usecols=[0]).shape[0]
+                total_rows = TABLE_CACHE.row_count(path, sheet)
                 info += f"行数：{total_rows}\n"
                 info += "列名：\n"
                 for i, col in enumerate(df.columns[:5]):
@@ -327,28 +526,30 @@ class ExcelMergerPro:
         text_widget.insert(tk.END, content)
         text_widget.config(state=tk.DISABLED)
 
-    def _append_log(self, content):
+    def _append_logs(self, messages):
+        """一次插入一批日志，只保留最后 LOG_VIEW_LINES 行"""
         self.log_text.config(state=tk.NORMAL)
-        if int(self.log_text.index('end-1c').split('.')[0]) > 100:
-            self.log_text.delete(1.0, 2.0)
-        self.log_text.insert(tk.END, content + "\n")
+        self.log_text.insert(tk.END, "\n".join(messages) + "\n")
+        lines = int(self.log_text.index('end-1c').split('.')[0])
+        if lines > LOG_VIEW_LINES:
+            self.log_text.delete(1.0, f"{lines - LOG_VIEW_LINES + 1}.0")
         self.log_text.see(tk.END)
         self.log_text.config(state=tk.DISABLED)
 
     def preview_file1(self):
-        self._preview_file(self.file1_path.get(), "文件1预览")
+        self._preview_file(self.file1_path.get(), "文件1预览", self.sheets[1])
 
     def preview_file2(self):
-        self._preview_file(self.file2_path.get(), "文件2预览")
+        self._preview_file(self.file2_path.get(), "文件2预览", self.sheets[2])
 
-    def _preview_file(self, path, title):
+    def _preview_file(self, path, title, sheet=0):
         if not path or not os.path.exists(path):
             messagebox.showinfo("提示", "请先选择有效的文件")
             return
 
         def load_preview():
             try:
-                df = pd.read_excel(path, nrows=50)
+                df = TABLE_CACHE.get(path, sheet)
                 self.root.after(0, lambda: self._create_preview_window(df, title))
             except Exception as e:
                 self.root.after(0, lambda err=str(e): messagebox.showerror("错误", f"预览失败：{err}"))
@@ -358,34 +559,19 @@ class ExcelMergerPro:
     def _create_preview_window(self, df, title):
         preview_window = tk.Toplevel(self.root)
         preview_window.title(title)
-        preview_window.geometry("800x500")
-
-        tree = ttk.Treeview(preview_window, show="headings")
-        columns = list(df.columns[:10])
-        tree["columns"] = columns
-
-        for col in columns:
-            tree.heading(col, text=str(col))
-            tree.column(col, width=100, anchor=tk.CENTER)
-
-        for i, row in df.iterrows():
-            values = [str(row[col]) if pd.notna(row[col]) else "" for col in columns]
-            tree.insert("", tk.END, values=values)
-
-        tree.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
-
-        vscrollbar = ttk.Scrollbar(tree, orient="vertical", command=tree.yview)
-        tree.configure(yscroll=vscrollbar.set)
-        vscrollbar.pack(side=tk.RIGHT, fill=tk.Y)
-
-        hscrollbar = ttk.Scrollbar(preview_window, orient="horizontal", command=tree.xview)
-        tree.configure(xscroll=hscrollbar.set)
-        hscrollbar.pack(fill=tk.X, padx=10)
+        preview_window.geometry("900x550")
+        # 只渲染可见行，支持滚动浏览整表、点击列标题排序与按列筛选
+        PreviewGrid(preview_window, df, font=self.small_font).pack(fill=tk.BOTH, expand=True)
 
     def clear_selection(self):
         self.file1_path.set("")
         self.file2_path.set("")
         self.output_path.set("合并结果.xlsx")
+        self.output_format_var.set("xlsx")
+        self.merge_mode_var.set(MERGE_MODES["first"])
+        self.aggregation_var.set(AGGREGATIONS["first"])
+        self.log_level_var.set(LOG_LEVELS["sample"])
+        self.explain_rows_var.set("")
         self._update_text(self.info1, "")
         self._update_text(self.info2, "")
         self._update_text(self.log_text, "")
@@ -400,6 +586,7 @@ class ExcelMergerPro:
             self.match_pairs[0]["col1_var"].set("")
             self.match_pairs[0]["col2_var"].set("")
             self.match_pairs[0]["rule_var"].set("fuzzy")
+            self.match_pairs[0]["threshold_var"].set(DEFAULT_SIMILARITY)
             self.match_pairs[0]["col1_combo"]["state"] = "disabled"
             self.match_pairs[0]["col2_combo"]["state"] = "disabled"
 
@@ -409,51 +596,177 @@ class ExcelMergerPro:
         self.df1 = None
         self.df2 = None
         self.selected_cols = []
+        self._set_sheet(1, 0)
+        self._set_sheet(2, 0)
+
+    def _pump_queues(self):
+        """由界面主循环定时调用：处理队列中积压的全部消息后重新排程"""
+        try:
+            self._drain_queues()
+        finally:
+            self.poll_job = self.root.after(QUEUE_POLL_MS, self._pump_queues)
+
+    def _on_destroy(self, event):
+        """窗口关闭：取消定时任务；合并进行中则发出取消信号（合并线程写出已完成部分、保存断点后退出）"""
+        if event.widget is not self.root:  # 子控件销毁同样触发窗口的 <Destroy> 绑定
+            return
+        for job in (self.poll_job, self.status_job):
+            if job is not None:
+                self.root.after_cancel(job)
+        self.poll_job = self.status_job = None
+        if self.is_running:
+            self.cancel_event.set()
+            self.is_running = False
+        self._close_log_spool()
 
-    def start_progress_listener(self):
-        def listen():
-            while True:
-                try:
-                    time.sleep(0.2)
-                    if not self.is_running:
-                        continue
-
-                    if not self.progress_queue.empty():
-                        msg = self.progress_queue.get()
-                        if msg["type"] == "progress":
-                            self.processed_rows = msg["processed"]
-                            self.total_rows = msg["total"]
-
-                            if self.total_rows > 0:
-                                progress = 20 + int(70 * self.processed_rows / self.total_rows)
-                                self.root.after(0, lambda p=progress: self.progress.configure(value=p))
-                                self.root.after(0, lambda: self.status_var.set(
-                                    f"处理第{self.processed_rows}/{self.total_rows}行..."
-                                ))
-
-                        elapsed = time.time() - self.start_time
-                        minutes = int(elapsed // 60)
-                        seconds = int(elapsed % 60)
-                        self.root.after(0, lambda m=minutes, s=seconds: self.time_var.set(
-                            f"耗时：{m:02d}:{s:02d}"
-                        ))
-                except Exception:
-                    break
+    def _drain_queues(self):
+        """取出两个队列中的全部消息：日志整批写入日志文件与窗口，进度只应用最新一条"""
+        logs = deque(maxlen=LOG_VIEW_LINES)  # 一帧内消息过多时窗口只显示最后一部分
+        while True:
+            try:
+                log_msg = self.log_queue.get_nowait()
+            except Empty:
+                break
+            if self.log_spool is not None:
+                self.log_spool.write(log_msg + "\n")
+            logs.append(log_msg)
+        if logs:
+            if self.log_spool is not None:
+                self.log_spool.flush()
+            self._append_logs(logs)
+
+        progress = None
+        while True:
+            try:
+                msg = self.progress_queue.get_nowait()
+            except Empty:
+                break
+            if msg["type"] == "progress":
+                progress = msg
+        if not self.is_running:
+            return
+        if progress is not None:
+            self.processed_rows = progress["processed"]
+            self.total_rows = progress["total"]
+            if self.total_rows > 0:
+                self.progress.configure(value=20 + int(70 * self.processed_rows / self.total_rows))
+                status = f"处理第{self.processed_rows}/{self.total_rows}行"
+                # 吞吐量与剩余时间按进度平滑估计（见 ThroughputMeter）
+                speed = self.meter.update(self.processed_rows, self.total_rows)
+                if speed["eta_seconds"] is not None:
+                    status += (f"，{speed['rows_per_sec']:,.0f}行/秒，"
+                               f"预计剩余{format_duration(speed['eta_seconds'])}")
+                self.status_var.set(status + "...")
+
+        elapsed = time.time() - self.start_time
+        minutes = int(elapsed // 60)
+        seconds = int(elapsed % 60)
+        self.time_var.set(f"耗时：{minutes:02d}:{seconds:02d}")
+
+    def _open_log_spool(self, output):
+        """在输出文件旁保存本次合并的完整日志，无法创建时只显示在窗口中"""
+        self._close_log_spool()
+        try:
+            self.log_spool = open(output + LOG_SUFFIX, "w", encoding="utf-8")
+        except OSError:
+            return
+        self.log_queue.put(f"完整日志保存至：{output + LOG_SUFFIX}")
 
-        threading.Thread(target=listen, daemon=True).start()
+    def _close_log_spool(self):
+        if self.log_spool is not None:
+            self.log_spool.close()
+            self.log_spool = None
 
-    def start_log_listener(self):
-        def listen():
-            while True:
-                try:
-                    time.sleep(0.1)
-                    if not self.log_queue.empty():
-                        log_msg = self.log_queue.get()
-                        self.root.after(0, lambda msg=log_msg: self._append_log(msg))
-                except Exception:
-                    break
+    def _collect_pairs(self):
+        """读取界面上的匹配对设置，未完整选择时提示并返回 None"""
+        valid_pairs = []
+        for i, pair in enumerate(self.match_pairs, 1):
+            col1 = pair["col1_var"].get()
+            col2 = pair["col2_var"].get()
+            rule = pair["rule_var"].get()
+            if not col1 or not col2:
+                messagebox.showerror("错误", f"第{i}对匹配列未完整选择")
+                return None
+            pair_spec = {"col1": col1, "col2": col2, "rule": rule}
+            if rule == "similarity":
+                pair_spec["threshold"] = round(pair["threshold_var"].get(), 2)
+            valid_pairs.append(pair_spec)
+
+        if not valid_pairs:
+            messagebox.showerror("错误", "请至少添加一对匹配列")
+            return None
+        return valid_pairs
+
+    def start_dry_run(self):
+        """试运行：表1抽样与表2索引（优先使用已保存的索引）匹配，在日志中报告预计匹配率、多重匹配率与耗时"""
+        if self.is_running:
+            messagebox.showinfo("提示", "合并操作正在进行中，请稍后...")
+            return
+
+        file1 = self.file1_path.get()
+        file2 = self.file2_path.get()
+        if not (file1 and file2) or not os.path.exists(file1) or not os.path.exists(file2):
+            messagebox.showerror("错误", "请先选择两个存在的表格文件")
+            return
+        valid_pairs = self._collect_pairs()
+        if valid_pairs is None:
+            return
+
+        self.dry_run_btn.config(state=tk.DISABLED)
+        self.status_var.set("正在试运行...")
+        threading.Thread(target=self._dry_run, args=(file1, file2, valid_pairs), daemon=True).start()
+
+    def _dry_run(self, file1, file2, match_pairs):
+        try:
+            report = estimate_merge(file1, file2, match_pairs, self.low_memory_var.get(), self.reuse_index_var.get(),
+                                    self.sheets[1], self.sheets[2])
+            lines = [f"试运行：抽样{report['sample_rows']}/{report['total_rows']}行"]
+            sources = {"stored": "已保存索引", "full": "索引构建", "related": "索引构建（估计）",
+                       "sampled": "索引构建（估计）"}
+            for p in report["pairs"]:
+                lines.append(f"  匹配对{p['pair_idx']}（{p['col1']}→{p['col2']}，{p['rule']}）："
+                             f"匹配率{p['match_rate']:.1%}，多重匹配{p['ambiguity_rate']:.1%}，"
+                             f"空值{p['empty_rate']:.1%}，{sources[p['index_source']]}{p['index_seconds']:.2f}秒，"
+                             f"预计耗时{p['projected_seconds']:.2f}秒")
+            lines.append(f"  联合匹配：预计匹配率{report['match_rate']:.1%}，多重匹配{report['ambiguity_rate']:.1%}，"
+                         f"匹配阶段预计耗时{report['projected_seconds']:.1f}秒（不含读写文件）")
+            if report["ref_sample_rows"]:
+                lines.append(f"  提示：相似度索引仅用表2抽样{report['ref_sample_rows']}行构建，匹配率为下限估计")
+            self.log_queue.put("\n".join(lines))
+            status = f"试运行完成：预计匹配率{report['match_rate']:.1%}"
+        except Exception as e:
+            self.log_queue.put(f"错误：试运行失败：{str(e)}")
+            status = "试运行失败"
+        self.root.after(0, lambda: (self.status_var.set(status), self.dry_run_btn.config(state=tk.NORMAL)))
+
+    def start_explain(self):
+        """解释表1指定行的匹配过程（如 5,12,100-105），结果输出到日志"""
+        file1 = self.file1_path.get()
+        file2 = self.file2_path.get()
+        if not (file1 and file2) or not os.path.exists(file1) or not os.path.exists(file2):
+            messagebox.showerror("错误", "请先选择两个存在的表格文件")
+            return
+        try:
+            rows = parse_rows(self.explain_rows_var.get())
+        except ValueError:
+            messagebox.showerror("错误", "请输入表1行号，如 5,12,100-105")
+            return
+        valid_pairs = self._collect_pairs()
+        if valid_pairs is None:
+            return
 
-        threading.Thread(target=listen, daemon=True).start()
+        merge_mode = next(k for k, v in MERGE_MODES.items() if v == self.merge_mode_var.get())
+        self.explain_btn.config(state=tk.DISABLED)
+        threading.Thread(target=self._explain, args=(file1, file2, valid_pairs, rows, merge_mode), daemon=True).start()
+
+    def _explain(self, file1, file2, match_pairs, rows, merge_mode):
+        try:
+            for line in explain_merge(file1, file2, match_pairs, rows, merge_mode, self.low_memory_var.get(),
+                                      self.reuse_index_var.get(), sheet1=self.sheets[1], sheet2=self.sheets[2]):
+                self.log_queue.put(line)
+        except Exception as e:
+            self.log_queue.put(f"错误：解释匹配失败：{str(e)}")
+        self.root.after(0, lambda: self.explain_btn.config(state=tk.NORMAL))
 
     def start_merge_process(self):
         if self.is_running:
@@ -472,18 +785,8 @@ class ExcelMergerPro:
             messagebox.showerror("错误", "文件不存在")
             return
 
-        valid_pairs = []
-        for i, pair in enumerate(self.match_pairs, 1):
-            col1 = pair["col1_var"].get()
-            col2 = pair["col2_var"].get()
-            rule = pair["rule_var"].get()
-            if not col1 or not col2:
-                messagebox.showerror("错误", f"第{i}对匹配列未完整选择")
-                return
-            valid_pairs.append({"col1": col1, "col2": col2, "rule": rule})
-
-        if not valid_pairs:
-            messagebox.showerror("错误", "请至少添加一对匹配列")
+        valid_pairs = self._collect_pairs()
+        if valid_pairs is None:
             return
 
         self.selected_cols = [self.df2.columns[i] for i in self.col_listbox.curselection()]
@@ -491,49 +794,65 @@ class ExcelMergerPro:
             messagebox.showerror("错误", "请选择需要合并的列")
             return
 
+        merge_mode = next(k for k, v in MERGE_MODES.items() if v == self.merge_mode_var.get())
+        aggregation = next(k for k, v in AGGREGATIONS.items() if v == self.aggregation_var.get())
+        aggregations = {col: aggregation for col in self.selected_cols} if merge_mode == "aggregate" else None
+        log_level = next(k for k, v in LOG_LEVELS.items() if v == self.log_level_var.get())
+
         self._update_text(self.log_text, "")
+        self._open_log_spool(output)
 
         self.is_running = True
         self.start_time = time.time()
         self.processed_rows = 0
+        self.meter = ThroughputMeter()
         self.run_btn.config(state=tk.DISABLED)
         self.cancel_btn.config(state=tk.NORMAL)
         self.status_var.set("正在初始化处理线程...")
         self.time_var.set("耗时：00:00")
         self.progress["value"] = 5
 
-        # 使用多线程（替换多进程）
+        # 使用多线程（替换多进程）；每次合并使用新的取消事件
+        self.cancel_event = threading.Event()
         self.merge_thread = threading.Thread(
             target=process_merge,
-            args=(
-                file1, file2, output, valid_pairs, self.selected_cols,
-                self.progress_queue, self.control_queue, self.log_queue
-            ),
+            args=(file1, file2, output, valid_pairs, self.selected_cols, self.progress_queue, self.log_queue),
+            kwargs={
+                "workers": self.workers_var.get(),
+                "low_memory": self.low_memory_var.get(),
+                "out_of_core": self.out_of_core_var.get(),
+                "merge_mode": merge_mode,
+                "aggregations": aggregations,
+                "reuse_index": self.reuse_index_var.get(),
+                "incremental": self.incremental_var.get(),
+                "log_level": log_level,
+                "sheet1": self.sheets[1],
+                "sheet2": self.sheets[2],
+                "cancel_event": self.cancel_event,
+            },
             daemon=True  # 线程随主程序退出
         )
         self.merge_thread.start()
 
-        self.root.after(500, self.check_process_status)
+        self.status_job = self.root.after(500, self.check_process_status)
 
     def check_process_status(self):
         if not self.is_running:
             return
 
-        # 检查线程是否存活
+        # 检查线程是否存活（取消后同样等待线程写出已完成部分、保存断点后退出）
         if self.merge_thread.is_alive():
-            if not self.control_queue.empty():
-                cmd = self.control_queue.get()
-                if cmd == "cancel":
-                    # 线程无法强制终止，通过队列发送取消信号
-                    self.control_queue.put("cancel")
-                    self.is_running = False
-                    self.status_var.set("合并已取消")
-                    self.run_btn.config(state=tk.NORMAL)
-                    self.cancel_btn.config(state=tk.DISABLED)
-                    return
-            self.root.after(500, self.check_process_status)
+            self.status_job = self.root.after(500, self.check_process_status)
         else:
+            # 线程结束后先处理剩余日志，再关闭日志文件
+            self._drain_queues()
+            self._close_log_spool()
             self.is_running = False
+            if self.cancel_event.is_set():
+                self.status_var.set("合并已取消")
+                self.run_btn.config(state=tk.NORMAL)
+                self.cancel_btn.config(state=tk.DISABLED)
+                return
             self.progress["value"] = 100
             self.status_var.set("合并完成！")
             self.run_btn.config(state=tk.NORMAL)
@@ -555,157 +874,6 @@ class ExcelMergerPro:
             return
 
         if messagebox.askyesno("确认", "确定取消？"):
-            self.control_queue.put("cancel")  # 发送取消信号
+            self.cancel_event.set()  # 发送取消信号
             self.status_var.set("正在取消...")
             self.cancel_btn.config(state=tk.DISABLED)
-
-
-def process_merge(file1, file2, output, match_pairs, selected_cols, progress_queue, control_queue, log_queue):
-    """线程中的数据处理逻辑（多条件联合匹配）"""
-    try:
-        # 1. 读取数据
-        df1 = pd.read_excel(file1)
-        df2 = pd.read_excel(file2)
-        total_rows = len(df1)
-        if total_rows == 0 or len(df2) == 0:
-            raise ValueError("文件无数据")
-
-        log_queue.put(f"开始多条件联合匹配（共{len(match_pairs)}个匹配条件）")
-
-        # 2. 预处理匹配列并构建索引
-        match_indexes = []
-        for pair_idx, pair in enumerate(match_pairs, 1):
-            col1, col2, rule = pair["col1"], pair["col2"], pair["rule"]
-
-            # 处理表1列：清洗数据
-            df1_col = df1[col1].fillna("").astype(str).str.strip()
-            if rule == "fuzzy":
-                df1_col = df1_col.str.lower()
-
-            # 处理表2列：构建索引
-            df2_col = df2[col2].fillna("").astype(str).str.strip()
-            if rule == "fuzzy":
-                df2_col = df2_col.str.lower()
-
-            # 索引结构：{值: [行索引1, 行索引2, ...]}
-            index_data = {}
-            for idx, val in df2_col.items():
-                if val not in index_data:
-                    index_data[val] = []
-                index_data[val].append(idx)
-
-            log_queue.put(f"匹配对{pair_idx}（{col1}→{col2}，{rule}）：表2共{len(index_data)}个唯一值")
-
-            match_indexes.append({
-                "pair_idx": pair_idx,
-                "col1": col1,
-                "col2": col2,
-                "rule": rule,
-                "df1_col": df1_col,
-                "index_data": index_data,
-                "df2": df2
-            })
-
-        # 3. 准备合并列
-        target_cols = {col: f"{col}_from_file2" for col in selected_cols}
-        for col in target_cols.values():
-            df1[col] = None
-
-        # 4. 处理数据（核心：多条件联合匹配）
-        batch_size = 100
-        for i in range(0, total_rows, batch_size):
-            # 检查取消信号（线程必须主动响应）
-            if not control_queue.empty() and control_queue.get() == "cancel":
-                log_queue.put("合并已取消")
-                return
-
-            end = min(i + batch_size, total_rows)
-            for idx in range(i, end):
-                row_log = [f"行{idx + 1}：开始多条件匹配"]
-                all_matched = True
-                matched_sets = []  # 存储每个匹配对的匹配行索引集合
-
-                # 逐个匹配条件校验
-                for data in match_indexes:
-                    val1 = data["df1_col"].iloc[idx]
-                    row_log.append(f"  匹配对{data['pair_idx']}：'{val1}'（规则：{data['rule']}）")
-
-                    # 空值处理
-                    if not val1:
-                        all_matched = False
-                        row_log.append(f"  → 空值，不满足该条件")
-                        break
-
-                    # 完全相同规则
-                    if data["rule"] == "exact":
-                        if val1 in data["index_data"]:
-                            matched_indices = data["index_data"][val1]
-                            matched_sets.append(set(matched_indices))
-                            row_log.append(f"  → 满足，表2匹配行：{matched_indices[:3]}...（共{len(matched_indices)}行）")
-                        else:
-                            all_matched = False
-                            row_log.append(f"  → 不满足（无完全匹配值）")
-                            break
-
-                    # 模糊匹配规则
-                    else:
-                        matched_indices = []
-                        for val2, idx2_list in data["index_data"].items():
-                            if val1 in val2 or val2 in val1:
-                                matched_indices.extend(idx2_list)
-                        if matched_indices:
-                            matched_sets.append(set(matched_indices))
-                            row_log.append(f"  → 满足，表2匹配行：{matched_indices[:3]}...（共{len(matched_indices)}行）")
-                        else:
-                            all_matched = False
-                            row_log.append(f"  → 不满足（无模糊匹配值）")
-                            break
-
-                # 所有条件都满足后，计算交集
-                if all_matched and matched_sets:
-                    # 计算所有匹配对的行索引交集
-                    common_indices = matched_sets[0]
-                    for s in matched_sets[1:]:
-                        common_indices.intersection_update(s)
-
-                    if common_indices:
-                        # 取第一个共同匹配行
-                        selected_idx = sorted(common_indices)[0]
-                        matched_row = df2.iloc[selected_idx]
-
-                        # 合并数据
-                        for col in selected_cols:
-                            df1.at[idx, target_cols[col]] = matched_row[col]
-
-                        row_log.append(f"  → 所有条件均满足！合并表2行{selected_idx + 1}")
-                        if len(common_indices) > 1:
-                            row_log.append(f"  → 提示：存在{len(common_indices)}行同时满足所有条件，取第一行")
-                    else:
-                        all_matched = False
-                        row_log.append(f"  → 各条件匹配行无交集，不合并")
-
-                # 输出最终结果
-                if all_matched:
-                    row_log.append("  → 合并成功")
-                else:
-                    row_log.append("  → 未通过所有条件，不合并")
-
-                # 每10行输出一次日志
-                if idx % 10 == 0:
-                    log_queue.put("\n".join(row_log))
-
-            # 更新进度
-            progress_queue.put({
-                "type": "progress",
-                "processed": end,
-                "total": total_rows
-            })
-
-        # 5. 保存结果
-        df1 = df1.dropna(axis=1, how='all')
-        df1.to_excel(output, index=False)
-        log_queue.put(f"合并完成，共处理{total_rows}行（仅保留所有条件都满足的记录）")
-
-    except Exception as e:
-        log_queue.put(f"错误：{str(e)}")
-        progress_queue.put({"type": "error", "msg": str(e)})
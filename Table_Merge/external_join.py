@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""
+外存连接（表格大于内存时使用，仅支持完全相同/行政区名规则）
+- 表2分块读取，规范化键与待合并列写入磁盘上的 SQLite 表（键为主键，只保留首次出现的行）
+- 表1分块读取，每块写入临时探测表后与表2按键连接，结果按表1行序流式写出
+- 内存只与块大小和 SQLite 页缓存相关，与输入文件大小无关
+"""
+
+import os
+import shutil
+import sqlite3
+import tempfile
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from merge_engine import HASH_JOIN_RULES, normalize_column
+from table_reader import TABLE_CACHE, iter_table_chunks
+from table_writer import check_output, open_writer
+
+EXTERNAL_CHUNK_ROWS = 100000  # 每块读取行数
+SQLITE_CACHE_KB = 65536  # SQLite 页缓存上限（KB）
+
+
+def _sql_values(series: pd.Series) -> List:
+    """转换为 SQLite 可存储的 Python 值（空值为 None）"""
+    values = series.to_numpy(dtype=object)
+    result = []
+    for v in values:
+        if v is None or (not isinstance(v, str) and pd.isna(v)):
+            result.append(None)
+        elif isinstance(v, np.generic):
+            result.append(v.item())
+        elif isinstance(v, (str, int, float, bytes)):
+            result.append(v)
+        else:
+            result.append(str(v))
+    return result
+
+
+def external_exact_merge(file1: str, file2: str, output: str, match_pairs: List[Dict], selected_cols: List,
+                         chunk_rows: int = EXTERNAL_CHUNK_ROWS,
+                         on_progress: Optional[Callable[[int], None]] = None,
+                         should_cancel: Optional[Callable[[], bool]] = None,
+                         log: Optional[Callable[[str], None]] = None, sheet1: Union[int, str] = 0,
+                         sheet2: Union[int, str] = 0) -> Optional[Tuple[int, int]]:
+    """外存完全相同/行政区名规则合并，返回（表1总行数, 匹配成功行数），取消时返回 None
+
+    输出保留表1全部列，合并列命名为“列名_from_file2”；
+    由于不预先扫描整表，不再删除全空列，Parquet 输出的各列统一存为字符串。
+    """
+    if any(pair["rule"] not in HASH_JOIN_RULES for pair in match_pairs):
+        raise ValueError("外存连接模式仅支持“完全相同”“行政区名”规则")
+    log = log or (lambda msg: None)
+    key_cols = [f"k{i}" for i in range(len(match_pairs))]
+    val_cols = [f"c{i}" for i in range(len(selected_cols))]
+    target_cols = [f"{col}_from_file2" for col in selected_cols]
+    # 表2入库前先检查表1表头与输出文件，避免整表入库后才报错
+    header1 = set(TABLE_CACHE.peek(file1, 0, sheet1).columns)
+    missing = [p["col1"] for p in match_pairs if p["col1"] not in header1]
+    if missing:
+        raise ValueError(f"表1中不存在列：{missing}")
+    check_output(output)
+
+    work_dir = tempfile.mkdtemp(prefix="external_join_")
+    conn = sqlite3.connect(os.path.join(work_dir, "join.db"))
+    writer = None
+    try:
+        conn.execute("PRAGMA journal_mode=OFF")
+        conn.execute("PRAGMA synchronous=OFF")
+        conn.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_KB}")
+        ref_defs = [c + " TEXT" for c in key_cols] + val_cols + [f"PRIMARY KEY ({', '.join(key_cols)})"]
+        conn.execute(f"CREATE TABLE ref ({', '.join(ref_defs)}) WITHOUT ROWID")
+
+        # 1. 表2分块入库：键为主键，INSERT OR IGNORE 按文件顺序只保留首次出现的行
+        insert_ref = (f"INSERT OR IGNORE INTO ref VALUES "
+                      f"({', '.join('?' for _ in key_cols + val_cols)})")
+        ref_rows = 0
+        for chunk in iter_table_chunks(file2, chunk_rows, sheet2):
+            if should_cancel is not None and should_cancel():
+                return None
+            missing = [col for col in [p["col2"] for p in match_pairs] + list(selected_cols)
+                       if col not in chunk.columns]
+            if missing:
+                raise ValueError(f"表2中不存在列：{missing}")
+            keys = [normalize_column(chunk[p["col2"]], p["rule"]).to_numpy(dtype=object) for p in match_pairs]
+            valid = np.all([k != "" for k in keys], axis=0)
+            values = [_sql_values(chunk[col]) for col in selected_cols]
+            rows = [tuple(k[i] for k in keys) + tuple(v[i] for v in values)
+                    for i in np.flatnonzero(valid)]
+            conn.executemany(insert_ref, rows)
+            ref_rows += len(chunk)
+        conn.commit()
+        ref_keys = conn.execute("SELECT COUNT(*) FROM ref").fetchone()[0]
+        log(f"外存连接：表2共{ref_rows}行，去重后{ref_keys}个联合键")
+
+        # 2. 表1分块探测并按行序写出
+        conn.execute(f"CREATE TEMP TABLE probe (rowno INTEGER PRIMARY KEY, "
+                     f"{', '.join(c + ' TEXT' for c in key_cols)})")
+        insert_probe = f"INSERT INTO probe VALUES (?, {', '.join('?' for _ in key_cols)})"
+        select_cols = ["p.rowno", "r.k0 IS NOT NULL"] + ["r." + c for c in val_cols]
+        join_sql = (f"SELECT {', '.join(select_cols)} FROM probe p "
+                    f"LEFT JOIN ref r ON {' AND '.join(f'r.{c} = p.{c}' for c in key_cols)} ORDER BY p.rowno")
+
+        total_rows = matched_rows = 0
+        for chunk in iter_table_chunks(file1, chunk_rows, sheet1):
+            if should_cancel is not None and should_cancel():
+                if writer is not None:
+                    writer.abort()
+                return None
+            chunk = chunk.reset_index(drop=True)
+            keys = [normalize_column(chunk[p["col1"]], p["rule"]).to_numpy(dtype=object) for p in match_pairs]
+            conn.execute("DELETE FROM probe")
+            conn.executemany(insert_probe, zip(range(len(chunk)), *keys))
+            joined = conn.execute(join_sql).fetchall()
+
+            matched_rows += sum(row[1] for row in joined)
+            extra = pd.DataFrame([row[2:] for row in joined], columns=target_cols, dtype=object)
+            out = pd.concat([chunk, extra], axis=1)
+            if writer is None:
+                writer = open_writer(output, out.head(0).astype(object))
+            writer.write(out)
+            total_rows += len(chunk)
+            if on_progress is not None:
+                on_progress(total_rows)
+
+        if writer is None:
+            raise ValueError("文件无数据")
+        writer.close()
+        return total_rows, matched_rows
+    except Exception:
+        if writer is not None:
+            writer.abort()
+        raise
+    finally:
+        conn.close()
+        shutil.rmtree(work_dir, ignore_errors=True)
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""
+表2匹配索引持久化（跨次运行复用）
+- 以（表2文件内容哈希, 工作表, 匹配列, 规则, 阈值）为键，把 PairIndex 保存到本地缓存目录
+- 再次使用同一参照表时直接载入（行号数组内存映射），跳过清洗与索引构建
+- 文件内容变化后哈希不同，旧索引自然失效；超过条数上限时删除最久未使用的索引
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+from typing import Callable, Dict, Optional, Tuple, Union
+
+from merge_engine import PairIndex
+
+INDEX_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".table_merge", "index_cache")
+INDEX_FORMAT_VERSION = 1  # 索引结构变化时递增，使旧缓存失效
+MAX_CACHED_INDEXES = 32  # 缓存目录中最多保留的索引数
+HASH_BLOCK_SIZE = 1 << 20  # 计算文件哈希时每次读取的字节数
+
+
+class IndexStore:
+    """表2索引的磁盘缓存"""
+
+    def __init__(self, cache_dir: str = INDEX_CACHE_DIR, max_entries: int = MAX_CACHED_INDEXES):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self._digests: Dict[Tuple[str, int, int], str] = {}  # （路径, 大小, 修改时间）→ 内容哈希
+        self._lock = threading.Lock()
+
+    def file_digest(self, path: str) -> str:
+        """文件内容的 SHA-1（同一进程内按路径、大小与修改时间记忆，避免重复读取）"""
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        memo_key = (path, stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            digest = self._digests.get(memo_key)
+        if digest is None:
+            sha1 = hashlib.sha1()
+            with open(path, "rb") as f:
+                for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+                    sha1.update(block)
+            digest = sha1.hexdigest()
+            with self._lock:
+                self._digests[memo_key] = digest
+        return digest
+
+    def make_key(self, path: str, col: str, rule: str, threshold: Optional[float] = None,
+                 sheet_name: Union[int, str] = 0) -> str:
+        spec = [INDEX_FORMAT_VERSION, self.file_digest(path), sheet_name, str(col), rule,
+                threshold if rule == "similarity" else None]
+        return hashlib.sha1(json.dumps(spec, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+    def load(self, key: str) -> Optional[PairIndex]:
+        directory = os.path.join(self.cache_dir, key)
+        if not os.path.isdir(directory):
+            return None
+        try:
+            index = PairIndex.load(directory)
+        except Exception:
+            # 文件损坏或版本不兼容：删除后重新构建
+            shutil.rmtree(directory, ignore_errors=True)
+            return None
+        os.utime(directory)  # 记录最近使用时间，用于淘汰
+        return index
+
+    def save(self, key: str, index: PairIndex):
+        """先写入临时目录再整体改名，避免并发运行读到写了一半的索引"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(prefix=".tmp_", dir=self.cache_dir)
+        try:
+            index.save(tmp_dir)
+            os.replace(tmp_dir, os.path.join(self.cache_dir, key))
+        except OSError:
+            # 目标已由其他进程写入
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        self._prune()
+
+    def find(self, path: str, col: str, rule: str, threshold: Optional[float] = None,
+             sheet_name: Union[int, str] = 0) -> Optional[PairIndex]:
+        """只载入已保存的索引，未保存时返回 None（不构建）"""
+        return self.load(self.make_key(path, col, rule, threshold, sheet_name))
+
+    def get_or_build(self, path: str, col: str, rule: str, build: Callable[[], PairIndex],
+                     threshold: Optional[float] = None, sheet_name: Union[int, str] = 0) -> Tuple[PairIndex, bool]:
+        """返回（索引, 是否来自缓存）；未缓存时调用 build() 构建并保存"""
+        index = self.find(path, col, rule, threshold, sheet_name)
+        if index is not None:
+            return index, True
+        index = build()
+        key = self.make_key(path, col, rule, threshold, sheet_name)
+        try:
+            self.save(key, index)
+        except Exception:
+            # 缓存目录不可写时不影响合并
+            pass
+        return index, False
+
+    def clear(self):
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def _prune(self):
+        entries = [os.path.join(self.cache_dir, name) for name in os.listdir(self.cache_dir)
+                   if not name.startswith(".tmp_")]
+        entries.sort(key=lambda d: os.stat(d).st_mtime, reverse=True)
+        for directory in entries[self.max_entries:]:
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+# 进程级共享实例
+INDEX_STORE = IndexStore()
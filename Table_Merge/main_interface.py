@@ -2,6 +2,7 @@ import tkinter as tk
 from tkinter import messagebox, ttk, font, filedialog
 import os
 import sys
+import multiprocessing
 # 导入 Excel合并工具类
 from excel_merger import ExcelMergerPro
 
@@ -209,6 +210,9 @@ class MainInterface:
 
 
 if __name__ == "__main__":
+    # 打包为exe后多进程匹配需要
+    multiprocessing.freeze_support()
+
     # 高DPI屏幕适配
     try:
         from ctypes import windll
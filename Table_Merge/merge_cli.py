@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""
+表格合并命令行（无界面运行）
+用法：
+    python merge_cli.py 任务文件.json [-j 并发进程数] [-v]
+    python merge_cli.py 任务文件.json --explain 5,12,100    （只解释表1指定行的匹配过程，不执行合并）
+任务文件为 JSON 或 YAML（需 pyyaml），可为单个合并任务或批量任务，格式见 merge_runner.normalize_spec / load_spec。
+任一任务失败时退出码为 1。
+"""
+
+import argparse
+import multiprocessing
+import sys
+
+from merge_runner import explain_merge, load_spec, parse_rows, run_batch
+
+
+def explain(specs, rows) -> int:
+    """逐个任务（多参照表任务逐张参照表）打印指定行的匹配过程"""
+    failed = 0
+    for i, spec in enumerate(specs, 1):
+        sources = spec.get("sources") or [spec]
+        for k, source in enumerate(sources, 1):
+            title = f"[任务{i}]" + (f"[参照表{k}]" if len(sources) > 1 else "")
+            try:
+                lines = explain_merge(spec["file1"], source["file2"], source["match_pairs"], rows,
+                                      merge_mode=spec["options"]["merge_mode"],
+                                      low_memory=spec["options"]["low_memory"],
+                                      reuse_index=spec["options"]["reuse_index"], sheet1=spec["sheet1"],
+                                      sheet2=source.get("sheet", source.get("sheet2", 0)))
+            except Exception as e:
+                print(f"{title} 错误：{e}", flush=True)
+                failed += 1
+                continue
+            for line in lines:
+                print(f"{title} {line}", flush=True)
+    return 1 if failed else 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="按任务文件执行表格合并（支持批量并发）")
+    parser.add_argument("spec", help="任务文件路径（.json / .yaml）")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="并发执行的任务数（默认取任务文件中的 max_workers，否则为CPU核数）")
+    parser.add_argument("-v", "--verbose", action="store_true", help="输出逐行匹配明细")
+    parser.add_argument("--explain", type=parse_rows, metavar="行号",
+                        help="只解释表1指定行（如 5,12,100-105）的匹配过程，不执行合并")
+    args = parser.parse_args(argv)
+
+    try:
+        specs, max_workers = load_spec(args.spec)
+    except Exception as e:
+        print(f"错误：任务文件无效：{e}", file=sys.stderr)
+        return 2
+    if args.explain:
+        return explain(specs, args.explain)
+
+    def on_done(result):
+        if result["status"] == "ok":
+            print(f"[完成] {result['output']}（耗时{result['seconds']:.1f}秒）", flush=True)
+        else:
+            print(f"[失败] {result['output']}：{result['error']}", flush=True)
+
+    results = run_batch(specs, max_workers=args.jobs or max_workers, verbose=args.verbose, on_done=on_done)
+    failed = sum(result["status"] != "ok" for result in results)
+    print(f"共{len(results)}个任务，成功{len(results) - failed}个，失败{failed}个")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
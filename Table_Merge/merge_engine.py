@@ -0,0 +1,939 @@
+# -*- coding: utf-8 -*-
+"""
+表格合并匹配引擎（与界面解耦）
+- 匹配列清洗：与原逐行匹配完全一致的规范化规则，只对去重后的取值做字符串处理
+- 完全相同规则：多列联合键一次哈希连接，表2按首次出现去重（保持“取第一行”语义）
+- 模糊规则：Aho–Corasick 自动机 + n-gram 倒排索引，结果与逐值双向子串扫描完全一致
+- 行政区名规则：两侧统一为规范键（全角转半角、去掉省/市/自治区/盟/县/区/旗等后缀）后按完全相同做哈希连接
+- 相似度规则：编辑距离相似度 ≥ 阈值，双字 n-gram 计数过滤 + 长度分桶分块，候选批量向量化打分
+- 合并方式：取首个匹配行 / 展开全部匹配行 / 按列聚合全部匹配行（基于匹配行对数组的向量化 groupby）
+- 查找结果按（匹配对, 规范化取值）做有界 LRU 缓存，表1重复取值只计算一次
+- 试运行：表1随机抽样与完整表2索引匹配，估计各匹配对的匹配率、多重匹配率与全量耗时
+- 逐行匹配内核可在多进程中分块并行执行（表2索引只构建一次，fork 继承/spawn 序列化共享）
+- 逐行日志分级：快速路径不生成任何诊断字符串，抽样行或指定行按需调用 explain_row 重现匹配过程
+- 协作式取消：匹配内核每 CANCEL_CHECK_ROWS 行检查一次共享取消事件，取消时报告已连续完成的行及其结果
+- 匹配计数（MatchStats）：各匹配对满足/多行满足的行数与所有条件均满足/多行同时满足的行数，随匹配顺带累计
+"""
+
+import multiprocessing as mp
+import os
+import pickle
+import re
+import time
+import unicodedata
+from collections import Counter, deque
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+import pandas as pd
+
+NO_MATCH = -1  # 未匹配行在位置数组中的取值
+LOOKUP_CACHE_SIZE = 65536  # 每个匹配对的查找结果缓存条数
+PARALLEL_CHUNK_SIZE = 5000  # 多进程模式下每个任务块的表1行数
+CANCEL_CHECK_ROWS = 32  # 匹配内核每隔多少行检查一次取消事件
+CASE_INSENSITIVE_RULES = ("fuzzy", "similarity")  # 清洗时转小写的规则
+HASH_JOIN_RULES = ("exact", "admin_name")  # 可按规范键直接哈希连接的规则
+DEFAULT_SIMILARITY = 0.85  # 相似度规则默认阈值
+SCORE_BATCH_SIZE = 4096  # 相似度批量打分的候选数
+
+# 合并方式：{名称: 说明}
+MERGE_MODES: Dict[str, str] = {"first": "取首个匹配行", "all": "展开全部匹配行", "aggregate": "聚合全部匹配行"}
+# 聚合函数：{名称: 说明}
+AGGREGATIONS: Dict[str, str] = {"sum": "求和", "mean": "均值", "count": "计数",
+                                 "first": "首个", "last": "末个", "concat": "拼接"}
+# 聚合结果的列类型（未列出的沿用表2来源列类型）
+AGG_DTYPES: Dict[str, object] = {"sum": "float64", "mean": "float64", "count": "int64", "concat": object}
+CONCAT_SEP = "；"  # 拼接聚合的分隔符
+DRY_RUN_SAMPLE = 2000  # 试运行抽样行数
+DRY_RUN_REF_SAMPLE = 20000  # 试运行中相似度索引最多使用的表2行数（超出时抽样构建）
+# 逐行日志级别：{名称: 说明}，LOG_EVERY 为对应的日志间隔行数（0 为不输出逐行日志）
+LOG_LEVELS: Dict[str, str] = {"summary": "仅汇总", "sample": "每10行抽样", "all": "全部行"}
+LOG_EVERY: Dict[str, int] = {"summary": 0, "sample": 10, "all": 1}
+
+
+# 行政区名后缀（按顺序尝试，只去掉一个；去掉后不足2个字时保留原名）
+ADMIN_SUFFIXES = ("特别行政区", "地区", "林区", "省", "市", "盟", "县", "区", "旗")
+# 自治地方名中的民族名：多字民族名后的“族”可省略（如“伊犁哈萨克自治州”），单字民族名须带“族”，避免误删地名用字
+MULTI_CHAR_ETHNONYMS = ("维吾尔", "蒙古", "布依", "朝鲜", "土家", "哈尼", "哈萨克", "傈僳", "拉祜", "纳西", "景颇",
+                        "柯尔克孜", "达斡尔", "仫佬", "锡伯", "仡佬", "布朗", "撒拉", "毛南", "普米", "鄂温克",
+                        "鄂伦春", "独龙", "保安", "东乡", "裕固", "基诺", "德昂", "阿昌", "塔吉克", "门巴")
+SINGLE_CHAR_ETHNONYMS = "藏回苗彝壮满侗瑶白傣黎佤畲水土羌怒京"
+_ETHNONYM = rf"(?:(?:{'|'.join(MULTI_CHAR_ETHNONYMS)})族?|[{SINGLE_CHAR_ETHNONYMS}]族|各族)"
+# 自治地方后缀及其前的民族名，如“延边朝鲜族自治州”→“延边”、“巴音郭楞蒙古自治州”→“巴音郭楞”
+_AUTONOMOUS_RE = re.compile(rf"{_ETHNONYM}*自治(?:区|州|县|旗)$")
+# 名称本身就是民族名（可带“族”与“自治X”），如“鄂温克族自治旗”“鄂温克族”“鄂伦春自治旗”→ 民族名
+_ETHNONYM_NAME_RE = re.compile(rf"({'|'.join(MULTI_CHAR_ETHNONYMS)})族?(?:自治(?:区|州|县|旗))?")
+
+
+def canonical_admin_name(value: str) -> str:
+    """行政区名规范键：全角转半角、去空白、转小写，再去掉行政级别后缀
+
+    只用于两侧同级名称的匹配；不同级别同名（如吉林省/吉林市）会得到相同的键。
+    """
+    value = re.sub(r"\s+", "", unicodedata.normalize("NFKC", value)).lower()
+    ethnonym = _ETHNONYM_NAME_RE.fullmatch(value)
+    if ethnonym:
+        return ethnonym.group(1)
+    stripped = _AUTONOMOUS_RE.sub("", value)
+    if stripped != value:
+        # 去掉民族名后不足2个字（如“内蒙古自治区”）时只去掉“自治X”
+        return stripped if len(stripped) >= 2 else value[:-3]
+    for suffix in ADMIN_SUFFIXES:
+        if value.endswith(suffix) and len(value) - len(suffix) >= 2:
+            return value[:-len(suffix)]
+    return value
+
+
+def normalize_column(series: pd.Series, rule: str, as_category: bool = False) -> pd.Series:
+    """清洗匹配列：空值转空串、去首尾空格，模糊/相似度规则额外转小写，行政区名规则转为规范键
+
+    转为字符串后先去重，只清洗唯一值再按编码展开，结果中相同取值共享同一字符串对象；
+    as_category=True 时返回分类类型（整数编码 + 唯一值），进一步降低内存。
+    """
+    codes, uniques = pd.factorize(series.astype(str))
+    cleaned = pd.Series(uniques, dtype=object).str.strip()
+    if rule in CASE_INSENSITIVE_RULES:
+        cleaned = cleaned.str.lower()
+    elif rule == "admin_name":
+        cleaned = cleaned.map(canonical_admin_name)
+    # 空值的编码为 -1，对应末尾追加的空串（整列为空时 uniques 也为空）
+    values = np.append(cleaned.to_numpy(dtype=object), "")[codes]
+    values[series.isna().to_numpy()] = ""
+    if as_category:
+        return pd.Series(pd.Categorical(values), index=series.index)
+    return pd.Series(values, index=series.index, dtype=object)
+
+
+def build_key_frame(df: pd.DataFrame, match_pairs: List[Dict], side: str,
+                    as_category: bool = False) -> pd.DataFrame:
+    """按匹配对生成规范化键表，列名为 k0、k1...（side 取 col1 / col2）"""
+    keys = {f"k{i}": normalize_column(df[pair[side]], pair["rule"], as_category).to_numpy()
+            for i, pair in enumerate(match_pairs)}
+    return pd.DataFrame(keys)
+
+
+def _encode_keys(keys1: pd.DataFrame, keys2: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """把两表键列按表2取值编码为整数（空串与表2中不存在的取值编码为 -1）"""
+    codes1, codes2 = {}, {}
+    for col in keys1.columns:
+        cat2 = pd.Categorical(keys2[col])
+        categories = cat2.categories
+        codes = cat2.codes.astype("int64")
+        empty = categories.get_indexer([""])[0]
+        if empty != -1:
+            codes[codes == empty] = -1
+        codes2[col] = codes
+        if isinstance(keys1[col].dtype, pd.CategoricalDtype):
+            cat1 = keys1[col].array
+            mapped = categories.get_indexer(cat1.categories)
+            mapped = np.append(mapped, -1)[cat1.codes]
+        else:
+            mapped = categories.get_indexer(keys1[col].to_numpy(dtype=object))
+        if empty != -1:
+            mapped[mapped == empty] = -1
+        codes1[col] = mapped
+    return pd.DataFrame(codes1), pd.DataFrame(codes2)
+
+
+def exact_join(keys1: pd.DataFrame, keys2: pd.DataFrame, stats: Optional["MatchStats"] = None) -> np.ndarray:
+    """多列完全相同匹配：返回表1每行对应的表2行位置（无匹配为 NO_MATCH）
+
+    两表键先编码为整数再连接；表2中任一键为空的行不参与匹配，
+    重复键只保留首次出现的行，与逐行求交集后取最小行号的结果一致。
+    stats 不为 None 时累计匹配计数（各匹配对按单列键计数，全部行均参与判断）。
+    """
+    key_cols = list(keys1.columns)
+    left, right = _encode_keys(keys1, keys2)
+    if stats is not None:
+        stats.add_key_counts(left, right)
+    right["_pos2"] = np.arange(len(right))
+    right = right[(right[key_cols] != -1).all(axis=1).to_numpy()]
+    if stats is not None:
+        # 表2中每组完整键的行数，用于统计多行同时满足的表1行
+        right["_count"] = right.groupby(key_cols, sort=False)["_pos2"].transform("size")
+    right = right.drop_duplicates(subset=key_cols, keep="first")
+
+    # 右表键唯一，左连接保持表1行数与顺序；含 -1 的表1行必然无匹配
+    merged = left.merge(right, how="left", on=key_cols, sort=False)
+    if stats is not None:
+        counts = merged["_count"].fillna(0).to_numpy(dtype="int64")
+        stats.matched += int((counts > 0).sum())
+        stats.ambiguous += int((counts > 1).sum())
+    return merged["_pos2"].fillna(NO_MATCH).to_numpy(dtype="int64")
+
+
+def exact_join_all(keys1: pd.DataFrame, keys2: pd.DataFrame,
+                   stats: Optional["MatchStats"] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """多列完全相同匹配的全部匹配行对：返回（表1行位置, 表2行位置），按表1行、表2行排序"""
+    key_cols = list(keys1.columns)
+    left, right = _encode_keys(keys1, keys2)
+    if stats is not None:
+        stats.add_key_counts(left, right)
+    left["_pos1"] = np.arange(len(left))
+    right["_pos2"] = np.arange(len(right))
+    left = left[(left[key_cols] != -1).all(axis=1).to_numpy()]
+    right = right[(right[key_cols] != -1).all(axis=1).to_numpy()]
+    merged = left.merge(right, how="inner", on=key_cols, sort=False)
+    pos1 = merged["_pos1"].to_numpy(dtype="int64")
+    pos2 = merged["_pos2"].to_numpy(dtype="int64")
+    order = np.lexsort((pos2, pos1))
+    if stats is not None:
+        stats.add_pairs(pos1)
+    return pos1[order], pos2[order]
+
+
+def first_positions(pos1: np.ndarray, pos2: np.ndarray, total_rows: int) -> np.ndarray:
+    """由全部匹配行对得到每行的首个匹配位置（行对须已按表1行、表2行排序）"""
+    positions = np.full(total_rows, NO_MATCH, dtype="int64")
+    if len(pos1):
+        first = np.flatnonzero(np.r_[True, pos1[1:] != pos1[:-1]])
+        positions[pos1[first]] = pos2[first]
+    return positions
+
+
+def expand_matches(pos1: np.ndarray, pos2: np.ndarray, total_rows: int) -> Tuple[np.ndarray, np.ndarray]:
+    """展开全部匹配行（左连接语义）：返回（输出行对应的表1行, 表2行，无匹配为 NO_MATCH）"""
+    unmatched = np.setdiff1d(np.arange(total_rows), pos1, assume_unique=False)
+    rows = np.concatenate([pos1, unmatched])
+    positions = np.concatenate([pos2, np.full(len(unmatched), NO_MATCH, dtype="int64")])
+    order = np.argsort(rows, kind="stable")
+    return rows[order], positions[order]
+
+
+def aggregate_matches(df2: pd.DataFrame, pos1: np.ndarray, pos2: np.ndarray, total_rows: int,
+                      aggregations: Dict, target_cols: Dict) -> pd.DataFrame:
+    """按表1行对全部匹配的表2行做分组聚合，返回与表1等长的合并列（未匹配行为空，计数为0）
+
+    sum/mean 先将取值转为数值（无法转换的视为空），first/last 取组内首个/末个非空值，
+    concat 将组内非空值按匹配顺序以分隔符拼接。
+    """
+    columns = {}
+    for col, func in aggregations.items():
+        values = df2[col].iloc[pos2].reset_index(drop=True)
+        if func in ("sum", "mean"):
+            values = pd.to_numeric(values, errors="coerce")
+        grouped = values.groupby(pos1, sort=True)
+        if func == "sum":
+            result = grouped.sum(min_count=1)
+        elif func == "concat":
+            result = values.dropna().astype(str).groupby(pos1[values.notna().to_numpy()], sort=True).agg(CONCAT_SEP.join)
+        else:
+            result = grouped.agg(func)
+        if func == "count":
+            out = np.zeros(total_rows, dtype="int64")
+        elif func in AGG_DTYPES:
+            out = np.full(total_rows, np.nan if AGG_DTYPES[func] == "float64" else None,
+                          dtype=AGG_DTYPES[func])
+        else:
+            out = np.full(total_rows, None, dtype=object)
+        out[result.index.to_numpy(dtype="int64")] = result.to_numpy()
+        columns[target_cols[col]] = out
+    return pd.DataFrame(columns)
+
+
+def matched_columns(df2: pd.DataFrame, positions: np.ndarray, selected_cols: List,
+                    target_cols: Dict) -> pd.DataFrame:
+    """按匹配位置取出表2选中列，列名为目标列名，未匹配行为 None"""
+    matched = positions != NO_MATCH
+    columns = {}
+    for col in selected_cols:
+        values = np.full(len(positions), None, dtype=object)
+        values[matched] = df2[col].to_numpy(dtype=object)[positions[matched]]
+        columns[target_cols[col]] = values
+    return pd.DataFrame(columns)
+
+
+def apply_matches(df1: pd.DataFrame, df2: pd.DataFrame, positions: np.ndarray,
+                  selected_cols: List, target_cols: Dict) -> int:
+    """按匹配位置把表2选中列写入表1的目标列，返回匹配成功行数"""
+    for col, values in matched_columns(df2, positions, selected_cols, target_cols).items():
+        df1[col] = values.to_numpy()
+    return int((positions != NO_MATCH).sum())
+
+
+class AhoCorasick:
+    """多模式串自动机：一次扫描文本找出其中出现的全部模式串"""
+
+    def __init__(self, patterns: Iterable[str]):
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.terminal: List[List[int]] = [[]]  # 节点结束的模式串编号
+        self.out_link: List[int] = [0]  # 失败链上最近的终止节点（0表示无）
+
+        for pid, pattern in enumerate(patterns):
+            if not pattern:
+                continue
+            node = 0
+            for ch in pattern:
+                nxt = self.goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self.goto)
+                    self.goto[node][ch] = nxt
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.terminal.append([])
+                    self.out_link.append(0)
+                node = nxt
+            self.terminal[node].append(pid)
+
+        # 广度优先构建失败指针与输出链接
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, child in self.goto[node].items():
+                queue.append(child)
+                f = self.fail[node]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                target = self.goto[f].get(ch, 0)
+                self.fail[child] = target if target != child else 0
+                fc = self.fail[child]
+                self.out_link[child] = fc if self.terminal[fc] else self.out_link[fc]
+
+    def find_all(self, text: str) -> Set[int]:
+        """返回 text 中出现过的模式串编号集合"""
+        found = set()
+        goto, fail, terminal, out_link = self.goto, self.fail, self.terminal, self.out_link
+        node = 0
+        for ch in text:
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            hit = node if terminal[node] else out_link[node]
+            while hit:
+                found.update(terminal[hit])
+                hit = out_link[hit]
+        return found
+
+
+class FuzzyIndex:
+    """模糊包含索引：查找与查询值互为子串（q in v 或 v in q）的表2取值
+
+    - v in q：Aho–Corasick 自动机扫描查询值
+    - q in v：单字/双字 n-gram 倒排表取最短候选链再逐个校验
+    - 空串是任何字符串的子串，与原逐值扫描一致，始终命中
+    """
+
+    def __init__(self, values: List[str]):
+        self.values = values
+        self.automaton = AhoCorasick(values)
+        self.empty_ids = [i for i, v in enumerate(values) if not v]
+        self.unigrams: Dict[str, List[int]] = {}
+        self.bigrams: Dict[str, List[int]] = {}
+        for vid, value in enumerate(values):
+            for ch in set(value):
+                self.unigrams.setdefault(ch, []).append(vid)
+            for gram in {value[j:j + 2] for j in range(len(value) - 1)}:
+                self.bigrams.setdefault(gram, []).append(vid)
+
+    def _containing(self, query: str) -> Iterable[int]:
+        """包含 query 的取值编号"""
+        if len(query) == 1:
+            return self.unigrams.get(query, [])
+        postings = []
+        for gram in {query[j:j + 2] for j in range(len(query) - 1)}:
+            posting = self.bigrams.get(gram)
+            if posting is None:
+                return []
+            postings.append(posting)
+        shortest = min(postings, key=len)
+        if len(query) == 2:
+            return shortest
+        values = self.values
+        return [vid for vid in shortest if query in values[vid]]
+
+    def lookup(self, query: str) -> Set[int]:
+        """返回与 query 互为子串的取值编号集合（query 须非空）"""
+        found = self.automaton.find_all(query)
+        found.update(self.empty_ids)
+        found.update(self._containing(query))
+        return found
+
+
+def levenshtein_batch(query: str, candidates: List[str]) -> np.ndarray:
+    """批量计算 query 与各候选的编辑距离（按候选向量化，逐个查询字符推进动态规划）"""
+    n = len(candidates)
+    lengths = np.fromiter((len(c) for c in candidates), dtype="int64", count=n)
+    width = int(lengths.max()) if n else 0
+    codes = np.full((n, width), -1, dtype="int64")
+    for row, cand in enumerate(candidates):
+        codes[row, :len(cand)] = [ord(ch) for ch in cand]
+
+    steps = np.arange(width + 1)
+    prev = np.tile(steps, (n, 1))
+    for i, ch in enumerate(query, 1):
+        # 替换/删除：由上一行得到；插入：cur[j] = min_k(best[k] + j - k)，用累计最小值一次求出
+        best = np.empty_like(prev)
+        best[:, 0] = i
+        best[:, 1:] = np.minimum(prev[:, :-1] + (codes != ord(ch)), prev[:, 1:] + 1)
+        prev = np.minimum.accumulate(best - steps, axis=1) + steps
+    return prev[np.arange(n), lengths]
+
+
+class SimilarityIndex:
+    """相似度索引：查找与查询值编辑距离相似度（1 - 距离 / 较长串长度）不低于阈值的取值
+
+    分块不漏检：相似度达标时距离 d ≤ (1 - 阈值) × 较长串长度，候选长度必在该范围内，
+    且与查询共享的双字 n-gram 数（多重集）不少于 max(长度) - 1 - 2d（q-gram 计数引理）；
+    下界不大于0时退化为按长度分桶取全部候选。通过过滤的候选分批向量化计算编辑距离。
+    """
+
+    def __init__(self, values: List[str], threshold: float = DEFAULT_SIMILARITY):
+        self.values = values
+        self.threshold = threshold
+        self.lengths = [len(v) for v in values]
+        self.by_length: Dict[int, List[int]] = {}
+        self.bigrams: Dict[str, List[Tuple[int, int]]] = {}  # n-gram -> [(取值编号, 出现次数)]
+        for vid, value in enumerate(values):
+            if not value:
+                continue
+            self.by_length.setdefault(len(value), []).append(vid)
+            for gram, cnt in Counter(value[j:j + 2] for j in range(len(value) - 1)).items():
+                self.bigrams.setdefault(gram, []).append((vid, cnt))
+
+    def _max_distance(self, longest: int) -> int:
+        return int(np.floor((1 - self.threshold) * longest + 1e-9))
+
+    def candidates(self, query: str) -> List[int]:
+        """通过长度过滤与 n-gram 计数过滤的候选取值编号"""
+        qlen = len(query)
+        # 候选长度上限：len ≤ qlen + d 且 d ≤ (1-t)·len  →  len ≤ qlen / t
+        max_len = int(np.floor(qlen / self.threshold + 1e-9)) if self.threshold > 0 else max(self.by_length, default=0)
+        min_len = qlen - self._max_distance(qlen)
+        # 共享 n-gram 数按多重集计：每个 n-gram 取两侧出现次数的较小值
+        counts: Dict[int, int] = {}
+        for gram, qcnt in Counter(query[j:j + 2] for j in range(qlen - 1)).items():
+            for vid, vcnt in self.bigrams.get(gram, ()):
+                counts[vid] = counts.get(vid, 0) + min(qcnt, vcnt)
+
+        result = []
+        for length in range(max(min_len, 1), max_len + 1):
+            ids = self.by_length.get(length)
+            if not ids:
+                continue
+            longest = max(length, qlen)
+            bound = longest - 1 - 2 * self._max_distance(longest)
+            if bound <= 0:
+                result.extend(ids)
+            else:
+                result.extend(vid for vid in ids if counts.get(vid, 0) >= bound)
+        return result
+
+    def score(self, query: str, ids: List[int]) -> np.ndarray:
+        """分批计算相似度"""
+        scores = np.empty(len(ids), dtype="float64")
+        for start in range(0, len(ids), SCORE_BATCH_SIZE):
+            batch = ids[start:start + SCORE_BATCH_SIZE]
+            cands = [self.values[vid] for vid in batch]
+            dist = levenshtein_batch(query, cands)
+            longest = np.maximum(np.fromiter((len(c) for c in cands), dtype="int64", count=len(cands)), len(query))
+            scores[start:start + len(batch)] = 1 - dist / longest
+        return scores
+
+    def lookup(self, query: str) -> Set[int]:
+        """返回相似度不低于阈值的取值编号集合（query 须非空）"""
+        ids = self.candidates(query)
+        if not ids:
+            return set()
+        scores = self.score(query, ids)
+        return {vid for vid, sc in zip(ids, scores) if sc >= self.threshold - 1e-9}
+
+    def top_k(self, query: str, k: int = 3) -> List[Tuple[str, float]]:
+        """返回得分最高的 k 个候选（取值, 相似度），用于日志展示"""
+        ids = self.candidates(query)
+        if not ids:
+            return []
+        scores = self.score(query, ids)
+        order = np.argsort(-scores, kind="stable")[:k]
+        return [(self.values[ids[i]], float(scores[i])) for i in order]
+
+
+class PairIndex:
+    """单个匹配对的表2索引：取值 → 行号（CSR 数组）、模糊/相似度索引与查找结果 LRU 缓存
+
+    values 为按首次出现排序的不同取值，取值 i 对应的表2行号为 rows[offsets[i]:offsets[i + 1]]（升序）。
+    save()/load() 把索引保存到目录并重新载入，行号数组以内存映射方式打开，无需重新构建。
+    """
+
+    def __init__(self, df2_col: pd.Series, rule: str, cache_size: int = LOOKUP_CACHE_SIZE,
+                 threshold: float = DEFAULT_SIMILARITY):
+        self.rule = rule
+        self.threshold = threshold
+        codes, uniques = pd.factorize(df2_col.to_numpy(dtype=object))
+        self.values: List[str] = list(uniques)
+        self.offsets = np.concatenate([[0], np.cumsum(np.bincount(codes, minlength=len(self.values)))])
+        self.rows = np.argsort(codes, kind="stable").astype("int64")
+        self._build_lookup_structures(cache_size)
+        self.fuzzy_index = FuzzyIndex(self.values) if rule == "fuzzy" else None
+        self.similarity_index = SimilarityIndex(self.values, threshold) if rule == "similarity" else None
+
+    def _build_lookup_structures(self, cache_size: int):
+        self.value_ids: Dict[str, int] = {value: vid for vid, value in enumerate(self.values)}
+        self.cache_size = cache_size
+        self.lookup = lru_cache(maxsize=cache_size)(self._lookup)
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def __getstate__(self):
+        # 缓存包装器不可序列化，传给子进程时丢弃，反序列化后重建空缓存
+        state = self.__dict__.copy()
+        del state["lookup"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lookup = lru_cache(maxsize=self.cache_size)(self._lookup)
+
+    def save(self, directory: str):
+        """保存到目录：offsets.npy / rows.npy（可内存映射）与 meta.pkl（取值与模糊/相似度索引）"""
+        os.makedirs(directory, exist_ok=True)
+        np.save(os.path.join(directory, "offsets.npy"), np.asarray(self.offsets))
+        np.save(os.path.join(directory, "rows.npy"), np.asarray(self.rows))
+        meta = {"rule": self.rule, "threshold": self.threshold, "values": self.values,
+                "fuzzy_index": self.fuzzy_index, "similarity_index": self.similarity_index}
+        with open(os.path.join(directory, "meta.pkl"), "wb") as f:
+            pickle.dump(meta, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load(cls, directory: str, cache_size: int = LOOKUP_CACHE_SIZE, mmap: bool = True) -> "PairIndex":
+        """从 save() 保存的目录载入，mmap=True 时行号数组按需从磁盘读取"""
+        with open(os.path.join(directory, "meta.pkl"), "rb") as f:
+            meta = pickle.load(f)
+        index = cls.__new__(cls)
+        index.__dict__.update(meta)
+        mode = "r" if mmap else None
+        index.offsets = np.load(os.path.join(directory, "offsets.npy"), mmap_mode=mode)
+        index.rows = np.load(os.path.join(directory, "rows.npy"), mmap_mode=mode)
+        index._build_lookup_structures(cache_size)
+        return index
+
+    def keys(self) -> np.ndarray:
+        """还原表2每行的规范化取值（与构建时传入的列一致）"""
+        codes = np.empty(len(self.rows), dtype="int64")
+        codes[np.asarray(self.rows)] = np.repeat(np.arange(len(self.values)), np.diff(self.offsets))
+        return np.asarray(self.values, dtype=object)[codes]
+
+    def _value_rows(self, vid: int) -> List[int]:
+        return self.rows[self.offsets[vid]:self.offsets[vid + 1]].tolist()
+
+    def _lookup(self, val1: str) -> Tuple[int, ...]:
+        """返回满足该匹配对的表2行号（模糊/相似度规则按取值首次出现顺序展开）"""
+        if self.rule in HASH_JOIN_RULES:
+            vid = self.value_ids.get(val1)
+            return () if vid is None else tuple(self._value_rows(vid))
+        index = self.fuzzy_index if self.rule == "fuzzy" else self.similarity_index
+        matched = []
+        for vid in sorted(index.lookup(val1)):
+            matched.extend(self._value_rows(vid))
+        return tuple(matched)
+
+    def cache_stats(self) -> Tuple[int, int]:
+        """返回（命中次数, 查找总次数）"""
+        info = self.lookup.cache_info()
+        return info.hits, info.hits + info.misses
+
+
+def explain_row(df1_cols: List[np.ndarray], pair_entries: List[Dict], idx: int, label: Optional[int] = None,
+                all_matches: bool = False) -> str:
+    """重现表1第 idx 行（位置）的多条件匹配过程，返回多行说明文字
+
+    label 为日志中显示的原表1行号（从0起），默认即为位置。只在需要输出日志时调用，
+    匹配本身由 match_chunk 的快速路径完成；查找经过 LRU 缓存，重复计算的开销很小。
+    """
+    label = idx if label is None else label
+    row_log = [f"行{label + 1}：开始多条件匹配"]
+    all_matched = True
+    matched_sets = []  # 存储每个匹配对的匹配行索引集合
+
+    # 逐个匹配条件校验
+    for values, data in zip(df1_cols, pair_entries):
+        val1 = values[idx]
+        row_log.append(f"  匹配对{data['pair_idx']}：'{val1}'（规则：{data['rule']}）")
+
+        # 空值处理
+        if not val1:
+            all_matched = False
+            row_log.append("  → 空值，不满足该条件")
+            break
+
+        # 查找满足该条件的表2行（重复取值直接命中缓存）
+        matched_indices = data["pair_index"].lookup(val1)
+        if data["rule"] == "similarity":
+            top = data["pair_index"].similarity_index.top_k(val1)
+            row_log.append("  → 相似候选：" + "，".join(f"'{v}'({sc:.2f})" for v, sc in top))
+        if matched_indices:
+            matched_sets.append(set(matched_indices))
+            row_log.append(f"  → 满足，表2匹配行：{list(matched_indices[:3])}...（共{len(matched_indices)}行）")
+        else:
+            all_matched = False
+            reason = {"exact": "无完全匹配值", "admin_name": "无同名行政区", "fuzzy": "无模糊匹配值"}.get(
+                data["rule"], "无达到阈值的相似值")
+            row_log.append(f"  → 不满足（{reason}）")
+            break
+
+    # 所有条件都满足后，计算交集
+    if all_matched and matched_sets:
+        common_indices = matched_sets[0]
+        for s in matched_sets[1:]:
+            common_indices.intersection_update(s)
+
+        if common_indices:
+            # 取第一个共同匹配行
+            selected_idx = min(common_indices)
+            if all_matches:
+                row_log.append(f"  → 所有条件均满足！表2共{len(common_indices)}行匹配，全部参与合并")
+            else:
+                row_log.append(f"  → 所有条件均满足！合并表2行{selected_idx + 1}")
+                if len(common_indices) > 1:
+                    row_log.append(f"  → 提示：存在{len(common_indices)}行同时满足所有条件，取第一行")
+        else:
+            all_matched = False
+            row_log.append("  → 各条件匹配行无交集，不合并")
+
+    # 输出最终结果
+    if all_matched:
+        row_log.append("  → 合并成功")
+    else:
+        row_log.append("  → 未通过所有条件，不合并")
+    return "\n".join(row_log)
+
+
+class MatchStats:
+    """匹配计数
+
+    pairs[k] 为第 k 个匹配对的 [参与判断的行数, 满足的行数, 满足的表2行多于一行的行数]：逐行匹配时
+    前一条件不满足即停止，后续条件不参与判断；哈希连接时全部行均参与判断。
+    matched / ambiguous 为所有条件均满足 / 同时满足的表2行多于一行的表1行数。
+    """
+
+    def __init__(self, n_pairs: int):
+        self.pairs = [[0, 0, 0] for _ in range(n_pairs)]
+        self.matched = 0
+        self.ambiguous = 0
+
+    def merge(self, other: "MatchStats"):
+        for mine, theirs in zip(self.pairs, other.pairs):
+            for i, value in enumerate(theirs):
+                mine[i] += value
+        self.matched += other.matched
+        self.ambiguous += other.ambiguous
+
+    def add_key_counts(self, codes1: pd.DataFrame, codes2: pd.DataFrame):
+        """哈希连接：按 _encode_keys 编码后的各列键（-1 为空或表2中不存在）统计各匹配对"""
+        for counts, col in zip(self.pairs, codes1.columns):
+            left, right = codes1[col].to_numpy(), codes2[col].to_numpy()
+            size = max(int(left.max(initial=-1)), int(right.max(initial=-1))) + 1
+            per_key = np.append(np.bincount(right[right >= 0], minlength=size), 0)[left]  # -1 取末尾的0
+            counts[0] += len(left)
+            counts[1] += int((per_key > 0).sum())
+            counts[2] += int((per_key > 1).sum())
+
+    def add_pairs(self, pos1: np.ndarray):
+        """由全部匹配行对统计所有条件均满足 / 多行同时满足的表1行"""
+        per_row = np.bincount(pos1) if len(pos1) else np.empty(0, dtype="int64")
+        self.matched += int((per_row > 0).sum())
+        self.ambiguous += int((per_row > 1).sum())
+
+
+def match_chunk(df1_cols: List[np.ndarray], pair_entries: List[Dict], start: int, end: int,
+                log_every: int = 10, all_matches: bool = False, row_labels: Optional[np.ndarray] = None,
+                cancel_event=None, stats: Optional[MatchStats] = None
+                ) -> Tuple[Optional[np.ndarray], List[str], Optional[Tuple[np.ndarray, np.ndarray]]]:
+    """逐行多条件联合匹配表1的 [start, end) 行
+
+    df1_cols 为各匹配对规范化后的表1取值，pair_entries 为 {"pair_idx", "rule", "pair_index"}。
+    返回（每行选中的表2行号，无匹配为 NO_MATCH；每 log_every 行一条的匹配日志，log_every 为0时不生成；
+    all_matches=True 时为全部匹配行对（表1行位置, 表2行位置），否则为 None）。
+    row_labels 为各行在原表1中的行号（只匹配部分行时用于日志），默认即为位置。
+    cancel_event（threading/multiprocessing Event）被置位时中途停止，返回的匹配位置为 None（整块作废）。
+    stats 不为 None 时累计本块的匹配计数（取消时不计入）。
+    """
+    positions = np.full(end - start, NO_MATCH, dtype="int64")
+    logs = []
+    pair_rows1, pair_rows2 = [], []
+    lookups = [(k, values, data["pair_index"].lookup) for k, (values, data) in enumerate(zip(df1_cols, pair_entries))]
+    # 计数先累计在局部列表中，块结束时再并入 stats
+    evaluated, satisfied, multiple = [0] * len(lookups), [0] * len(lookups), [0] * len(lookups)
+    matched_rows = ambiguous_rows = 0
+    for idx in range(start, end):
+        if cancel_event is not None and (idx - start) % CANCEL_CHECK_ROWS == 0 and cancel_event.is_set():
+            return None, logs, None
+        # 快速路径：任一条件为空、无匹配或交集为空即停止，不生成日志字符串
+        common = None
+        for k, values, lookup in lookups:
+            val1 = values[idx]
+            matched_indices = lookup(val1) if val1 else ()
+            evaluated[k] += 1
+            if not matched_indices:
+                common = None
+                break
+            satisfied[k] += 1
+            if len(matched_indices) > 1:
+                multiple[k] += 1
+            if common is None:
+                common = set(matched_indices)
+            else:
+                common.intersection_update(matched_indices)
+                if not common:
+                    break
+
+        if common:
+            positions[idx - start] = min(common)
+            matched_rows += 1
+            if len(common) > 1:
+                ambiguous_rows += 1
+            if all_matches:
+                rows2 = sorted(common)
+                pair_rows1.extend([idx] * len(rows2))
+                pair_rows2.extend(rows2)
+
+        if log_every:
+            label = idx if row_labels is None else int(row_labels[idx])
+            if label % log_every == 0:
+                logs.append(explain_row(df1_cols, pair_entries, idx, label, all_matches))
+    if stats is not None:
+        for counts, chunk_counts in zip(stats.pairs, zip(evaluated, satisfied, multiple)):
+            for i, value in enumerate(chunk_counts):
+                counts[i] += value
+        stats.matched += matched_rows
+        stats.ambiguous += ambiguous_rows
+    if not all_matches:
+        return positions, logs, None
+    return positions, logs, (np.array(pair_rows1, dtype="int64"), np.array(pair_rows2, dtype="int64"))
+
+
+def _subset_pair_index(df2_col: pd.Series, rows: np.ndarray, rule: str, threshold: float) -> PairIndex:
+    """只用表2部分行（升序位置 rows）构建索引，行号换回完整表2的位置，与其他匹配对可直接求交集"""
+    index = PairIndex(df2_col.iloc[rows], rule, threshold=threshold)
+    index.rows = rows[index.rows]
+    return index
+
+
+def _related_fuzzy_index(df2_col: pd.Series, keys: List[str]) -> Tuple[PairIndex, float]:
+    """只含与 keys 互为子串的表2行的模糊索引，对 keys 的查找结果与完整索引一致
+
+    反向以 keys 建模糊索引、逐个扫描表2不同取值，代价远低于构建完整索引；
+    返回（索引, 按不同取值数放大到完整表2的构建耗时）。
+    """
+    values = pd.unique(df2_col.to_numpy(dtype=object))
+    key_index = FuzzyIndex(keys)
+    related = {v for v in values if not v or key_index.lookup(v)}
+    rows = np.flatnonzero(df2_col.isin(related).to_numpy())
+    start = time.perf_counter()
+    index = _subset_pair_index(df2_col, rows, "fuzzy", DEFAULT_SIMILARITY)
+    return index, (time.perf_counter() - start) * len(values) / max(len(related), 1)
+
+
+def estimate_matches(df1: pd.DataFrame, df2: Optional[pd.DataFrame], match_pairs: List[Dict],
+                     sample_size: int = DRY_RUN_SAMPLE, seed: int = 0,
+                     pair_indexes: Optional[List[Optional[PairIndex]]] = None,
+                     ref_sample: int = DRY_RUN_REF_SAMPLE) -> Dict:
+    """试运行：表1随机抽样 sample_size 行，与表2索引匹配，估计全量合并的结果与耗时
+
+    表2索引的来源（各匹配对 index_source），除 stored 外构建耗时均为估计值：
+        stored  - pair_indexes 中对应位置给出的已保存索引，直接使用，不构建（全部给出时 df2 可为 None）
+        full    - 完全相同/行政区名规则，或表2不超过 ref_sample 行：按完整表2构建
+        related - 模糊规则且表2超过 ref_sample 行：只用与抽样键互为子串的表2行构建，匹配结果与完整索引一致
+        sampled - 相似度规则且表2超过 ref_sample 行：只用抽样的 ref_sample 行构建，匹配率为下限估计
+    返回 {"total_rows", "sample_rows", "ref_sample_rows", "match_rate", "ambiguity_rate", "projected_seconds",
+    "pairs": [...]}，ref_sample_rows 为抽样构建时的表2行数（未抽样为 None）；
+    pairs 中每项含 pair_idx/col1/col2/rule/index_source、match_rate（满足该条件的行比例）、ambiguity_rate
+    （表2多行满足的比例）、empty_rate、index_seconds（索引构建耗时）与 projected_seconds
+    （索引构建 + 表1清洗 + 单个取值查找耗时 × 表1不同取值数，重复取值命中缓存几乎不耗时）。
+    含非哈希规则时，总耗时另加抽样行逐行匹配耗时按总行数放大的部分。
+    """
+    total_rows = len(df1)
+    rng = np.random.default_rng(seed)
+    sample = np.sort(rng.choice(total_rows, size=min(sample_size, total_rows), replace=False))
+    n = len(sample)
+    pair_indexes = pair_indexes or [None] * len(match_pairs)
+    # 表2抽样行（各匹配对共用，保证求交集时行号一致）
+    ref_rows = None
+    if df2 is not None and len(df2) > ref_sample:
+        ref_rows = np.sort(rng.choice(len(df2), size=ref_sample, replace=False))
+    sample_cols, pair_entries, pairs_report = [], [], []
+    for pair_idx, (pair, pair_index) in enumerate(zip(match_pairs, pair_indexes), 1):
+        rule = pair["rule"]
+        threshold = pair.get("threshold", DEFAULT_SIMILARITY)
+        start = time.perf_counter()
+        keys1 = normalize_column(df1[pair["col1"]], rule).to_numpy(dtype=object)
+        clean_seconds = time.perf_counter() - start
+        sample_keys = keys1[sample]
+        distinct = [v for v in dict.fromkeys(sample_keys) if v]
+
+        start = time.perf_counter()
+        index_seconds = 0.0
+        if pair_index is not None:
+            index_source = "stored"
+        elif rule in HASH_JOIN_RULES or ref_rows is None:
+            index_source = "full"
+            pair_index = PairIndex(normalize_column(df2[pair["col2"]], rule), rule, threshold=threshold)
+            index_seconds = time.perf_counter() - start
+        elif rule == "fuzzy":
+            index_source = "related"
+            pair_index, index_seconds = _related_fuzzy_index(normalize_column(df2[pair["col2"]], rule), distinct)
+        else:
+            index_source = "sampled"
+            pair_index = _subset_pair_index(normalize_column(df2[pair["col2"]], rule), ref_rows, rule, threshold)
+            index_seconds = (time.perf_counter() - start) * len(df2) / len(ref_rows)
+
+        start = time.perf_counter()
+        found = {v: pair_index.lookup(v) for v in distinct}
+        per_value = (time.perf_counter() - start) / len(distinct) if distinct else 0.0
+        full_distinct = len(pd.unique(keys1[keys1 != ""]))
+
+        counts = np.array([len(found[v]) if v else 0 for v in sample_keys], dtype="int64")
+        pairs_report.append({
+            "pair_idx": pair_idx, "col1": pair["col1"], "col2": pair["col2"], "rule": rule,
+            "index_source": index_source, "match_rate": float((counts > 0).mean()) if n else 0.0,
+            "ambiguity_rate": float((counts > 1).mean()) if n else 0.0,
+            "empty_rate": float((sample_keys == "").mean()) if n else 0.0,
+            "index_seconds": index_seconds,
+            "projected_seconds": index_seconds + clean_seconds + per_value * full_distinct,
+        })
+        sample_cols.append(sample_keys)
+        pair_entries.append({"pair_idx": pair_idx, "rule": rule, "pair_index": pair_index})
+
+    projected = sum(p["projected_seconds"] for p in pairs_report)
+    if all(pair["rule"] in HASH_JOIN_RULES for pair in match_pairs):
+        # 哈希规则与合并时一样按键连接（表2键由索引还原），不逐行求大行号集合的交集
+        keys2 = pd.DataFrame({f"k{i}": entry["pair_index"].keys() for i, entry in enumerate(pair_entries)})
+        pos1, _ = exact_join_all(pd.DataFrame({f"k{i}": col for i, col in enumerate(sample_cols)}), keys2)
+    else:
+        # 抽样行的联合匹配（各匹配对查找结果已缓存，耗时即逐行求交集与日志的开销）
+        start = time.perf_counter()
+        _, _, (pos1, _) = match_chunk(sample_cols, pair_entries, 0, n, log_every=0, all_matches=True)
+        if n:
+            projected += (time.perf_counter() - start) / n * total_rows
+    common = np.bincount(pos1, minlength=n)
+    return {
+        "total_rows": total_rows,
+        "sample_rows": n,
+        "ref_sample_rows": None if ref_rows is None or all(p["index_source"] != "sampled" for p in pairs_report)
+        else len(ref_rows),
+        "match_rate": float((common > 0).mean()) if n else 0.0,
+        "ambiguity_rate": float((common > 1).mean()) if n else 0.0,
+        "projected_seconds": projected,
+        "pairs": pairs_report,
+    }
+
+
+# 子进程匹配状态：只由 _init_worker 在子进程中写入
+_WORKER_STATE: Dict = {}
+
+
+def _init_worker(state: Dict, cancel_event):
+    """子进程初始化：匹配状态只在子进程中写入模块全局变量，父进程不修改，并发调用互不影响"""
+    global _WORKER_STATE
+    _WORKER_STATE = dict(state, cancel_event=cancel_event)
+
+
+def _match_chunk_task(task):
+    """子进程任务：匹配一个行块，返回（块起点, 匹配位置, 日志, 各匹配对缓存命中增量, 全部匹配行对, 匹配计数）"""
+    start, end = task
+    pair_entries = _WORKER_STATE["pair_entries"]
+    before = [data["pair_index"].cache_stats() for data in pair_entries]
+    stats = MatchStats(len(pair_entries))
+    positions, logs, pairs = match_chunk(_WORKER_STATE["df1_cols"], pair_entries, start, end,
+                                         log_every=_WORKER_STATE["log_every"],
+                                         all_matches=_WORKER_STATE["all_matches"],
+                                         row_labels=_WORKER_STATE["row_labels"],
+                                         cancel_event=_WORKER_STATE["cancel_event"], stats=stats)
+    if positions is None:
+        return start, None, [], [], None, None
+    after = [data["pair_index"].cache_stats() for data in pair_entries]
+    deltas = [(a[0] - b[0], a[1] - b[1]) for a, b in zip(after, before)]
+    return start, positions, logs, deltas, pairs, stats
+
+
+def parallel_match(df1_cols: List[np.ndarray], pair_entries: List[Dict], total_rows: int, workers: int,
+                   chunk_size: int = PARALLEL_CHUNK_SIZE,
+                   on_chunk: Optional[Callable[[int, List[str]], None]] = None,
+                   should_cancel: Optional[Callable[[], bool]] = None,
+                   on_ordered: Optional[Callable[[int, np.ndarray], None]] = None,
+                   all_matches: bool = False, row_labels: Optional[np.ndarray] = None, log_every: int = 10,
+                   on_checkpoint: Optional[Callable] = None, checkpoint_seconds: float = 0.0,
+                   stats: Optional[MatchStats] = None):
+    """多进程分块匹配表1全部行
+
+    表2索引在父进程构建一次，经 initializer 参数传给子进程：fork 时随进程继承、不经序列化，
+    否则序列化到每个子进程。
+    块完成顺序不定，结果按块起点写回原位置。on_chunk(已完成行数, 日志) 在每块完成后回调；
+    on_ordered(连续完成行数, 匹配位置数组) 在从第0行起连续完成的行数增加时回调，便于按行序流式写出；
+    should_cancel() 返回 True 时置位共享取消事件，子进程在匹配内核中途停止，随后终止进程池。
+    on_checkpoint(连续完成行数, 结果) 每隔 checkpoint_seconds 秒及取消时回调，结果为匹配位置数组
+    （仅前“连续完成行数”行有效）或这些行的全部匹配行对。stats 不为 None 时累计各块的匹配计数。
+    返回（匹配位置数组，取消时为 None；各匹配对 [命中次数, 查找次数]；
+    all_matches=True 时为按表1行序拼接的全部匹配行对，否则为 None）。
+    """
+    ctx = mp.get_context("fork" if "fork" in mp.get_all_start_methods() else "spawn")
+    cancel_event = ctx.Event()
+    state = {"df1_cols": df1_cols, "pair_entries": pair_entries, "all_matches": all_matches,
+             "row_labels": row_labels, "log_every": log_every}
+
+    tasks = [(start, min(start + chunk_size, total_rows)) for start in range(0, total_rows, chunk_size)]
+    positions = np.full(total_rows, NO_MATCH, dtype="int64")
+    cache_totals = [[0, 0] for _ in pair_entries]
+    done_rows = 0
+    chunk_pairs = {}  # 各块全部匹配行对：{起点: (表1行位置, 表2行位置)}
+    finished = {}  # 已完成块：{起点: 终点}
+    ordered_upto = 0
+    checkpoint_at = time.monotonic()
+
+    def checkpoint():
+        if on_checkpoint is None:
+            return
+        if not all_matches:
+            on_checkpoint(ordered_upto, positions)
+            return
+        ordered = [chunk_pairs[start] for start in sorted(chunk_pairs) if start < ordered_upto]
+        on_checkpoint(ordered_upto, (np.concatenate([np.empty(0, dtype="int64")] + [p[0] for p in ordered]),
+                                     np.concatenate([np.empty(0, dtype="int64")] + [p[1] for p in ordered])))
+
+    pool = ctx.Pool(processes=workers, initializer=_init_worker, initargs=(state, cancel_event))
+    try:
+        results = pool.imap_unordered(_match_chunk_task, tasks)
+        for _ in range(len(tasks)):
+            while True:
+                if should_cancel is not None and should_cancel():
+                    cancel_event.set()
+                    checkpoint()
+                    return None, cache_totals, None
+                try:
+                    start, chunk_positions, logs, deltas, pairs, chunk_stats = results.next(timeout=0.2)
+                    break
+                except mp.TimeoutError:
+                    continue
+            if chunk_positions is None:
+                checkpoint()
+                return None, cache_totals, None
+            positions[start:start + len(chunk_positions)] = chunk_positions
+            if pairs is not None:
+                chunk_pairs[start] = pairs
+            if stats is not None:
+                stats.merge(chunk_stats)
+            for total, (hits, lookups) in zip(cache_totals, deltas):
+                total[0] += hits
+                total[1] += lookups
+            done_rows += len(chunk_positions)
+            if on_chunk is not None:
+                on_chunk(done_rows, logs)
+            finished[start] = start + len(chunk_positions)
+            if start == ordered_upto:
+                while ordered_upto in finished:
+                    ordered_upto = finished.pop(ordered_upto)
+                if on_ordered is not None:
+                    on_ordered(ordered_upto, positions)
+                if checkpoint_seconds and time.monotonic() - checkpoint_at >= checkpoint_seconds:
+                    checkpoint()
+                    checkpoint_at = time.monotonic()
+        if not all_matches:
+            return positions, cache_totals, None
+        ordered = [chunk_pairs[start] for start in sorted(chunk_pairs)]
+        all_pairs = (np.concatenate([p[0] for p in ordered]), np.concatenate([p[1] for p in ordered]))
+        return positions, cache_totals, all_pairs
+    finally:
+        pool.terminate()
+        pool.join()
@@ -0,0 +1,989 @@
+# -*- coding: utf-8 -*-
+"""
+合并任务执行（不依赖界面，可在无图形环境的服务器上运行）
+- process_merge：合并主流程，界面线程与命令行共用，通过队列报告进度、日志，经共享事件取消；
+  逐行匹配期间定期保存断点，取消时写出已完成部分，再次运行时从断点继续
+- process_multi_merge：表1一次读取、与多张参照表依次匹配，全部合并列一次写出
+- explain_merge：按需重现表1指定行的匹配过程（合并本身默认不生成逐行日志字符串）
+- 合并指标：结束时汇总各阶段耗时、各匹配对索引构建耗时、查找缓存命中率与匹配计数、本次合并期间的
+  峰值内存，写入输出文件旁的 JSON 报告（<输出文件>.metrics.json）
+- run_merge：按合并任务描述（dict，可来自 JSON/YAML 文件）同步执行单个合并
+- run_batch：多个合并任务在进程池中并发执行
+"""
+
+import functools
+import json
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from merge_engine import (build_key_frame, exact_join, exact_join_all, matched_columns, normalize_column, match_chunk,
+                          explain_row, estimate_matches, parallel_match, expand_matches, aggregate_matches, PairIndex, MatchStats,
+                          NO_MATCH, DEFAULT_SIMILARITY, HASH_JOIN_RULES, MERGE_MODES, AGGREGATIONS, AGG_DTYPES,
+                          LOG_LEVELS, LOG_EVERY)
+from table_reader import read_table, count_rows, is_multi_sheet, normalize_sheet, TABLE_CACHE
+from table_writer import open_writer, WRITE_CHUNK_ROWS
+from external_join import external_exact_merge
+from index_store import INDEX_STORE
+from merge_state import (MergeState, merge_signature, row_hashes, splice_pairs, splice_positions, state_path,
+                         checkpoint_path)
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# 合并任务描述中的运行选项及默认值（与 process_merge 的关键字参数一一对应）
+DEFAULT_OPTIONS: Dict = {
+    "workers": 1,
+    "low_memory": True,
+    "out_of_core": False,
+    "merge_mode": "first",
+    "aggregations": None,
+    "reuse_index": True,
+    "incremental": False,
+    "log_level": "sample",
+    "checkpoint": True,
+}
+REQUIRED_KEYS = ("file1", "file2", "output", "match_pairs", "selected_cols")
+# 合并阶段：{名称: 说明}，各阶段耗时在合并结束时以 {"type": "phases"} 消息放入进度队列
+PHASES: Dict[str, str] = {"read": "读取", "index": "清洗与索引", "match": "匹配", "write": "写出"}
+SOURCE_KEYS = ("file2", "match_pairs", "selected_cols")  # 多参照表任务中每张参照表的必填字段
+CHECKPOINT_SECONDS = 60  # 逐行匹配期间保存断点的间隔（秒）
+METRICS_SUFFIX = ".metrics.json"  # 合并指标报告（保存在输出文件旁）
+MEMORY_SAMPLE_SECONDS = 0.2  # 合并期间采样常驻内存的间隔（秒）
+
+
+class PhaseTimer:
+    """累计各阶段耗时（秒）：同一阶段可多次进入，嵌套阶段的耗时不计入外层阶段"""
+
+    def __init__(self):
+        self.seconds: Dict[str, float] = {name: 0.0 for name in PHASES}
+        self._stack: List[List[float]] = []  # [开始时间, 嵌套阶段耗时]
+
+    @contextmanager
+    def phase(self, name: str):
+        self._stack.append([time.perf_counter(), 0.0])
+        try:
+            yield
+        finally:
+            start, nested = self._stack.pop()
+            elapsed = time.perf_counter() - start
+            self.seconds[name] = self.seconds.get(name, 0.0) + elapsed - nested
+            if self._stack:
+                self._stack[-1][1] += elapsed
+
+    def report(self, progress_queue, log_queue):
+        progress_queue.put({"type": "phases", "seconds": dict(self.seconds)})
+        log_queue.put("各阶段耗时：" + "，".join(f"{PHASES.get(name, name)}{sec:.2f}秒"
+                                             for name, sec in self.seconds.items()))
+
+
+def current_memory_mb() -> Optional[float]:
+    """当前常驻内存（MB）：有 psutil 时含子进程（多进程匹配），否则读取 /proc，无法获取时为 None"""
+    if psutil is not None:
+        process = psutil.Process()
+        rss = process.memory_info().rss
+        for child in process.children(recursive=True):
+            try:
+                rss += child.memory_info().rss
+            except psutil.Error:
+                # 子进程已退出
+                pass
+        return rss / 2 ** 20
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class MemorySampler:
+    """后台线程定时采样常驻内存，记录 start() 到 stop() 之间的峰值
+
+    进程级的 ru_maxrss 是整个进程生命期的峰值，界面或批量进程中连续多次合并时无法区分各次运行，
+    因此按次采样；采样间隔内的短暂尖峰可能漏计。
+    """
+
+    def __init__(self, interval: float = MEMORY_SAMPLE_SECONDS):
+        self.interval = interval
+        self.peak_mb: Optional[float] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def sample(self):
+        current = current_memory_mb()
+        if current is not None and (self.peak_mb is None or current > self.peak_mb):
+            self.peak_mb = current
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def start(self):
+        self.sample()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> Optional[float]:
+        """停止采样（可重复调用），返回峰值（MB）"""
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+            self.sample()
+        return self.peak_mb
+
+
+def metrics_path(output: str) -> str:
+    return output + METRICS_SUFFIX
+
+
+class MergeMetrics:
+    """一次合并的结构化指标
+
+    timer 累计各阶段耗时；memory 在 start() 与 finish()/close() 之间采样本次合并的峰值内存；
+    match_tables 每次匹配登记一项 matches：该参照表的行计数（所有条件均满足 /
+    多行同时满足 / 未满足，只统计本次实际匹配的行）与各匹配对的索引构建耗时、查找缓存命中和匹配计数。
+    """
+
+    def __init__(self):
+        self.timer = PhaseTimer()
+        self.started = time.time()
+        self.matches: List[Dict] = []
+        self.memory = MemorySampler()
+
+    def start(self):
+        self.memory.start()
+
+    def close(self):
+        self.memory.stop()
+
+    def add_match(self, file2, match_pairs, match_total, stats: MatchStats, index_seconds, cache_totals=None):
+        pairs = []
+        for k, pair in enumerate(match_pairs):
+            evaluated, satisfied, multiple = stats.pairs[k]
+            entry = {"pair": k + 1, "col1": pair["col1"], "col2": pair["col2"], "rule": pair["rule"],
+                     "index_seconds": round(index_seconds[k], 4), "evaluated": evaluated, "matched": satisfied,
+                     "ambiguous": multiple, "unmatched": evaluated - satisfied}
+            if cache_totals is not None:
+                hits, lookups = cache_totals[k]
+                entry.update(cache_hits=hits, cache_lookups=lookups,
+                             cache_hit_rate=round(hits / lookups, 4) if lookups else None)
+            pairs.append(entry)
+        self.matches.append({"file2": file2, "rows": match_total, "matched": stats.matched,
+                             "ambiguous": stats.ambiguous, "unmatched": match_total - stats.matched, "pairs": pairs})
+
+    def report(self, total_rows: int, status: str = "ok", **info) -> Dict:
+        """汇总为可写成 JSON 的报告；info 为任务信息（输入输出文件、合并方式等）"""
+        seconds = time.time() - self.started
+        match_seconds = self.timer.seconds.get("match", 0.0)
+        match_rows = sum(entry["rows"] for entry in self.matches)
+        return {
+            "status": status,
+            **info,
+            "started": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.started)),
+            "seconds": round(seconds, 3),
+            "total_rows": total_rows,
+            "rows_per_sec": round(total_rows / seconds, 1) if seconds else None,
+            "match_rows_per_sec": round(match_rows / match_seconds, 1) if match_seconds else None,
+            "phases": {name: round(sec, 4) for name, sec in self.timer.seconds.items() if sec},
+            "matches": self.matches,
+            "peak_memory_mb": round(self.memory.stop() or 0, 1) or None,
+        }
+
+    def finish(self, output, progress_queue, log_queue, total_rows, status="ok", **info) -> Dict:
+        """输出各阶段耗时与指标摘要，报告放入进度队列（{"type": "metrics"}）并写到输出文件旁
+
+        外存连接模式不分阶段计时，只报告总耗时、吞吐量与峰值内存。
+        """
+        if any(self.timer.seconds.values()):
+            self.timer.report(progress_queue, log_queue)
+        report = self.report(total_rows, status, output=output, **info)
+        progress_queue.put({"type": "metrics", "report": report})
+        memory = f"，峰值内存{report['peak_memory_mb']:.0f}MB" if report["peak_memory_mb"] else ""
+        log_queue.put(f"吞吐量：{report['rows_per_sec'] or 0:,.0f}行/秒"
+                      f"（匹配阶段{report['match_rows_per_sec'] or 0:,.0f}行/秒）{memory}")
+        with open(metrics_path(output), "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2, default=str)
+        return report
+
+
+def read_lookup_table(file2, match_pairs, selected_cols, low_memory=False, log=None, sheet_name=0) -> pd.DataFrame:
+    """读取表2；低内存模式只读取匹配列与待合并列
+
+    整表已在缓存中时直接按列序号取投影，否则只解析所需列并缓存该投影，不会载入整表。
+    """
+    if not low_memory:
+        return TABLE_CACHE.get(file2, sheet_name)
+    # 按列序号选取，避免重复列名被改写后无法对应（多工作表拼接结果的列名不重复，按列名读取）
+    cached = TABLE_CACHE.is_cached(file2, sheet_name)
+    header = list(TABLE_CACHE.head(file2, 0, sheet_name).columns) if cached else \
+        list(read_table(file2, nrows=0, sheet_name=sheet_name).columns)
+    needed = list(dict.fromkeys([pair["col2"] for pair in match_pairs] + list(selected_cols)))
+    missing = [col for col in needed if col not in header]
+    if missing:
+        raise ValueError(f"表2中不存在列：{missing}")
+    usecols = sorted(header.index(col) for col in needed)
+    if cached:
+        df2 = TABLE_CACHE.get(file2, sheet_name).iloc[:, usecols]
+    else:
+        multi = is_multi_sheet(normalize_sheet(sheet_name))
+        df2 = TABLE_CACHE.get(file2, sheet_name, usecols=[header[i] for i in usecols] if multi else usecols)
+    if log is not None:
+        log(f"低内存模式：表2仅读取{len(needed)}/{len(header)}列")
+    return df2
+
+
+def _pair_index(df2, file2, pair, pair_idx, reuse_index=False, log=None, sheet_name=0) -> PairIndex:
+    """构建（或从本地缓存载入）匹配对的表2索引"""
+    rule, threshold = pair["rule"], pair.get("threshold", DEFAULT_SIMILARITY)
+
+    def build():
+        return PairIndex(normalize_column(df2[pair["col2"]], rule), rule, threshold=threshold)
+
+    if not reuse_index:
+        return build()
+    pair_index, cached = INDEX_STORE.get_or_build(file2, pair["col2"], rule, build, threshold=threshold,
+                                                  sheet_name=normalize_sheet(sheet_name))
+    if log is not None:
+        log(f"匹配对{pair_idx}：{'载入已保存的表2索引' if cached else '表2索引已保存，下次直接复用'}")
+    return pair_index
+
+
+def match_tables(keys1, df2, file2, match_pairs, merge_mode="first", workers=1, low_memory=False,
+                 reuse_index=False, row_labels=None, log=None, on_progress=None, cancel_event=None,
+                 on_ordered=None, log_level="sample", sheet2=0, metrics=None, on_checkpoint=None,
+                 checkpoint_seconds=CHECKPOINT_SECONDS):
+    """表1规范键（build_key_frame 的结果）与表2多条件联合匹配
+
+    全部为完全相同/行政区名规则时一次哈希连接，否则构建表2索引逐行（或多进程分块）匹配。
+    返回值：first 方式为表1各行匹配的表2行号数组，其余方式为全部匹配行对（表1行位置, 表2行位置）；
+    取消时返回 None。on_progress(已处理行数, 总行数) 报告进度；on_ordered(连续完成行数, 行号数组)
+    仅 first 方式调用，便于按行序边匹配边写出。row_labels 为逐行日志中显示的表1行号（默认为行位置）。
+    cancel_event（threading.Event）置位后，匹配内核在 CANCEL_CHECK_ROWS 行内停止。
+    on_checkpoint(连续完成行数, 结果) 在逐行匹配期间每 checkpoint_seconds 秒及取消时调用，
+    结果与返回值形式相同（first 方式仅前“连续完成行数”行有效），用于保存断点与写出部分结果。
+    log_level：逐行日志级别（见 LOG_LEVELS），summary 时匹配内核不生成任何逐行日志字符串。
+    sheet2 为表2的工作表选择（用于区分已保存的索引）。metrics（MergeMetrics）记录各阶段耗时，
+    匹配完成（未取消）时登记各匹配对的索引构建耗时、查找缓存命中与匹配计数。
+    """
+    log = log or (lambda msg: None)
+    metrics = metrics or MergeMetrics()
+    timer = metrics.timer
+    log_every = LOG_EVERY[log_level]
+    on_progress = on_progress or (lambda done, total: None)
+    cancel_event = cancel_event or threading.Event()
+    match_total = len(keys1)
+    positions = np.full(match_total, NO_MATCH, dtype="int64")
+    all_pairs = (np.empty(0, dtype="int64"), np.empty(0, dtype="int64"))
+    stats = MatchStats(len(match_pairs))
+    index_seconds = [0.0] * len(match_pairs)
+
+    # 1. 全部为完全相同/行政区名规则：多列规范键一次哈希连接
+    if all(pair["rule"] in HASH_JOIN_RULES for pair in match_pairs):
+        if cancel_event.is_set():
+            return None
+        keys2 = {}
+        for i, pair in enumerate(match_pairs):
+            start = time.perf_counter()
+            with timer.phase("index"):
+                if reuse_index:
+                    keys2[f"k{i}"] = _pair_index(df2, file2, pair, i + 1, reuse_index, log, sheet2).keys()
+                    if low_memory:
+                        keys2[f"k{i}"] = pd.Categorical(keys2[f"k{i}"])
+                else:
+                    keys2[f"k{i}"] = normalize_column(df2[pair["col2"]], pair["rule"], low_memory).to_numpy()
+            index_seconds[i] = time.perf_counter() - start
+        keys2 = pd.DataFrame(keys2)
+        if merge_mode == "first":
+            positions = exact_join(keys1, keys2, stats)
+            log(f"完全相同规则哈希连接：{stats.matched}/{match_total}行所有条件均满足")
+        else:
+            all_pairs = exact_join_all(keys1, keys2, stats)
+        metrics.add_match(file2, match_pairs, match_total, stats, index_seconds)
+        on_progress(match_total, match_total)
+        return positions if merge_mode == "first" else all_pairs
+    if not match_total:
+        metrics.add_match(file2, match_pairs, match_total, stats, index_seconds)
+        return positions if merge_mode == "first" else all_pairs
+
+    # 2. 含模糊规则：预处理匹配列并构建索引（含查找结果缓存）
+    df1_cols = [keys1[f"k{i}"].to_numpy(dtype=object) for i in range(len(match_pairs))]
+    pair_entries = []
+    for pair_idx, pair in enumerate(match_pairs, 1):
+        col1, col2, rule = pair["col1"], pair["col2"], pair["rule"]
+        threshold = pair.get("threshold", DEFAULT_SIMILARITY)
+        start = time.perf_counter()
+        with timer.phase("index"):
+            pair_index = _pair_index(df2, file2, pair, pair_idx, reuse_index, log, sheet2)
+        index_seconds[pair_idx - 1] = time.perf_counter() - start
+        rule_desc = f"{rule}≥{threshold}" if rule == "similarity" else rule
+        log(f"匹配对{pair_idx}（{col1}→{col2}，{rule_desc}）：表2共{len(pair_index)}个唯一值")
+        pair_entries.append({"pair_idx": pair_idx, "rule": rule, "pair_index": pair_index})
+
+    # 3. 处理数据（核心：多条件联合匹配）
+    if workers > 1:
+        # 多进程分块并行匹配
+        log(f"启用多进程匹配：{workers}个进程")
+
+        def on_chunk(done_rows, logs):
+            for row_log in logs:
+                log(row_log)
+            on_progress(done_rows, match_total)
+
+        positions, cache_totals, chunk_all_pairs = parallel_match(
+            df1_cols, pair_entries, match_total, workers, on_chunk=on_chunk, should_cancel=cancel_event.is_set,
+            on_ordered=on_ordered if merge_mode == "first" else None,
+            all_matches=merge_mode != "first", row_labels=row_labels, log_every=log_every,
+            on_checkpoint=on_checkpoint, checkpoint_seconds=checkpoint_seconds, stats=stats)
+        if positions is None:
+            return None
+        if chunk_all_pairs is not None:
+            all_pairs = chunk_all_pairs
+    else:
+        chunk_pairs = []
+        ordered = 0
+        checkpoint_at = time.monotonic()
+        batch_size = 100
+
+        def checkpoint(done):
+            if on_checkpoint is not None:
+                on_checkpoint(done, positions if merge_mode == "first" else _concat_pairs(chunk_pairs))
+
+        for i in range(0, match_total, batch_size):
+            end = min(i + batch_size, match_total)
+            chunk_positions, logs, pairs = match_chunk(df1_cols, pair_entries, i, end, log_every=log_every,
+                                                       all_matches=merge_mode != "first",
+                                                       row_labels=row_labels, cancel_event=cancel_event,
+                                                       stats=stats)
+            # 按日志级别输出抽样行的匹配过程
+            for row_log in logs:
+                log(row_log)
+            # 匹配内核响应取消：本批作废，报告此前已完成的行
+            if chunk_positions is None:
+                checkpoint(i)
+                return None
+            positions[i:end] = chunk_positions
+
+            if pairs is not None:
+                chunk_pairs.append(pairs)
+            elif on_ordered is not None and (end - ordered >= WRITE_CHUNK_ROWS or end == match_total):
+                on_ordered(end, positions)
+                ordered = end
+            if checkpoint_seconds and time.monotonic() - checkpoint_at >= checkpoint_seconds:
+                checkpoint(end)
+                checkpoint_at = time.monotonic()
+
+            # 更新进度
+            on_progress(end, match_total)
+        cache_totals = [list(data["pair_index"].cache_stats()) for data in pair_entries]
+        if chunk_pairs:
+            all_pairs = _concat_pairs(chunk_pairs)
+
+    # 查找缓存命中率
+    for data, (hits, total) in zip(pair_entries, cache_totals):
+        rate = hits / total * 100 if total else 0.0
+        log(f"匹配对{data['pair_idx']}查找缓存命中率：{rate:.1f}%（{hits}/{total}次）")
+    metrics.add_match(file2, match_pairs, match_total, stats, index_seconds, cache_totals)
+    return positions if merge_mode == "first" else all_pairs
+
+
+def _concat_pairs(chunk_pairs: List[Tuple[np.ndarray, np.ndarray]]) -> Tuple[np.ndarray, np.ndarray]:
+    """按顺序拼接各块的匹配行对"""
+    empty = np.empty(0, dtype="int64")
+    return (np.concatenate([empty] + [p[0] for p in chunk_pairs]),
+            np.concatenate([empty] + [p[1] for p in chunk_pairs]))
+
+
+def _check_merge_mode(merge_mode, selected_cols, aggregations, log_level="sample"):
+    """校验合并方式与日志级别，聚合方式下补全各合并列的聚合函数（未指定的列取首个）"""
+    if log_level not in LOG_LEVELS:
+        raise ValueError(f"未知的日志级别：{log_level}")
+    if merge_mode not in MERGE_MODES:
+        raise ValueError(f"未知的合并方式：{merge_mode}")
+    if merge_mode != "aggregate":
+        return aggregations
+    aggregations = {col: (aggregations or {}).get(col, "first") for col in selected_cols}
+    unknown = sorted(set(aggregations.values()) - set(AGGREGATIONS))
+    if unknown:
+        raise ValueError(f"未知的聚合函数：{unknown}")
+    return aggregations
+
+
+def process_merge(file1, file2, output, match_pairs, selected_cols, progress_queue, log_queue,
+                  workers=1, low_memory=False, out_of_core=False, merge_mode="first", aggregations=None,
+                  reuse_index=False, incremental=False, log_level="sample", sheet1=0, sheet2=0,
+                  cancel_event=None, checkpoint=True):
+    """线程中的数据处理逻辑（多条件联合匹配）
+
+    merge_mode：first 取首个匹配行（默认）/ all 展开全部匹配行 / aggregate 按 aggregations
+    （{合并列: sum/mean/count/first/last/concat}，未指定的列取首个）聚合全部匹配行。
+    reuse_index：表2索引按文件内容哈希保存到本地缓存，同一参照表再次合并时直接载入。
+    incremental：匹配结果保存在输出文件旁，再次合并时只重新匹配匹配键新增或变化的表1行。
+    log_level：逐行日志级别 summary 仅汇总 / sample 每10行抽样（默认）/ all 全部行。
+    sheet1/sheet2：Excel 工作表选择，序号或名称、名称元组（多个）或 "*"（全部），多个工作表纵向拼接。
+    cancel_event：取消事件（threading.Event），唯一的取消方式，置位后匹配内核在数十行内停止。
+    checkpoint：逐行匹配期间每 CHECKPOINT_SECONDS 秒及取消时保存已完成行的匹配结果（断点），
+    取消时写出已完成的行；再次运行相同任务时从断点继续，合并完成后删除断点。
+    合并完成（或取消并写出部分结果）时放入 {"type": "metrics"} 报告并写到输出文件旁（见 MergeMetrics）。
+    """
+    metrics = MergeMetrics()
+    metrics.start()
+    try:
+        aggregations = _check_merge_mode(merge_mode, selected_cols, aggregations, log_level)
+        timer = metrics.timer
+        info = {"file1": file1, "file2": file2, "merge_mode": merge_mode, "workers": workers,
+                "match_pairs": match_pairs}
+        cancel_event = cancel_event or threading.Event()
+
+        # 外存模式：分块入库连接，不整表载入内存（仅完全相同/行政区名规则）
+        if out_of_core:
+            if merge_mode != "first":
+                raise ValueError("外存连接模式仅支持“取首个匹配行”合并方式")
+            if incremental:
+                raise ValueError("外存连接模式不支持增量合并")
+            sheet1, sheet2 = normalize_sheet(sheet1), normalize_sheet(sheet2)
+            if is_multi_sheet(sheet1) or is_multi_sheet(sheet2):
+                raise ValueError("外存连接模式只能读取单个工作表")
+            # xlsx/parquet 可从元数据取得总行数，其余格式按已处理行数显示
+            ext = os.path.splitext(file1)[1].lower()
+            total_hint = count_rows(file1, sheet1) if ext in (".xlsx", ".xlsm", ".parquet", ".pq") else 0
+
+            def on_progress(done_rows):
+                progress_queue.put({"type": "progress", "processed": done_rows,
+                                    "total": max(total_hint, done_rows)})
+
+            log_queue.put(f"外存连接模式：分块读取，共{len(match_pairs)}个匹配条件")
+            result = external_exact_merge(file1, file2, output, match_pairs, selected_cols,
+                                          on_progress=on_progress, should_cancel=cancel_event.is_set,
+                                          log=log_queue.put, sheet1=sheet1, sheet2=sheet2)
+            if result is None:
+                log_queue.put("合并已取消")
+                return
+            total_rows, matched_rows = result
+            log_queue.put(f"外存连接：{matched_rows}/{total_rows}行所有条件均满足")
+            metrics.finish(output, progress_queue, log_queue, total_rows, out_of_core=True,
+                           matched_rows=matched_rows, **info)
+            log_queue.put(f"合并完成，共处理{total_rows}行（仅保留所有条件都满足的记录）")
+            return
+
+        # 1. 读取数据
+        with timer.phase("read"):
+            df1 = TABLE_CACHE.get(file1, sheet1)
+            df2 = read_lookup_table(file2, match_pairs, selected_cols, low_memory, log_queue.put, sheet2)
+        total_rows = len(df1)
+        if total_rows == 0 or len(df2) == 0:
+            raise ValueError("文件无数据")
+
+        log_queue.put(f"开始多条件联合匹配（共{len(match_pairs)}个匹配条件）")
+
+        # 2. 准备合并列与流式输出
+        # 原先整表 dropna 删除全空列；流式写出时提前确定：表1原有全空列、表2来源列全空的合并列不输出
+        target_cols = {col: f"{col}_from_file2" for col in selected_cols}
+        keep_idx = [i for i in range(df1.shape[1]) if df1.iloc[:, i].notna().any()]
+        df1_out = df1.iloc[:, keep_idx]
+        out_targets = [target_cols[col] for col in selected_cols if df2[col].notna().any()]
+        # 合并列沿用表2来源列的类型，聚合列按聚合函数确定（Parquet 按此确定列结构）
+        def target_dtype(col):
+            if merge_mode == "aggregate":
+                return AGG_DTYPES.get(aggregations[col], df2[col].dtype)
+            return df2[col].dtype
+
+        template = pd.concat([df1_out.head(0)] + [pd.Series(dtype=target_dtype(col), name=target_cols[col])
+                                                   for col in selected_cols if target_cols[col] in out_targets],
+                             axis=1)
+        written = 0
+
+        @timer.phase("write")
+        def write_upto(upto, positions):
+            """把表1第 written 行至 upto 行（含匹配结果）分块写出"""
+            nonlocal written
+            for start in range(written, upto, WRITE_CHUNK_ROWS):
+                end = min(start + WRITE_CHUNK_ROWS, upto)
+                extra = matched_columns(df2, positions[start:end], selected_cols, target_cols)[out_targets]
+                writer.write(pd.concat([df1_out.iloc[start:end].reset_index(drop=True), extra], axis=1))
+            written = max(written, upto)
+
+        @timer.phase("write")
+        def write_rows(rows, positions):
+            """取消时写出已完成的表1行（升序行号，含匹配结果）"""
+            for start in range(0, len(rows), WRITE_CHUNK_ROWS):
+                part = rows[start:start + WRITE_CHUNK_ROWS]
+                extra = matched_columns(df2, positions[part], selected_cols, target_cols)[out_targets]
+                writer.write(pd.concat([df1_out.iloc[part].reset_index(drop=True), extra], axis=1))
+
+        @timer.phase("write")
+        def write_all_matches(pos1, pos2, rows=None):
+            """展开/聚合方式：由全部匹配行对生成合并列并分块写出（rows 为只写出的表1行，默认全部）"""
+            matched_rows = len(np.unique(pos1))
+            log_queue.put(f"共{matched_rows}/{total_rows if rows is None else len(rows)}行所有条件均满足，"
+                          f"匹配行对{len(pos1)}个（{MERGE_MODES[merge_mode]}）")
+            if merge_mode == "all":
+                out_rows, positions = expand_matches(pos1, pos2, total_rows)
+                if rows is not None:
+                    keep = np.isin(out_rows, rows)
+                    out_rows, positions = out_rows[keep], positions[keep]
+                for start in range(0, len(out_rows), WRITE_CHUNK_ROWS):
+                    part = slice(start, start + WRITE_CHUNK_ROWS)
+                    extra = matched_columns(df2, positions[part], selected_cols, target_cols)[out_targets]
+                    writer.write(pd.concat([df1_out.iloc[out_rows[part]].reset_index(drop=True), extra], axis=1))
+            else:
+                agg = aggregate_matches(df2, pos1, pos2, total_rows, aggregations, target_cols)[out_targets]
+                rows = np.arange(total_rows) if rows is None else rows
+                for start in range(0, len(rows), WRITE_CHUNK_ROWS):
+                    part = rows[start:start + WRITE_CHUNK_ROWS]
+                    writer.write(pd.concat([df1_out.iloc[part].reset_index(drop=True),
+                                            agg.iloc[part].reset_index(drop=True)], axis=1))
+
+        # 增量模式/断点续跑：匹配键未变的行沿用已有结果（上次合并状态或断点），只匹配其余行（todo 为需匹配的表1行）
+        # 断点只用于逐行匹配，哈希连接一次完成无需断点
+        hash_join = all(pair["rule"] in HASH_JOIN_RULES for pair in match_pairs)
+        checkpoint = checkpoint and not hash_join
+        with timer.phase("index"):
+            keys1 = build_key_frame(df1, match_pairs, "col1", as_category=low_memory and hash_join)
+        todo = np.arange(total_rows)
+        previous = None
+        if incremental or checkpoint:
+            signature = merge_signature(INDEX_STORE.file_digest(file2), match_pairs, merge_mode, normalize_sheet(sheet2))
+            hashes = row_hashes(keys1)
+            source = "断点续跑"
+            if checkpoint:
+                previous = MergeState.load(checkpoint_path(output), signature)
+            if previous is None and incremental:
+                source = "增量模式"
+                previous = MergeState.load(state_path(output), signature) or MergeState.empty()
+            if previous is not None:
+                prev_rows = previous.previous_rows(hashes)
+                todo = np.flatnonzero(prev_rows < 0)
+                keys1 = keys1.iloc[todo].reset_index(drop=True)
+                log_queue.put(f"{source}：沿用上次结果{total_rows - len(todo)}行，重新匹配{len(todo)}行")
+
+        def splice(result):
+            """拼接沿用行的已有结果（无已有结果时原样返回）"""
+            if previous is None:
+                return result
+            if merge_mode == "first":
+                return splice_positions(previous, prev_rows, todo, result)
+            return splice_pairs(previous, prev_rows, todo, *result)
+
+        partial = None  # 最近一次断点：（已完成的表1行, 拼接后的匹配结果）
+
+        def on_checkpoint(done, result):
+            """保存断点：已完成的行为沿用行与 todo 的前 done 行"""
+            nonlocal partial
+            rows = todo[:done] if previous is None else np.union1d(np.flatnonzero(prev_rows >= 0), todo[:done])
+            if not len(rows):
+                # 尚无完成的行，不保存空断点
+                return
+            merged = splice(result)
+            partial = (rows, merged)
+            state = (MergeState.from_completed(hashes, rows, positions=merged) if merge_mode == "first"
+                     else MergeState.from_completed(hashes, rows, pairs=merged))
+            state.save(checkpoint_path(output), signature)
+
+        def on_progress(done, total):
+            progress_queue.put({
+                "type": "progress",
+                "processed": done,
+                "total": total
+            })
+
+        with timer.phase("write"):
+            writer = open_writer(output, template)
+        try:
+            # 3. 匹配：无已有结果时按行序边匹配边写出；否则需先拼接已有结果，匹配完成后统一写出
+            with timer.phase("match"):
+                result = match_tables(keys1, df2, file2, match_pairs, merge_mode, workers=workers,
+                                      low_memory=low_memory, reuse_index=reuse_index,
+                                      row_labels=None if previous is None else todo, log=log_queue.put,
+                                      on_progress=on_progress, cancel_event=cancel_event,
+                                      on_ordered=write_upto if previous is None else None, log_level=log_level,
+                                      sheet2=sheet2, metrics=metrics,
+                                      on_checkpoint=on_checkpoint if checkpoint else None,
+                                      checkpoint_seconds=CHECKPOINT_SECONDS)
+            if result is None:
+                # 取消：写出已完成的行（边匹配边写出时只需补写其后的部分），保留断点
+                if partial is None or not len(partial[0]):
+                    writer.abort()
+                    log_queue.put("合并已取消")
+                    return
+                rows, merged = partial
+                if merge_mode == "first":
+                    write_rows(rows[rows >= written], merged)
+                else:
+                    write_all_matches(*merged, rows=rows)
+                with timer.phase("write"):
+                    writer.close()
+                metrics.finish(output, progress_queue, log_queue, total_rows, status="cancelled",
+                               completed_rows=len(rows), **info)
+                log_queue.put(f"合并已取消：已写出完成的{len(rows)}/{total_rows}行，断点已保存，"
+                              f"再次运行相同任务将从断点继续")
+                return
+
+            # 4. 拼接已有结果并写出剩余部分
+            if merge_mode == "first":
+                positions = splice(result)
+                write_upto(total_rows, positions)
+            else:
+                all_pairs = splice(result)
+                write_all_matches(*all_pairs)
+
+            # 5. 完成输出文件，增量模式保存本次匹配结果，删除断点
+            with timer.phase("write"):
+                writer.close()
+            if incremental:
+                state = (MergeState.from_positions(hashes, positions) if merge_mode == "first"
+                         else MergeState.from_pairs(hashes, *all_pairs))
+                state.save(state_path(output), signature)
+            if checkpoint and os.path.exists(checkpoint_path(output)):
+                os.remove(checkpoint_path(output))
+        except Exception:
+            writer.abort()
+            raise
+        metrics.finish(output, progress_queue, log_queue, total_rows, reused_rows=total_rows - len(todo), **info)
+        log_queue.put(f"合并完成，共处理{total_rows}行（仅保留所有条件都满足的记录）")
+
+    except Exception as e:
+        log_queue.put(f"错误：{str(e)}")
+        progress_queue.put({"type": "error", "msg": str(e)})
+    finally:
+        metrics.close()
+
+
+def process_multi_merge(file1, sources, output, progress_queue, log_queue,
+                        workers=1, low_memory=False, out_of_core=False, merge_mode="first", aggregations=None,
+                        reuse_index=False, incremental=False, log_level="sample", sheet1=0, cancel_event=None,
+                        checkpoint=False):
+    """表1同时与多张参照表合并：表1只读取一次，各参照表依次建索引匹配，全部合并列一次写出
+
+    sources 为参照表列表，每项 {"file2", "match_pairs", "selected_cols", "aggregations"（可选）, "sheet"（可选）}；
+    第 k 张参照表（从 1 起）的合并列命名为“列名_from_file{k + 1}”，第一张与单表合并一致。
+    merge_mode 仅支持 first / aggregate（展开方式在多张参照表间会产生笛卡尔积）；
+    aggregations 为各参照表未单独指定时的默认聚合函数。外存连接、增量合并与断点续跑仅支持单参照表。
+    cancel_event 与 process_merge 相同，取消时不写出部分结果；checkpoint 选项不起作用（不保存断点）。
+    """
+    metrics = MergeMetrics()
+    metrics.start()
+    try:
+        if merge_mode == "all":
+            raise ValueError("多参照表合并不支持“展开全部匹配行”合并方式")
+        if out_of_core:
+            raise ValueError("外存连接模式仅支持单参照表合并")
+        if incremental:
+            raise ValueError("增量合并仅支持单参照表合并")
+        if not sources:
+            raise ValueError("未指定参照表")
+
+        cancel_event = cancel_event or threading.Event()
+
+        # 1. 读取表1（各参照表共用）
+        timer = metrics.timer
+        with timer.phase("read"):
+            df1 = TABLE_CACHE.get(file1, sheet1)
+        total_rows = len(df1)
+        if total_rows == 0:
+            raise ValueError("文件无数据")
+        keep_idx = [i for i in range(df1.shape[1]) if df1.iloc[:, i].notna().any()]
+        df1_out = df1.iloc[:, keep_idx]
+        log_queue.put(f"多参照表合并：共{len(sources)}张参照表")
+
+        # 2. 逐张参照表匹配，只保留匹配结果（first 为行号数组，aggregate 为聚合后的合并列）
+        merged = []
+        for k, source in enumerate(sources, 1):
+            file2, match_pairs, selected_cols = source["file2"], source["match_pairs"], source["selected_cols"]
+            source_aggs = _check_merge_mode(merge_mode, selected_cols, source.get("aggregations") or aggregations,
+                                            log_level)
+            sheet2 = source.get("sheet", 0)
+            with timer.phase("read"):
+                df2 = read_lookup_table(file2, match_pairs, selected_cols, low_memory, log_queue.put, sheet2)
+            if len(df2) == 0:
+                raise ValueError(f"参照表{k}无数据：{file2}")
+            log_queue.put(f"参照表{k}（{os.path.basename(file2)}）：开始多条件联合匹配"
+                          f"（共{len(match_pairs)}个匹配条件）")
+
+            def on_progress(done, total, offset=(k - 1) * total_rows):
+                progress_queue.put({
+                    "type": "progress",
+                    "processed": offset + done * total_rows // max(total, 1),
+                    "total": total_rows * len(sources)
+                })
+
+            hash_join = all(pair["rule"] in HASH_JOIN_RULES for pair in match_pairs)
+            with timer.phase("index"):
+                keys1 = build_key_frame(df1, match_pairs, "col1", as_category=low_memory and hash_join)
+            with timer.phase("match"):
+                result = match_tables(keys1, df2, file2, match_pairs, merge_mode, workers=workers,
+                                      low_memory=low_memory, reuse_index=reuse_index, log=log_queue.put,
+                                      on_progress=on_progress, cancel_event=cancel_event, log_level=log_level,
+                                      sheet2=sheet2, metrics=metrics)
+            if result is None:
+                log_queue.put("合并已取消")
+                return
+            metrics.matches[-1]["source"] = k
+
+            target_cols = {col: f"{col}_from_file{k + 1}" for col in selected_cols}
+            out_cols = [col for col in selected_cols if df2[col].notna().any()]
+            if merge_mode == "first":
+                matched_rows = int((result != NO_MATCH).sum())
+                # 只保留输出需要的列，其余列随 df2 释放
+                merged.append((df2[out_cols], result, {col: target_cols[col] for col in out_cols}))
+            else:
+                pos1, pos2 = result
+                matched_rows = len(np.unique(pos1))
+                agg = aggregate_matches(df2, pos1, pos2, total_rows, source_aggs, target_cols)
+                merged.append((agg[[target_cols[col] for col in out_cols]], None, None))
+            log_queue.put(f"参照表{k}：{matched_rows}/{total_rows}行所有条件均满足")
+
+        # 3. 一次写出表1与全部合并列
+        columns = [df1_out.head(0)]
+        for values, positions, targets in merged:
+            if positions is None:
+                columns.append(values.head(0))
+            else:
+                columns.extend(pd.Series(dtype=values[col].dtype, name=targets[col]) for col in values.columns)
+        with timer.phase("write"):
+            writer = open_writer(output, pd.concat(columns, axis=1))
+            try:
+                for start in range(0, total_rows, WRITE_CHUNK_ROWS):
+                    end = min(start + WRITE_CHUNK_ROWS, total_rows)
+                    parts = [df1_out.iloc[start:end].reset_index(drop=True)]
+                    for values, positions, targets in merged:
+                        if positions is None:
+                            parts.append(values.iloc[start:end].reset_index(drop=True))
+                        else:
+                            parts.append(matched_columns(values, positions[start:end], list(values.columns),
+                                                         targets))
+                    writer.write(pd.concat(parts, axis=1))
+                writer.close()
+            except Exception:
+                writer.abort()
+                raise
+        metrics.finish(output, progress_queue, log_queue, total_rows, file1=file1, merge_mode=merge_mode,
+                       workers=workers, sources=[{key: source.get(key) for key in ("file2", "match_pairs")}
+                                                 for source in sources])
+        log_queue.put(f"合并完成，共处理{total_rows}行（仅保留所有条件都满足的记录）")
+
+    except Exception as e:
+        log_queue.put(f"错误：{str(e)}")
+        progress_queue.put({"type": "error", "msg": str(e)})
+    finally:
+        metrics.close()
+
+
+def parse_rows(text: str) -> List[int]:
+    """解析行号列表，如 "5,12,100-105"（从1起，与逐行日志一致）"""
+    rows = []
+    for part in text.replace("，", ",").split(","):
+        part = part.strip()
+        if "-" in part:
+            first, last = (int(x) for x in part.split("-", 1))
+            rows.extend(range(first, last + 1))
+        elif part:
+            rows.append(int(part))
+    if not rows:
+        raise ValueError("未指定行号")
+    return rows
+
+
+def explain_merge(file1, file2, match_pairs, rows, merge_mode="first", low_memory=True, reuse_index=True,
+                  log=None, sheet1=0, sheet2=0) -> List[str]:
+    """按需解释表1指定行（从1起的行号，与逐行日志一致）的多条件匹配过程，返回各行说明
+
+    只对指定行清洗匹配键，表2索引与合并时相同（reuse_index 时直接载入已保存的索引）。
+    """
+    df1 = TABLE_CACHE.get(file1, sheet1)
+    invalid = [row for row in rows if not 1 <= row <= len(df1)]
+    if invalid:
+        raise ValueError(f"表1行号超出范围（1~{len(df1)}）：{invalid}")
+    positions = np.asarray(rows, dtype="int64") - 1
+    df2 = read_lookup_table(file2, match_pairs, [], low_memory, log, sheet2)
+    keys1 = build_key_frame(df1.iloc[positions], match_pairs, "col1")
+    df1_cols = [keys1[f"k{i}"].to_numpy(dtype=object) for i in range(len(match_pairs))]
+    pair_entries = [{"pair_idx": pair_idx, "rule": pair["rule"],
+                     "pair_index": _pair_index(df2, file2, pair, pair_idx, reuse_index, log, sheet2)}
+                    for pair_idx, pair in enumerate(match_pairs, 1)]
+    return [explain_row(df1_cols, pair_entries, i, int(positions[i]), merge_mode != "first")
+            for i in range(len(positions))]
+
+
+def estimate_merge(file1, file2, match_pairs, low_memory=True, reuse_index=True, sheet1=0, sheet2=0) -> Dict:
+    """试运行：表1抽样估计匹配率与耗时（返回值见 estimate_matches）
+
+    reuse_index 时优先使用已保存的表2索引，所有匹配对都有已保存索引时不读取表2；
+    否则只读取表2匹配列（低内存模式）并按 estimate_matches 的规则构建或抽样构建索引。
+    """
+    df1 = TABLE_CACHE.get(file1, sheet1)
+    stored = [INDEX_STORE.find(file2, pair["col2"], pair["rule"], pair.get("threshold", DEFAULT_SIMILARITY),
+                               normalize_sheet(sheet2)) if reuse_index else None for pair in match_pairs]
+    df2 = None if all(index is not None for index in stored) else \
+        read_lookup_table(file2, match_pairs, [], low_memory, sheet_name=sheet2)
+    return estimate_matches(df1, df2, match_pairs, pair_indexes=stored)
+
+
+class _CallbackQueue:
+    """只实现 put() 的队列替身：消息直接交给回调处理"""
+
+    def __init__(self, callback: Callable):
+        self.callback = callback
+
+    def put(self, item):
+        self.callback(item)
+
+
+def normalize_spec(spec: Dict, base_dir: Optional[str] = None) -> Dict:
+    """校验合并任务描述并补全默认选项，相对路径按 base_dir（任务文件所在目录）解析
+
+    任务描述格式：
+        {"file1": ..., "file2": ..., "output": ...,
+         "match_pairs": [{"col1": ..., "col2": ..., "rule": "exact/admin_name/fuzzy/similarity", "threshold": 0.85}],
+         "selected_cols": [...],
+         "options": {"workers": 1, "merge_mode": "first", ...}}
+    多参照表任务以 "sources": [{"file2", "match_pairs", "selected_cols", "aggregations", "sheet"}, ...]
+    代替 file2/match_pairs/selected_cols。可选 "sheet1"/"sheet2"（参照表为 "sheet"）选择 Excel 工作表：
+    序号或名称、名称列表或 "*"（全部工作表，纵向拼接并增加来源工作表列），默认第一个工作表。
+    """
+    multi = "sources" in spec
+    required = ("file1", "output", "sources") if multi else REQUIRED_KEYS
+    missing = [key for key in required if not spec.get(key)]
+    if missing:
+        raise ValueError(f"合并任务缺少字段：{missing}")
+    options = dict(DEFAULT_OPTIONS)
+    unknown = sorted(set(spec.get("options") or {}) - set(DEFAULT_OPTIONS))
+    if unknown:
+        raise ValueError(f"未知的运行选项：{unknown}")
+    options.update(spec.get("options") or {})
+
+    def resolve(path):
+        path = os.path.expanduser(str(path))
+        return os.path.join(base_dir, path) if base_dir and not os.path.isabs(path) else path
+
+    def check_pairs(match_pairs, prefix=""):
+        for i, pair in enumerate(match_pairs, 1):
+            if not pair.get("col1") or not pair.get("col2"):
+                raise ValueError(f"{prefix}第{i}对匹配列未完整填写")
+        return [dict(pair, rule=pair.get("rule", "exact")) for pair in match_pairs]
+
+    result = dict(spec)
+    for key in ("file1", "output"):
+        result[key] = resolve(spec[key])
+    if multi:
+        sources = []
+        for k, source in enumerate(spec["sources"], 1):
+            missing = [key for key in SOURCE_KEYS if not source.get(key)]
+            if missing:
+                raise ValueError(f"参照表{k}缺少字段：{missing}")
+            sources.append(dict(source, file2=resolve(source["file2"]), sheet=normalize_sheet(source.get("sheet", 0)),
+                                match_pairs=check_pairs(source["match_pairs"], f"参照表{k}")))
+        result["sources"] = sources
+    else:
+        result["file2"] = resolve(spec["file2"])
+        result["sheet2"] = normalize_sheet(spec.get("sheet2", 0))
+        result["match_pairs"] = check_pairs(spec["match_pairs"])
+    result["sheet1"] = normalize_sheet(spec.get("sheet1", 0))
+    result["options"] = options
+    return result
+
+
+def load_spec(path: str) -> Tuple[List[Dict], Optional[int]]:
+    """读取 JSON/YAML 任务文件，返回（合并任务列表, 并发进程数）
+
+    文件可为单个任务描述，或批量格式 {"defaults": {...}, "jobs": [...], "max_workers": 4}，
+    defaults 中的字段（含 options）作为各任务的默认值。YAML 需安装 pyyaml。
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        if os.path.splitext(path)[1].lower() in (".yaml", ".yml"):
+            try:
+                import yaml
+            except ImportError:
+                raise ValueError("读取 YAML 任务文件需要安装 pyyaml：pip install pyyaml")
+            data = yaml.safe_load(f)
+        else:
+            data = json.load(f)
+    base_dir = os.path.dirname(os.path.abspath(path))
+    if "jobs" not in data:
+        return [normalize_spec(data, base_dir)], None
+    defaults = data.get("defaults") or {}
+    jobs = []
+    for job in data["jobs"]:
+        merged = {**defaults, **job, "options": {**(defaults.get("options") or {}), **(job.get("options") or {})}}
+        jobs.append(normalize_spec(merged, base_dir))
+    return jobs, data.get("max_workers")
+
+
+def run_merge(spec: Dict, log: Optional[Callable[[str], None]] = None) -> Dict:
+    """同步执行一个合并任务，返回 {"output", "status": "ok"/"error", "error", "seconds", "metrics"}
+
+    log 接收 process_merge 的全部日志（默认丢弃）；任务描述格式见 normalize_spec。
+    """
+    spec = normalize_spec(spec)
+    errors = []
+    reports = []
+
+    def on_progress(item):
+        if isinstance(item, dict) and item.get("type") == "error":
+            errors.append(item["msg"])
+        elif isinstance(item, dict) and item.get("type") == "metrics":
+            reports.append(item["report"])
+
+    start = time.time()
+    queues = (_CallbackQueue(on_progress), _CallbackQueue(log or (lambda msg: None)))
+    if "sources" in spec:
+        process_multi_merge(spec["file1"], spec["sources"], spec["output"], *queues, sheet1=spec["sheet1"],
+                            **spec["options"])
+    else:
+        process_merge(spec["file1"], spec["file2"], spec["output"], spec["match_pairs"], spec["selected_cols"],
+                      *queues, sheet1=spec["sheet1"], sheet2=spec["sheet2"], **spec["options"])
+    return {
+        "output": spec["output"],
+        "status": "error" if errors else "ok",
+        "error": errors[0] if errors else None,
+        "seconds": time.time() - start,
+        "metrics": reports[-1] if reports else None,
+    }
+
+
+def _print_log(prefix: str, verbose: bool, msg: str):
+    """批量任务的日志输出：默认省略逐行匹配明细"""
+    if verbose or not msg.startswith("行"):
+        print(f"{prefix}{msg}", flush=True)
+
+
+def run_batch(specs: List[Dict], max_workers: Optional[int] = None, verbose: bool = False,
+              on_done: Optional[Callable[[Dict], None]] = None) -> List[Dict]:
+    """在进程池中并发执行多个合并任务，按输入顺序返回各任务结果
+
+    每个任务独占一个进程（互不共享表格缓存）；任务内部的 workers 选项仍可再开匹配子进程。
+    on_done(结果) 在每个任务完成时于主进程回调。非 verbose 时逐行日志不输出，匹配时也不再生成。
+    """
+    if not verbose:
+        specs = [dict(spec, options=dict(spec.get("options") or {}, log_level="summary")) for spec in specs]
+    if len(specs) == 1 or max_workers == 1:
+        results = []
+        for i, spec in enumerate(specs, 1):
+            result = run_merge(spec, functools.partial(_print_log, f"[任务{i}] ", verbose))
+            results.append(result)
+            if on_done is not None:
+                on_done(result)
+        return results
+
+    results: List[Optional[Dict]] = [None] * len(specs)
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        futures = {pool.submit(run_merge, spec, functools.partial(_print_log, f"[任务{i + 1}] ", verbose)): i
+                   for i, spec in enumerate(specs)}
+        for future in as_completed(futures):
+            i = futures[future]
+            try:
+                results[i] = future.result()
+            except Exception as e:
+                # 子进程异常退出等 process_merge 未捕获的错误
+                results[i] = {"output": specs[i]["output"], "status": "error", "error": str(e), "seconds": None}
+            if on_done is not None:
+                on_done(results[i])
+    return results
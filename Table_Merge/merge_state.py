@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""
+增量合并状态（保存在输出文件旁：<输出文件>.merge_state.npz）
+- 记录上次合并时表1每行匹配键的内容哈希与匹配结果（表2行号，CSR 格式）
+- 再次合并时，匹配键未变的行直接沿用上次结果，只有新增或修改的行重新匹配
+- 表2内容、匹配对设置或合并方式变化时签名不同，旧状态整体失效
+- 断点（<输出文件>.checkpoint.npz）结构相同，只含已完成的行：合并取消或中断后再次运行时据此跳过已完成部分
+"""
+
+import json
+import os
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from merge_engine import NO_MATCH
+
+STATE_SUFFIX = ".merge_state.npz"
+CHECKPOINT_SUFFIX = ".checkpoint.npz"
+STATE_FORMAT_VERSION = 1  # 状态文件结构变化时递增
+
+
+def state_path(output: str) -> str:
+    return output + STATE_SUFFIX
+
+
+def checkpoint_path(output: str) -> str:
+    return output + CHECKPOINT_SUFFIX
+
+
+def merge_signature(file2_digest: str, match_pairs: List[Dict], merge_mode: str, sheet2=0) -> str:
+    """影响匹配结果的全部参数（合并列与聚合函数只影响输出，不影响匹配结果）"""
+    spec = {"version": STATE_FORMAT_VERSION, "file2": file2_digest, "sheet2": sheet2, "merge_mode": merge_mode,
+            "match_pairs": [{k: pair.get(k) for k in ("col1", "col2", "rule", "threshold")} for pair in match_pairs]}
+    return json.dumps(spec, ensure_ascii=False, sort_keys=True, default=str)
+
+
+def row_hashes(keys: pd.DataFrame) -> np.ndarray:
+    """表1每行规范化匹配键的 64 位哈希（匹配结果只取决于匹配键）"""
+    return pd.util.hash_pandas_object(keys.reset_index(drop=True), index=False).to_numpy(dtype="uint64")
+
+
+class MergeState:
+    """每行匹配结果：第 i 行匹配的表2行号为 matches[offsets[i]:offsets[i + 1]]"""
+
+    def __init__(self, hashes: np.ndarray, offsets: np.ndarray, matches: np.ndarray):
+        self.hashes = hashes
+        self.offsets = offsets
+        self.matches = matches
+
+    @classmethod
+    def empty(cls) -> "MergeState":
+        return cls(np.empty(0, dtype="uint64"), np.zeros(1, dtype="int64"), np.empty(0, dtype="int64"))
+
+    @classmethod
+    def from_positions(cls, hashes: np.ndarray, positions: np.ndarray) -> "MergeState":
+        """取首个匹配行方式的结果（每行至多一个表2行号）"""
+        matched = positions != NO_MATCH
+        offsets = np.concatenate([[0], np.cumsum(matched)]).astype("int64")
+        return cls(hashes, offsets, positions[matched].astype("int64"))
+
+    @classmethod
+    def from_pairs(cls, hashes: np.ndarray, pos1: np.ndarray, pos2: np.ndarray) -> "MergeState":
+        """全部匹配行对（须已按表1行、表2行排序）"""
+        counts = np.bincount(pos1, minlength=len(hashes))
+        offsets = np.concatenate([[0], np.cumsum(counts)]).astype("int64")
+        return cls(hashes, offsets, pos2.astype("int64"))
+
+    @classmethod
+    def from_completed(cls, hashes: np.ndarray, completed: np.ndarray, positions: Optional[np.ndarray] = None,
+                       pairs: Optional[Tuple[np.ndarray, np.ndarray]] = None) -> "MergeState":
+        """只含已完成行（升序表1行号 completed）的状态：positions 为全表匹配位置，或 pairs 为全部匹配行对"""
+        if positions is not None:
+            return cls.from_positions(hashes[completed], positions[completed])
+        pos1, pos2 = pairs
+        keep = np.isin(pos1, completed)
+        return cls.from_pairs(hashes[completed], np.searchsorted(completed, pos1[keep]), pos2[keep])
+
+    def save(self, path: str, signature: str):
+        tmp_path = path + ".tmp.npz"
+        np.savez(tmp_path, signature=np.array(signature), hashes=self.hashes, offsets=self.offsets,
+                 matches=self.matches)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str, signature: str) -> Optional["MergeState"]:
+        """载入状态文件，不存在、损坏或签名不一致时返回 None"""
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                if str(data["signature"]) != signature:
+                    return None
+                return cls(data["hashes"], data["offsets"], data["matches"])
+        except Exception:
+            return None
+
+    def previous_rows(self, hashes: np.ndarray) -> np.ndarray:
+        """当前各行在上次结果中的行号（匹配键相同即可沿用），无对应行为 -1"""
+        if len(self.hashes) == 0:
+            return np.full(len(hashes), -1, dtype="int64")
+        unique_hashes, first = np.unique(self.hashes, return_index=True)
+        pos = np.searchsorted(unique_hashes, hashes).clip(max=len(unique_hashes) - 1)
+        return np.where(unique_hashes[pos] == hashes, first[pos], -1).astype("int64")
+
+    def reused_pairs(self, prev_rows: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """沿用行的匹配行对（当前表1行号, 表2行号）"""
+        rows = np.flatnonzero(prev_rows >= 0)
+        src = prev_rows[rows]
+        counts = self.offsets[src + 1] - self.offsets[src]
+        pos1 = np.repeat(rows, counts)
+        # 每个沿用行在 matches 中的区间逐个展开
+        starts = np.repeat(self.offsets[src] - np.concatenate([[0], np.cumsum(counts)[:-1]]), counts)
+        pos2 = self.matches[starts + np.arange(counts.sum())]
+        return pos1.astype("int64"), pos2.astype("int64")
+
+
+def splice_positions(state: MergeState, prev_rows: np.ndarray, todo: np.ndarray,
+                     sub_positions: np.ndarray) -> np.ndarray:
+    """取首个匹配行方式：沿用行取上次结果，重新匹配的行取本次结果"""
+    positions = np.full(len(prev_rows), NO_MATCH, dtype="int64")
+    pos1, pos2 = state.reused_pairs(prev_rows)
+    positions[pos1] = pos2
+    positions[todo] = sub_positions
+    return positions
+
+
+def splice_pairs(state: MergeState, prev_rows: np.ndarray, todo: np.ndarray,
+                 sub_pos1: np.ndarray, sub_pos2: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """展开/聚合方式：合并沿用行与重新匹配行的全部匹配行对，并按表1行、表2行排序"""
+    old1, old2 = state.reused_pairs(prev_rows)
+    pos1 = np.concatenate([old1, todo[sub_pos1]])
+    pos2 = np.concatenate([old2, sub_pos2])
+    order = np.lexsort((pos2, pos1))
+    return pos1[order], pos2[order]
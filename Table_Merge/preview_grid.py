@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+"""
+虚拟化表格预览（百万行级别）
+- PreviewModel：只维护筛选/排序后的行位置数组，按需取出可见窗口内的行并转为显示文本
+- PreviewGrid：Treeview 只保留一屏的行控件，滚动时改写其内容，不随表格行数增加控件
+- 点击列标题按该列排序（再次点击反向），可按列做包含匹配筛选；行号为原表中的行号（从1起）
+"""
+
+import tkinter as tk
+from tkinter import ttk
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+
+PREVIEW_COL_WIDTH = 110  # 预览列默认宽度（像素）
+ROW_HEIGHT = 20  # 预览行高（像素），用于计算一屏可见行数
+WHEEL_ROWS = 3  # 鼠标滚轮每格滚动的行数
+
+
+class PreviewModel:
+    """预览数据模型：order 为当前（筛选、排序后）依次显示的原表行位置"""
+
+    def __init__(self, df: pd.DataFrame):
+        self.df = df
+        self.order = np.arange(len(df))
+        self.sort_col: Optional[int] = None  # 当前排序列序号
+        self.ascending = True
+
+    def __len__(self) -> int:
+        return len(self.order)
+
+    def reset(self):
+        self.order = np.arange(len(self.df))
+        self.sort_col = None
+
+    def sort(self, col_idx: int, ascending: bool = True):
+        """按第 col_idx 列稳定排序当前行，空值排在最后；取值类型不一致时按文本排序"""
+        values = self.df.iloc[self.order, col_idx].reset_index(drop=True)
+        try:
+            ranked = values.sort_values(ascending=ascending, kind="stable", na_position="last")
+        except TypeError:
+            text = values.where(values.isna(), values.astype(str))
+            ranked = text.sort_values(ascending=ascending, kind="stable", na_position="last")
+        self.order = self.order[ranked.index.to_numpy()]
+        self.sort_col, self.ascending = col_idx, ascending
+
+    def filter(self, col_idx: Optional[int], text: str):
+        """保留第 col_idx 列（None 为任一列）文本包含 text 的行（忽略大小写），并保持当前排序"""
+        self.order = np.arange(len(self.df))
+        if text:
+            cols = range(self.df.shape[1]) if col_idx is None else [col_idx]
+            mask = np.zeros(len(self.df), dtype=bool)
+            for i in cols:
+                column = self.df.iloc[:, i]
+                mask |= (column.notna() & column.astype(str).str.contains(text, case=False, regex=False)).to_numpy()
+            self.order = np.flatnonzero(mask)
+        if self.sort_col is not None:
+            self.sort(self.sort_col, self.ascending)
+
+    def window(self, start: int, count: int) -> List[List[str]]:
+        """第 start 行起（显示顺序）最多 count 行的显示文本"""
+        positions = self.order[start:start + count]
+        block = self.df.iloc[positions]
+        text = block.astype(str).where(block.notna(), "")
+        return text.values.tolist()
+
+    def row_numbers(self, start: int, count: int) -> List[int]:
+        """可见行在原表中的行号（从1起）"""
+        return (self.order[start:start + count] + 1).tolist()
+
+
+class PreviewGrid(tk.Frame):
+    """只渲染可见行的表格预览控件"""
+
+    def __init__(self, master, df: pd.DataFrame, font=None):
+        super().__init__(master)
+        self.model = PreviewModel(df)
+        self.columns = [str(col) for col in df.columns]
+        self.top = 0  # 第一可见行（显示顺序）
+        self.visible = 0  # 一屏可显示的行数
+        self.font = font
+
+        # 筛选栏
+        bar = tk.Frame(self)
+        bar.pack(fill=tk.X, padx=10, pady=(10, 0))
+        tk.Label(bar, text="筛选列", font=font).pack(side=tk.LEFT)
+        self.filter_col_var = tk.StringVar(value="（任一列）")
+        ttk.Combobox(bar, textvariable=self.filter_col_var, values=["（任一列）"] + self.columns, width=16,
+                     font=font, state="readonly").pack(side=tk.LEFT, padx=5)
+        self.filter_text_var = tk.StringVar()
+        entry = tk.Entry(bar, textvariable=self.filter_text_var, width=24, font=font)
+        entry.pack(side=tk.LEFT, padx=5)
+        entry.bind("<Return>", lambda e: self.apply_filter())
+        tk.Button(bar, text="筛选", command=self.apply_filter, font=font).pack(side=tk.LEFT, padx=5)
+        tk.Button(bar, text="重置", command=self.reset, font=font).pack(side=tk.LEFT, padx=5)
+        self.status_var = tk.StringVar()
+        tk.Label(bar, textvariable=self.status_var, font=font, fg="#666").pack(side=tk.RIGHT)
+
+        # 表格区：Treeview 本身不滚动，纵向滚动条驱动可见窗口
+        body = tk.Frame(self)
+        body.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        style = ttk.Style(self)
+        style.configure("Preview.Treeview", rowheight=ROW_HEIGHT)
+        self.tree = ttk.Treeview(body, columns=[f"c{i}" for i in range(len(self.columns))], show="tree headings",
+                                 style="Preview.Treeview", selectmode="browse")
+        self.tree.heading("#0", text="行号")
+        self.tree.column("#0", width=70, stretch=False, anchor=tk.E)
+        for i, col in enumerate(self.columns):
+            self.tree.heading(f"c{i}", text=col, command=lambda i=i: self.sort_by(i))
+            self.tree.column(f"c{i}", width=PREVIEW_COL_WIDTH, stretch=False, anchor=tk.CENTER)
+        self.vscroll = ttk.Scrollbar(body, orient="vertical", command=self.on_scrollbar)
+        self.vscroll.pack(side=tk.RIGHT, fill=tk.Y)
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        hscroll = ttk.Scrollbar(self, orient="horizontal", command=self.tree.xview)
+        self.tree.configure(xscrollcommand=hscroll.set)
+        hscroll.pack(fill=tk.X, padx=10, pady=(0, 10))
+
+        self.tree.bind("<Configure>", lambda e: self.on_resize(e.height))
+        for widget in (self.tree, self.vscroll):
+            widget.bind("<MouseWheel>", self.on_wheel)
+            widget.bind("<Button-4>", lambda e: self.scroll_to(self.top - WHEEL_ROWS))
+            widget.bind("<Button-5>", lambda e: self.scroll_to(self.top + WHEEL_ROWS))
+        self.refresh()
+
+    def on_resize(self, height: int):
+        # 表头约占一行
+        visible = max(height // ROW_HEIGHT - 1, 1)
+        if visible != self.visible:
+            self.visible = visible
+            self.refresh()
+
+    def on_wheel(self, event):
+        self.scroll_to(self.top - WHEEL_ROWS * (1 if event.delta > 0 else -1))
+
+    def on_scrollbar(self, action, value, unit=None):
+        """滚动条回调：moveto 比例 / scroll 行数或页数"""
+        if action == "moveto":
+            self.scroll_to(int(float(value) * len(self.model)))
+        elif action == "scroll":
+            step = self.visible if unit == "pages" else 1
+            self.scroll_to(self.top + int(value) * step)
+
+    def scroll_to(self, top: int):
+        top = max(0, min(top, len(self.model) - self.visible))
+        if top != self.top:
+            self.top = top
+            self.refresh()
+
+    def refresh(self):
+        """重写可见行：已有行控件直接改写内容，多退少补"""
+        rows = self.model.window(self.top, self.visible)
+        labels = self.model.row_numbers(self.top, self.visible)
+        items = self.tree.get_children()
+        for i, (label, values) in enumerate(zip(labels, rows)):
+            if i < len(items):
+                self.tree.item(items[i], text=str(label), values=values)
+            else:
+                self.tree.insert("", tk.END, text=str(label), values=values)
+        if len(items) > len(rows):
+            self.tree.delete(*items[len(rows):])
+
+        total = len(self.model)
+        if total:
+            self.vscroll.set(self.top / total, min((self.top + self.visible) / total, 1.0))
+        else:
+            self.vscroll.set(0.0, 1.0)
+        shown = f"筛选后{total}行，" if total != len(self.model.df) else ""
+        self.status_var.set(f"{shown}共{len(self.model.df)}行 × {len(self.columns)}列")
+
+    def sort_by(self, col_idx: int):
+        ascending = not (self.model.sort_col == col_idx and self.model.ascending)
+        self.model.sort(col_idx, ascending)
+        for i, col in enumerate(self.columns):
+            mark = (" ▲" if ascending else " ▼") if i == col_idx else ""
+            self.tree.heading(f"c{i}", text=col + mark)
+        self.top = 0
+        self.refresh()
+
+    def apply_filter(self):
+        name = self.filter_col_var.get()
+        col_idx = self.columns.index(name) if name in self.columns else None
+        self.model.filter(col_idx, self.filter_text_var.get().strip())
+        self.top = 0
+        self.refresh()
+
+    def reset(self):
+        self.filter_text_var.set("")
+        self.model.reset()
+        for i, col in enumerate(self.columns):
+            self.tree.heading(f"c{i}", text=col)
+        self.top = 0
+        self.refresh()
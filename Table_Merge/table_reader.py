@@ -0,0 +1,391 @@
+# -*- coding: utf-8 -*-
+"""
+表格读取层（按文件类型自动选择引擎）
+- xlsx/xlsm：优先使用 Rust 实现的 calamine 引擎，未安装时回退到 openpyxl 只读流式读取
+- xls：pandas 默认引擎（xlrd）
+- csv：直接读取，utf-8 解码失败时按 GBK 重试
+- parquet：pyarrow 读取，支持只读前若干行
+- 工作表选择：单个、多个或全部工作表；多个工作表在子进程中并行解析后纵向拼接，并增加来源工作表列
+- TableCache：会话级解析结果缓存（路径 + 修改时间 + 工作表），超出内存上限时溢写为 Feather 文件
+"""
+
+import atexit
+import importlib.util
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+import pandas as pd
+
+HAS_CALAMINE = importlib.util.find_spec("python_calamine") is not None
+HAS_PYARROW = importlib.util.find_spec("pyarrow") is not None
+
+EXCEL_EXTS = (".xlsx", ".xlsm", ".xls")
+CSV_EXTS = (".csv",)
+PARQUET_EXTS = (".parquet", ".pq")
+SUPPORTED_EXTS = EXCEL_EXTS + CSV_EXTS + PARQUET_EXTS
+
+# 文件选择对话框过滤器
+FILE_TYPES = [
+    ("表格文件", "*.xlsx;*.xlsm;*.xls;*.csv;*.parquet"),
+    ("Excel文件", "*.xlsx;*.xlsm;*.xls"),
+    ("CSV文件", "*.csv"),
+    ("Parquet文件", "*.parquet"),
+]
+
+UseCols = Optional[List[Union[int, str]]]
+# 工作表选择：序号或名称（单个）、名称元组（多个）或 ALL_SHEETS（全部）；非 Excel 文件忽略
+SheetSpec = Union[int, str, Tuple[str, ...]]
+ALL_SHEETS = "*"  # Excel 工作表名不能包含 *，用作“全部工作表”标记
+SHEET_COLUMN = "来源工作表"  # 多工作表拼接时记录来源的列名（位于第一列）
+
+
+def file_kind(path: str) -> str:
+    """返回文件类型：excel / csv / parquet，不支持时抛出 ValueError"""
+    ext = os.path.splitext(path)[1].lower()
+    if ext in EXCEL_EXTS:
+        return "excel"
+    if ext in CSV_EXTS:
+        return "csv"
+    if ext in PARQUET_EXTS:
+        return "parquet"
+    raise ValueError(f"不支持的文件类型：{ext}（支持：{' '.join(SUPPORTED_EXTS)}）")
+
+
+def excel_engine(path: str) -> Optional[str]:
+    """选择 Excel 读取引擎：xlsx/xlsm 优先 calamine，否则 openpyxl；xls 交给 pandas 默认"""
+    if os.path.splitext(path)[1].lower() == ".xls":
+        return "calamine" if HAS_CALAMINE else None
+    return "calamine" if HAS_CALAMINE else "openpyxl"
+
+
+def normalize_sheet(sheet_name) -> SheetSpec:
+    """统一工作表选择的表示：列表（如来自 JSON）转为元组，只含一个名称时按单个工作表处理"""
+    if isinstance(sheet_name, (list, tuple)):
+        names = tuple(str(name) for name in sheet_name)
+        if not names:
+            raise ValueError("未选择工作表")
+        return names[0] if len(names) == 1 else names
+    return sheet_name
+
+
+def is_multi_sheet(sheet_name: SheetSpec) -> bool:
+    return isinstance(sheet_name, tuple) or sheet_name == ALL_SHEETS
+
+
+def sheet_names(path: str) -> List[str]:
+    """Excel 文件的全部工作表名（按工作簿顺序），其他文件类型返回空列表"""
+    if file_kind(path) != "excel":
+        return []
+    if HAS_CALAMINE:
+        from python_calamine import CalamineWorkbook
+
+        return list(CalamineWorkbook.from_path(path).sheet_names)
+    if os.path.splitext(path)[1].lower() == ".xls":
+        with pd.ExcelFile(path) as book:
+            return list(book.sheet_names)
+    from openpyxl import load_workbook
+
+    wb = load_workbook(path, read_only=True)
+    try:
+        return list(wb.sheetnames)
+    finally:
+        wb.close()
+
+
+def _read_sheet_task(args) -> pd.DataFrame:
+    """子进程任务：读取一个工作表（usecols 为列名，工作表中不存在的列忽略）"""
+    path, name, nrows, usecols = args
+    wanted = None if usecols is None else set(usecols)
+    return pd.read_excel(path, sheet_name=name, nrows=nrows, engine=excel_engine(path),
+                         usecols=None if wanted is None else (lambda col: col in wanted))
+
+
+def read_sheets(path: str, names: Sequence[str], nrows: Optional[int] = None, usecols: UseCols = None,
+                max_workers: Optional[int] = None) -> pd.DataFrame:
+    """多个工作表在子进程中并行解析，按选择顺序纵向拼接（列取并集），第一列为来源工作表名
+
+    总耗时约等于最大工作表的解析时间；usecols 只能为列名。
+    """
+    if usecols is not None and any(isinstance(col, int) for col in usecols):
+        raise ValueError("多工作表读取只能按列名选择列")
+    tasks = [(path, name, nrows, usecols) for name in names]
+    workers = min(len(tasks), max_workers or os.cpu_count() or 1)
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            frames = list(pool.map(_read_sheet_task, tasks))
+    else:
+        frames = [_read_sheet_task(task) for task in tasks]
+    for name, frame in zip(names, frames):
+        frame.insert(0, SHEET_COLUMN, name)
+    df = pd.concat(frames, ignore_index=True)
+    if usecols is not None:
+        df = df[[col for col in usecols if col in df.columns]]
+    return df.head(nrows) if nrows is not None else df
+
+
+def resolve_sheets(path: str, sheet_name: SheetSpec) -> List[str]:
+    """多工作表选择对应的工作表名列表（ALL_SHEETS 展开为全部工作表）"""
+    available = sheet_names(path)
+    if sheet_name == ALL_SHEETS:
+        return available
+    missing = [name for name in sheet_name if name not in available]
+    if missing:
+        raise ValueError(f"工作簿中不存在工作表：{missing}")
+    return list(sheet_name)
+
+
+def read_table(path: str, nrows: Optional[int] = None, usecols: UseCols = None,
+               sheet_name: SheetSpec = 0) -> pd.DataFrame:
+    """读取表格，nrows 限制行数，usecols 为列序号或列名列表，sheet_name 仅对 Excel 有效
+
+    sheet_name 为多个/全部工作表时并行读取后拼接（见 read_sheets）。
+    """
+    kind = file_kind(path)
+    if kind == "excel":
+        sheet_name = normalize_sheet(sheet_name)
+        if is_multi_sheet(sheet_name):
+            return read_sheets(path, resolve_sheets(path, sheet_name), nrows, usecols)
+        return pd.read_excel(path, sheet_name=sheet_name, nrows=nrows, usecols=usecols,
+                             engine=excel_engine(path))
+    if kind == "csv":
+        try:
+            return pd.read_csv(path, nrows=nrows, usecols=usecols, encoding="utf-8-sig")
+        except UnicodeDecodeError:
+            return pd.read_csv(path, nrows=nrows, usecols=usecols, encoding="gbk")
+    return _read_parquet(path, nrows, usecols)
+
+
+def _read_parquet(path: str, nrows: Optional[int], usecols: UseCols) -> pd.DataFrame:
+    import pyarrow.parquet as pq
+
+    pf = pq.ParquetFile(path)
+    columns = None
+    if usecols is not None:
+        names = pf.schema_arrow.names
+        columns = [names[c] if isinstance(c, int) else c for c in usecols]
+    if nrows is None:
+        return pf.read(columns=columns).to_pandas()
+    batches = pf.iter_batches(batch_size=max(nrows, 1), columns=columns)
+    first = next(batches, None)
+    if first is None:
+        empty = pf.schema_arrow.empty_table()
+        return (empty.select(columns) if columns else empty).to_pandas()
+    return first.to_pandas().head(nrows)
+
+
+def _dedupe_header(header: List) -> List[str]:
+    """表头规范化：空表头记为 Unnamed: i，重复列名追加 .1、.2（与 pandas 一致）"""
+    names, seen = [], {}
+    for i, name in enumerate(header):
+        name = f"Unnamed: {i}" if name is None or str(name).strip() == "" else name
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+        names.append(name)
+    return names
+
+
+def iter_table_chunks(path: str, chunk_rows: int = 100000,
+                      sheet_name: Union[int, str] = 0) -> Iterator[pd.DataFrame]:
+    """分块流式读取表格，内存只与块大小相关
+
+    - csv：按文本读取（不做类型推断，避免各块推断不一致）
+    - parquet：按行组批次读取
+    - xlsx/xlsm：openpyxl 只读模式逐行读取，单元格保持原始类型
+    - xls：格式不支持流式读取，整表读取后分块返回
+    """
+    kind = file_kind(path)
+    if kind == "csv":
+        for encoding in ("utf-8-sig", "gbk"):
+            try:
+                reader = pd.read_csv(path, dtype=str, chunksize=chunk_rows, encoding=encoding)
+                first = next(reader, None)
+                break
+            except UnicodeDecodeError:
+                continue
+        else:
+            raise ValueError(f"无法识别CSV文件编码：{path}")
+        if first is None:
+            return
+        yield first
+        yield from reader
+    elif kind == "parquet":
+        import pyarrow.parquet as pq
+
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_rows):
+            yield batch.to_pandas()
+    elif os.path.splitext(path)[1].lower() == ".xls":
+        df = read_table(path, sheet_name=sheet_name)
+        for start in range(0, len(df), chunk_rows):
+            yield df.iloc[start:start + chunk_rows]
+    else:
+        from openpyxl import load_workbook
+
+        wb = load_workbook(path, read_only=True, data_only=True)
+        try:
+            ws = wb.worksheets[sheet_name] if isinstance(sheet_name, int) else wb[sheet_name]
+            rows = ws.iter_rows(values_only=True)
+            header = next(rows, None)
+            if header is None:
+                return
+            columns = _dedupe_header(list(header))
+            buffer = []
+            for row in rows:
+                buffer.append(row[:len(columns)])
+                if len(buffer) >= chunk_rows:
+                    yield pd.DataFrame(buffer, columns=columns, dtype=object)
+                    buffer = []
+            if buffer:
+                yield pd.DataFrame(buffer, columns=columns, dtype=object)
+        finally:
+            wb.close()
+
+
+def _xlsx_dimension_rows(path: str, sheet_name: Union[int, str]) -> Optional[int]:
+    """从 xlsx 工作表的 dimension 元数据读取行数（含表头），缺失时返回 None"""
+    from openpyxl import load_workbook
+
+    wb = load_workbook(path, read_only=True)
+    try:
+        ws = wb.worksheets[sheet_name] if isinstance(sheet_name, int) else wb[sheet_name]
+        return ws.max_row
+    finally:
+        wb.close()
+
+
+def count_rows(path: str, sheet_name: SheetSpec = 0) -> int:
+    """统计数据行数（不含表头），xlsx/parquet 直接取元数据，不解析单元格"""
+    kind = file_kind(path)
+    sheet_name = normalize_sheet(sheet_name)
+    if kind == "excel" and is_multi_sheet(sheet_name):
+        return sum(count_rows(path, name) for name in resolve_sheets(path, sheet_name))
+    if kind == "parquet":
+        import pyarrow.parquet as pq
+
+        return pq.ParquetFile(path).metadata.num_rows
+    if kind == "excel" and os.path.splitext(path)[1].lower() in (".xlsx", ".xlsm"):
+        rows = _xlsx_dimension_rows(path, sheet_name)
+        if rows is not None:
+            return max(rows - 1, 0)
+    return read_table(path, usecols=[0], sheet_name=sheet_name).shape[0]
+
+
+CacheKey = Tuple[str, int, SheetSpec, Optional[tuple]]
+
+
+class TableCache:
+    """会话级表格缓存：同一文件（路径、修改时间、工作表均相同）只解析一次
+
+    内存中最多保留 max_in_memory 张表，较早使用的表溢写到临时目录
+    （优先 Feather，列类型不受支持时改用 pickle），再次使用时从磁盘载入而不重新解析。
+    指定 usecols 时只解析并缓存这些列（与整表分别缓存）。返回的是浅拷贝，调用方增删列不会影响缓存。
+    """
+
+    def __init__(self, max_in_memory: int = 2):
+        self.max_in_memory = max_in_memory
+        self._memory: "OrderedDict[CacheKey, pd.DataFrame]" = OrderedDict()
+        self._spilled: Dict[CacheKey, str] = {}
+        self._lock = threading.Lock()
+        self._key_locks: Dict[CacheKey, threading.Lock] = {}
+        self._spill_dir: Optional[str] = None
+        self._spill_seq = 0
+
+    @staticmethod
+    def make_key(path: str, sheet_name: SheetSpec = 0, usecols: UseCols = None) -> CacheKey:
+        path = os.path.abspath(path)
+        # 非 Excel 文件没有工作表，统一记为 0
+        sheet_name = normalize_sheet(sheet_name) if file_kind(path) == "excel" else 0
+        return path, os.stat(path).st_mtime_ns, sheet_name, tuple(usecols) if usecols is not None else None
+
+    def is_cached(self, path: str, sheet_name: SheetSpec = 0) -> bool:
+        key = self.make_key(path, sheet_name)
+        with self._lock:
+            return key in self._memory or key in self._spilled
+
+    def get(self, path: str, sheet_name: SheetSpec = 0, usecols: UseCols = None) -> pd.DataFrame:
+        """获取整表或 usecols 指定的列（必要时解析一次并缓存）"""
+        key = self.make_key(path, sheet_name, usecols)
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        # 同一文件并发请求时只解析一次
+        with key_lock:
+            with self._lock:
+                df = self._memory.get(key)
+                if df is not None:
+                    self._memory.move_to_end(key)
+                    return df.copy(deep=False)
+                spill_path = self._spilled.pop(key, None)
+            df = self._load_spill(spill_path) if spill_path else \
+                read_table(path, usecols=usecols, sheet_name=sheet_name)
+            with self._lock:
+                self._memory[key] = df
+                self._evict()
+            return df.copy(deep=False)
+
+    def head(self, path: str, nrows: int, sheet_name: SheetSpec = 0) -> pd.DataFrame:
+        return self.get(path, sheet_name).head(nrows)
+
+    def peek(self, path: str, nrows: int, sheet_name: SheetSpec = 0) -> pd.DataFrame:
+        """取前 nrows 行：整表已缓存时直接截取，否则只读取这几行，不解析、不缓存整表"""
+        if self.is_cached(path, sheet_name):
+            return self.head(path, nrows, sheet_name)
+        return read_table(path, nrows=nrows, sheet_name=sheet_name)
+
+    def row_count(self, path: str, sheet_name: SheetSpec = 0) -> int:
+        """已缓存时直接取行数，否则读取元数据"""
+        key = self.make_key(path, sheet_name)
+        with self._lock:
+            df = self._memory.get(key)
+        return len(df) if df is not None else count_rows(path, sheet_name)
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._spilled.clear()
+            if self._spill_dir:
+                shutil.rmtree(self._spill_dir, ignore_errors=True)
+                self._spill_dir = None
+
+    def _evict(self):
+        """超出内存上限的表溢写到磁盘（调用方持有 self._lock）"""
+        while len(self._memory) > self.max_in_memory:
+            key, df = self._memory.popitem(last=False)
+            try:
+                self._spilled[key] = self._write_spill(df)
+            except Exception:
+                # 溢写失败时直接丢弃，下次重新解析
+                pass
+
+    def _write_spill(self, df: pd.DataFrame) -> str:
+        if self._spill_dir is None:
+            self._spill_dir = tempfile.mkdtemp(prefix="table_cache_")
+        self._spill_seq += 1
+        base = os.path.join(self._spill_dir, str(self._spill_seq))
+        if HAS_PYARROW:
+            try:
+                # Feather 要求字符串列名且列类型统一，不满足时改用 pickle
+                if all(isinstance(col, str) for col in df.columns) and df.columns.is_unique:
+                    df.reset_index(drop=True).to_feather(base + ".feather")
+                    return base + ".feather"
+            except Exception:
+                pass
+        df.to_pickle(base + ".pkl")
+        return base + ".pkl"
+
+    @staticmethod
+    def _load_spill(spill_path: str) -> pd.DataFrame:
+        if spill_path.endswith(".feather"):
+            return pd.read_feather(spill_path)
+        return pd.read_pickle(spill_path)
+
+
+# 会话级共享缓存：预览、文件信息与合并共用
+TABLE_CACHE = TableCache()
+atexit.register(TABLE_CACHE.clear)
@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+"""
+合并结果流式写出（按输出文件扩展名选择格式）
+- xlsx：openpyxl 只写模式逐行追加，内存占用恒定，超过 Excel 行数上限自动分到新工作表
+- csv：分块追加写入（utf-8-sig，Excel 可直接打开）
+- parquet：pyarrow 分块写入行组，对象列统一存为字符串
+- 先写入输出目录下的临时文件，完成后整体改名，取消、出错或进程中止都不会留下空的或不完整的输出文件
+"""
+
+import os
+import tempfile
+from abc import ABC, abstractmethod
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+EXCEL_MAX_ROWS = 1048576  # Excel 单个工作表最大行数（含表头）
+WRITE_CHUNK_ROWS = 50000  # 每次写出的行数
+
+# 输出格式：{格式名: 扩展名}
+OUTPUT_FORMATS: Dict[str, str] = {"xlsx": ".xlsx", "csv": ".csv", "parquet": ".parquet"}
+
+# 输出文件选择对话框过滤器
+OUTPUT_FILE_TYPES = [("Excel文件", "*.xlsx"), ("CSV文件", "*.csv"), ("Parquet文件", "*.parquet")]
+
+
+def output_format(path: str) -> str:
+    """按扩展名返回输出格式，不支持时抛出 ValueError"""
+    ext = os.path.splitext(path)[1].lower()
+    for fmt, fmt_ext in OUTPUT_FORMATS.items():
+        if ext == fmt_ext:
+            return fmt
+    raise ValueError(f"不支持的输出格式：{ext}（支持：{' '.join(OUTPUT_FORMATS.values())}）")
+
+
+class TableWriter(ABC):
+    """流式写出基类：write() 按行序追加数据块，close() 完成文件，abort() 放弃写出
+
+    数据写入同目录的临时文件 temp_path，close() 完成后改名为 path；abort() 删除临时文件
+    （已 close() 时删除输出文件）。
+    """
+
+    def __init__(self, path: str, columns: List):
+        self.path = path
+        self.columns = list(columns)
+        self.rows_written = 0
+        self.closed = False
+        directory, name = os.path.split(os.path.abspath(path))
+        fd, self.temp_path = tempfile.mkstemp(prefix=f".{name}.", suffix=".tmp", dir=directory)
+        os.close(fd)
+
+    @abstractmethod
+    def write(self, chunk: pd.DataFrame):
+        """按行序追加一个数据块（列与 columns 一致）"""
+
+    @abstractmethod
+    def _finish(self):
+        """完成并关闭临时文件"""
+
+    def close(self):
+        if self.closed:
+            return
+        self._finish()
+        os.replace(self.temp_path, self.path)
+        self.closed = True
+
+    def abort(self):
+        if self.closed:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            return
+        try:
+            self._finish()
+        finally:
+            if os.path.exists(self.temp_path):
+                os.remove(self.temp_path)
+
+
+class XlsxStreamWriter(TableWriter):
+    def __init__(self, path: str, columns: List, sheet_prefix: str = "Sheet"):
+        super().__init__(path, columns)
+        from openpyxl import Workbook
+
+        self.workbook = Workbook(write_only=True)
+        self.sheet_prefix = sheet_prefix
+        self.sheet = None
+        self.sheet_rows = 0
+        self.sheet_count = 0
+
+    def _new_sheet(self):
+        self.sheet_count += 1
+        self.sheet = self.workbook.create_sheet(f"{self.sheet_prefix}{self.sheet_count}")
+        self.sheet.append([str(col) for col in self.columns])
+        self.sheet_rows = 1
+
+    def write(self, chunk: pd.DataFrame):
+        # 空值写成空单元格，与 to_excel 一致
+        values = chunk.astype(object).where(chunk.notna(), None).to_numpy()
+        for row in values:
+            if self.sheet is None or self.sheet_rows >= EXCEL_MAX_ROWS:
+                self._new_sheet()
+            self.sheet.append(list(row))
+            self.sheet_rows += 1
+        self.rows_written += len(chunk)
+
+    def _finish(self):
+        if self.sheet is None:
+            self._new_sheet()
+        self.workbook.save(self.temp_path)
+
+
+class CsvStreamWriter(TableWriter):
+    def __init__(self, path: str, columns: List):
+        super().__init__(path, columns)
+        self.handle = open(self.temp_path, "w", encoding="utf-8-sig", newline="")
+        pd.DataFrame(columns=self.columns).to_csv(self.handle, index=False)
+
+    def write(self, chunk: pd.DataFrame):
+        chunk.to_csv(self.handle, index=False, header=False)
+        self.rows_written += len(chunk)
+
+    def _finish(self):
+        if not self.handle.closed:
+            self.handle.close()
+
+
+class ParquetStreamWriter(TableWriter):
+    def __init__(self, path: str, columns: List, dtypes: pd.Series):
+        super().__init__(path, columns)
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self.pa = pa
+        # 结构由整表列类型确定：数值/时间列保留类型，其余列存为字符串，避免各块推断不一致
+        self.object_cols = []
+        fields = []
+        for col in self.columns:
+            try:
+                arrow_type = pa.from_numpy_dtype(dtypes[col])
+            except (TypeError, NotImplementedError, pa.ArrowNotImplementedError):
+                arrow_type = None
+            if arrow_type is None or dtypes[col] == object:
+                self.object_cols.append(col)
+                arrow_type = pa.string()
+            fields.append(pa.field(str(col), arrow_type))
+        self.schema = pa.schema(fields)
+        self.writer = pq.ParquetWriter(self.temp_path, self.schema)
+
+    def write(self, chunk: pd.DataFrame):
+        chunk = chunk.copy()
+        for col in self.object_cols:
+            values = chunk[col].to_numpy(dtype=object)
+            chunk[col] = np.where(pd.isna(values), None, values.astype(str))
+        chunk.columns = [str(col) for col in chunk.columns]
+        self.writer.write_table(self.pa.Table.from_pandas(chunk, schema=self.schema, preserve_index=False))
+        self.rows_written += len(chunk)
+
+    def _finish(self):
+        self.writer.close()
+
+
+def check_output(path: str) -> str:
+    """校验输出格式并返回格式名；目标文件被占用（如已在 Excel 中打开）时立即报错，而不是合并结束改名时才失败"""
+    fmt = output_format(path)
+    if os.path.exists(path):
+        with open(path, "r+b"):
+            pass
+    return fmt
+
+
+def open_writer(path: str, template: pd.DataFrame) -> TableWriter:
+    """按扩展名创建流式写出器，template 提供列名与列类型"""
+    fmt = check_output(path)
+    if fmt == "xlsx":
+        return XlsxStreamWriter(path, template.columns)
+    if fmt == "csv":
+        return CsvStreamWriter(path, template.columns)
+    return ParquetStreamWriter(path, template.columns, template.dtypes)
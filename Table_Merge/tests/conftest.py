@@ -0,0 +1,9 @@
+# -*- coding: utf-8 -*-
+"""
+测试公共配置：
+- 将 Table_Merge 目录加入 sys.path，使测试可直接导入平铺的脚本模块
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+"""
+行政区名规范键测试：
+- 普通行政级别后缀与自治地方名称的民族名剥离
+"""
+import pytest
+
+from merge_engine import canonical_admin_name
+
+
+@pytest.mark.parametrize("name, expected", [
+    ("北京市", "北京"),
+    ("吉林省", "吉林"),
+    ("香港特别行政区", "香港"),
+    ("内蒙古自治区", "内蒙古"),
+    ("西藏自治区", "西藏"),
+    ("宁夏回族自治区", "宁夏"),
+    ("新疆维吾尔自治区", "新疆"),
+    ("广西壮族自治区", "广西"),
+    ("延边朝鲜族自治州", "延边"),
+    ("双江拉祜族佤族布朗族傣族自治县", "双江"),
+    ("五峰土家族自治县", "五峰"),
+    ("阿克塞哈萨克族自治县", "阿克塞"),
+    # 多字民族名后常省略“族”
+    ("巴音郭楞蒙古自治州", "巴音郭楞"),
+    ("博尔塔拉蒙古自治州", "博尔塔拉"),
+    ("伊犁哈萨克自治州", "伊犁"),
+    ("克孜勒苏柯尔克孜自治州", "克孜勒苏"),
+    ("木垒哈萨克自治县", "木垒"),
+    ("巴里坤哈萨克自治县", "巴里坤"),
+    ("察布查尔锡伯自治县", "察布查尔"),
+    ("和布克赛尔蒙古自治县", "和布克赛尔"),
+    ("塔什库尔干塔吉克自治县", "塔什库尔干"),
+    # 以民族名为地名时保留民族名
+    ("鄂温克族自治旗", "鄂温克"),
+    ("鄂温克族", "鄂温克"),
+    ("鄂伦春自治旗", "鄂伦春"),
+    ("东乡族自治县", "东乡"),
+    ("回族", "回族"),
+])
+def test_canonical_admin_name(name, expected):
+    assert canonical_admin_name(name) == expected
+
+
+def test_fullwidth_and_whitespace():
+    assert canonical_admin_name(" 巴音郭楞　蒙古自治州 ") == "巴音郭楞"
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""
+任务文件与批量运行测试：
+- JSON/YAML 批量任务文件经 load_spec、run_batch 执行，各任务按输入顺序报告成功或失败原因
+- 命令行退出码：全部成功为 0，任一任务失败为 1，任务文件无效为 2
+"""
+import json
+
+import pandas as pd
+import pytest
+
+import merge_cli
+from merge_runner import load_spec, run_batch
+
+JOBS = {
+    "defaults": {"file1": "f1.csv", "file2": "f2.csv", "selected_cols": ["v"], "options": {"reuse_index": False}},
+    "jobs": [
+        {"output": "ok.csv", "match_pairs": [{"col1": "a", "col2": "A"}]},
+        {"output": "missing_col.csv", "match_pairs": [{"col1": "x", "col2": "A"}]},
+        {"output": "fuzzy.csv", "match_pairs": [{"col1": "a", "col2": "A", "rule": "fuzzy"}],
+         "options": {"merge_mode": "aggregate", "aggregations": {"v": "count"}}},
+    ],
+    "max_workers": 2,
+}
+
+
+@pytest.fixture
+def spec_dir(tmp_path):
+    pd.DataFrame({"a": ["海南", "北京市", "湖南", None]}).to_csv(tmp_path / "f1.csv", index=False)
+    pd.DataFrame({"A": ["海南", "北京", "海南省"], "v": [1, 2, 3]}).to_csv(tmp_path / "f2.csv", index=False)
+    return tmp_path
+
+
+def write_spec(path, data):
+    if path.suffix == ".json":
+        path.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+    else:
+        yaml = pytest.importorskip("yaml")
+        path.write_text(yaml.safe_dump(data, allow_unicode=True), encoding="utf-8")
+    return str(path)
+
+
+@pytest.mark.parametrize("name", ["jobs.json", "jobs.yaml"])
+def test_batch_reports_status_per_job(spec_dir, name):
+    specs, max_workers = load_spec(write_spec(spec_dir / name, JOBS))
+    assert max_workers == 2
+    assert specs[0]["file1"] == str(spec_dir / "f1.csv")  # 相对路径按任务文件所在目录解析
+    assert specs[2]["options"]["reuse_index"] is False  # 任务选项与默认选项合并
+
+    done = []
+    results = run_batch(specs, max_workers=max_workers, on_done=done.append)
+    assert [result["output"] for result in results] == [str(spec_dir / job["output"]) for job in JOBS["jobs"]]
+    assert [result["status"] for result in results] == ["ok", "error", "ok"]
+    assert "x" in results[1]["error"] and results[0]["error"] is None
+    assert sorted(result["output"] for result in done) == sorted(result["output"] for result in results)
+    assert not (spec_dir / "missing_col.csv").exists()
+    assert pd.read_csv(spec_dir / "ok.csv")["v_from_file2"].fillna(0).tolist() == [1, 0, 0, 0]
+    assert pd.read_csv(spec_dir / "fuzzy.csv")["v_from_file2"].tolist() == [2, 1, 0, 0]
+
+
+def test_invalid_spec_is_rejected(spec_dir):
+    spec = write_spec(spec_dir / "bad.json", {"jobs": [{"file1": "f1.csv", "output": "out.csv"}]})
+    with pytest.raises(ValueError, match="合并任务缺少字段"):
+        load_spec(spec)
+    unknown = dict(JOBS, defaults=dict(JOBS["defaults"], options={"unknown": 1}))
+    with pytest.raises(ValueError, match="未知的运行选项"):
+        load_spec(write_spec(spec_dir / "unknown.json", unknown))
+
+
+def test_cli_exit_codes(spec_dir, capsys):
+    ok = dict(JOBS, jobs=JOBS["jobs"][:1])
+    assert merge_cli.main([write_spec(spec_dir / "ok.json", ok), "-j", "1"]) == 0
+    assert merge_cli.main([write_spec(spec_dir / "jobs.json", JOBS), "-j", "1"]) == 1
+    assert "[失败]" in capsys.readouterr().out
+    assert merge_cli.main([write_spec(spec_dir / "bad.json", {"jobs": [{}]})]) == 2
+    assert "任务文件无效" in capsys.readouterr().err
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+"""
+试运行估计测试：
+- 已保存索引、只含相关行的模糊索引与完整表2索引的估计结果一致
+"""
+import pytest
+
+from benchmark import generate_tables
+from merge_engine import PairIndex, estimate_matches, normalize_column
+
+EXACT_PAIRS = [{"col1": "key", "col2": "key", "rule": "exact"},
+               {"col1": "region", "col2": "region", "rule": "exact"}]
+FUZZY_PAIRS = [{"col1": "key_part", "col2": "key", "rule": "fuzzy"},
+               {"col1": "region", "col2": "region", "rule": "exact"}]
+
+
+@pytest.fixture(scope="module")
+def tables():
+    return generate_tables(3000, 2000, 1500, 0.2, 5, 0.5)
+
+
+def rates(report):
+    return [report["match_rate"], report["ambiguity_rate"]] + \
+        [(p["match_rate"], p["ambiguity_rate"], p["empty_rate"]) for p in report["pairs"]]
+
+
+def test_stored_indexes_do_not_need_lookup_table(tables):
+    df1, df2 = tables
+    stored = [PairIndex(normalize_column(df2[pair["col2"]], pair["rule"]), pair["rule"]) for pair in EXACT_PAIRS]
+    report = estimate_matches(df1, None, EXACT_PAIRS, pair_indexes=stored)
+    assert [p["index_source"] for p in report["pairs"]] == ["stored", "stored"]
+    assert rates(report) == rates(estimate_matches(df1, df2, EXACT_PAIRS))
+
+
+def test_related_fuzzy_index_matches_full_index(tables):
+    df1, df2 = tables
+    report = estimate_matches(df1, df2, FUZZY_PAIRS, ref_sample=100)
+    assert [p["index_source"] for p in report["pairs"]] == ["related", "full"]
+    assert report["ref_sample_rows"] is None
+    assert rates(report) == rates(estimate_matches(df1, df2, FUZZY_PAIRS, ref_sample=len(df2)))
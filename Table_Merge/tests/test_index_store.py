@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""
+表2索引持久化测试：
+- 复用已保存索引的合并结果与首次构建索引时一致
+- 表2内容变化后不再命中已保存的索引
+"""
+import os
+import random
+
+import pandas as pd
+import pytest
+
+from index_store import INDEX_STORE
+from merge_runner import run_merge
+from table_reader import TABLE_CACHE
+
+NAMES = ["海南", "海南省", "北京", "北京市", "河北", "Hebei", "abc", "abd", "湖南", "南", "", None]
+RULES = {
+    "exact": [{"col1": "a", "col2": "A", "rule": "exact"}, {"col1": "b", "col2": "B", "rule": "exact"}],
+    "fuzzy": [{"col1": "a", "col2": "A", "rule": "fuzzy"}, {"col1": "b", "col2": "B", "rule": "exact"}],
+    "similarity": [{"col1": "a", "col2": "A", "rule": "similarity", "threshold": 0.6}],
+}
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    cache_dir = tmp_path / "index_cache"
+    monkeypatch.setattr(INDEX_STORE, "cache_dir", str(cache_dir))
+    return cache_dir
+
+
+@pytest.fixture
+def tables(tmp_path):
+    rng = random.Random(3)
+    df1 = pd.DataFrame({"a": [rng.choice(NAMES) for _ in range(300)], "b": [rng.randint(1, 3) for _ in range(300)]})
+    df2 = pd.DataFrame({"A": [rng.choice(NAMES) for _ in range(50)], "B": [rng.randint(1, 3) for _ in range(50)],
+                        "v": range(50)})
+    file1, file2 = str(tmp_path / "f1.csv"), str(tmp_path / "f2.csv")
+    df1.to_csv(file1, index=False)
+    df2.to_csv(file2, index=False)
+    return file1, file2
+
+
+def merge(tables, output, match_pairs):
+    """复用索引合并一次，返回（输出, 日志中载入已保存索引的次数）"""
+    TABLE_CACHE.clear()
+    logs = []
+    result = run_merge({"file1": tables[0], "file2": tables[1], "output": str(output), "match_pairs": match_pairs,
+                        "selected_cols": ["v"], "options": {"reuse_index": True}}, log=logs.append)
+    assert result["status"] == "ok", result["error"]
+    return pd.read_csv(output), sum("载入已保存的表2索引" in msg for msg in logs)
+
+
+@pytest.mark.parametrize("rules", list(RULES))
+def test_reused_index_gives_same_result(store, tables, tmp_path, rules):
+    first, loaded = merge(tables, tmp_path / "first.csv", RULES[rules])
+    assert loaded == 0
+    assert len(os.listdir(store)) == len(RULES[rules])
+    second, loaded = merge(tables, tmp_path / "second.csv", RULES[rules])
+    assert loaded == len(RULES[rules])
+    pd.testing.assert_frame_equal(second, first)
+    assert first["v_from_file2"].notna().any()
+
+
+@pytest.mark.parametrize("rules", list(RULES))
+def test_modified_table_misses_store(store, tables, tmp_path, rules):
+    merge(tables, tmp_path / "first.csv", RULES[rules])
+    df2 = pd.read_csv(tables[1])
+    df2.loc[0, "A"] = "新增取值"
+    df2.to_csv(tables[1], index=False)
+    result, loaded = merge(tables, tmp_path / "second.csv", RULES[rules])
+    assert loaded == 0
+    assert len(os.listdir(store)) == 2 * len(RULES[rules])
+    # 不复用索引时的结果
+    TABLE_CACHE.clear()
+    run_merge({"file1": tables[0], "file2": tables[1], "output": str(tmp_path / "fresh.csv"),
+               "match_pairs": RULES[rules], "selected_cols": ["v"], "options": {"reuse_index": False}})
+    pd.testing.assert_frame_equal(result, pd.read_csv(tmp_path / "fresh.csv"))
@@ -0,0 +1,346 @@
+# -*- coding: utf-8 -*-
+"""
+合并结果回归测试：
+- 完全相同/模糊规则的合并结果与原 excel_merger 逐行实现一致
+- 展开全部匹配行、聚合全部匹配行与 pandas merge + groupby 结果一致
+- 多进程、低内存、外存合并与默认合并结果一致
+- 表1修改并打乱行序后，增量合并（沿用行与重新匹配行拼接）与完整合并结果一致
+- 多参照表合并与依次合并各参照表的结果一致，不支持展开全部匹配行
+- 取消后从断点继续的结果与一次完成的合并一致，取消不留下空输出文件
+"""
+import os
+import random
+import threading
+
+import pandas as pd
+import pytest
+
+import external_join
+import merge_runner
+from merge_engine import AGGREGATIONS, CONCAT_SEP
+from merge_runner import run_merge
+from merge_state import checkpoint_path
+from table_reader import TABLE_CACHE
+
+VALUES = ["海南", "海南省", "北京", "北京市", "河北", "Hebei", "  abc ", "", None, "ABC", "湖南", "南"]
+CODES = [1, 2, 3, None, "x", "X"]
+SELECTED = ["v", "w"]
+
+
+def legacy_merge(df1, df2, match_pairs, selected_cols):
+    """原 excel_merger.process_merge 的逐行实现：取满足所有条件的第一行表2（不再丢弃全空列）"""
+    def clean(series, rule):
+        series = series.fillna("").astype(str).str.strip()
+        return series.str.lower() if rule == "fuzzy" else series
+
+    cols1 = [clean(df1[pair["col1"]], pair["rule"]) for pair in match_pairs]
+    cols2 = [clean(df2[pair["col2"]], pair["rule"]) for pair in match_pairs]
+    result = df1.copy()
+    for col in selected_cols:
+        result[f"{col}_from_file2"] = None
+    for idx in range(len(df1)):
+        common = None
+        for pair, col1, col2 in zip(match_pairs, cols1, cols2):
+            val1 = col1.iloc[idx]
+            if not val1:
+                common = set()
+                break
+            if pair["rule"] == "exact":
+                hits = {i for i, val2 in col2.items() if val2 == val1}
+            else:
+                hits = {i for i, val2 in col2.items() if val1 in val2 or val2 in val1}
+            common = hits if common is None else common & hits
+            if not common:
+                break
+        if common:
+            row = df2.iloc[min(common)]
+            for col in selected_cols:
+                result.at[idx, f"{col}_from_file2"] = row[col]
+    return result
+
+
+@pytest.fixture(scope="module")
+def tables(tmp_path_factory):
+    rng = random.Random(1)
+    df1 = pd.DataFrame({"a": [rng.choice(VALUES) for _ in range(400)],
+                        "b": [rng.choice(CODES) for _ in range(400)], "c": range(400)})
+    df2 = pd.DataFrame({"A": [rng.choice(VALUES) for _ in range(60)],
+                        "B": [rng.choice(CODES[:5]) for _ in range(60)], "v": range(60),
+                        "w": [rng.random() for _ in range(60)]})
+    base = tmp_path_factory.mktemp("tables")
+    file1, file2 = str(base / "f1.xlsx"), str(base / "f2.xlsx")
+    df1.to_excel(file1, index=False)
+    df2.to_excel(file2, index=False)
+    return file1, file2
+
+
+def matched_pairs(df1, df2, match_pairs):
+    """完全相同规则下全部匹配的（表1行, 表2行），按 pandas 内连接计算，空值不参与匹配"""
+    def keys(df, side):
+        frame = pd.DataFrame({f"k{i}": df[pair[side]].fillna("").astype(str).str.strip()
+                              for i, pair in enumerate(match_pairs)})
+        return frame[(frame != "").all(axis=1)]
+
+    left = keys(df1, "col1").rename_axis("row1").reset_index()
+    right = keys(df2, "col2").rename_axis("row2").reset_index()
+    on = [f"k{i}" for i in range(len(match_pairs))]
+    return left.merge(right, on=on)[["row1", "row2"]].sort_values(["row1", "row2"], ignore_index=True)
+
+
+def reference_all(df1, df2, match_pairs):
+    """展开全部匹配行的参照结果：表1左连接全部匹配的表2行"""
+    pairs = df1.rename_axis("row1").reset_index()[["row1"]].merge(matched_pairs(df1, df2, match_pairs), how="left")
+    result = df1.iloc[pairs["row1"]].reset_index(drop=True)
+    matched = pairs["row2"].notna()
+    for col in SELECTED:
+        values = pd.Series(None, index=pairs.index, dtype=object)
+        values[matched] = df2[col].to_numpy(dtype=object)[pairs["row2"][matched].astype(int)]
+        result[f"{col}_from_file2"] = values
+    return result
+
+
+def reference_aggregate(df1, df2, match_pairs, func):
+    """按表1行聚合全部匹配的表2行的参照结果"""
+    pairs = matched_pairs(df1, df2, match_pairs)
+    result = df1.copy()
+    for col in SELECTED:
+        values = pd.Series(df2[col].to_numpy()[pairs["row2"]], index=pairs["row1"])
+        grouped = values.groupby(level=0)
+        if func == "sum":
+            agg = grouped.sum(min_count=1)
+        elif func == "concat":
+            agg = values.dropna().astype(str).groupby(level=0).agg(CONCAT_SEP.join)
+        else:
+            agg = grouped.agg(func)
+        agg = agg.reindex(range(len(df1)))
+        result[f"{col}_from_file2"] = agg.fillna(0).astype("int64") if func == "count" else agg.to_numpy()
+    return result
+
+
+def roundtrip(df, path):
+    """经 xlsx 写出再读入，使参照结果与合并输出的列类型一致"""
+    df.to_excel(path, index=False)
+    return pd.read_excel(path)
+
+
+def make_pairs(*rules):
+    return [{"col1": col1, "col2": col2, "rule": rule} for (col1, col2), rule in zip([("a", "A"), ("b", "B")], rules)]
+
+
+def merge(tables, output, match_pairs, log=None, **options):
+    TABLE_CACHE.clear()
+    file1, file2 = tables
+    options.setdefault("reuse_index", False)
+    result = run_merge({"file1": file1, "file2": file2, "output": str(output), "match_pairs": match_pairs,
+                        "selected_cols": SELECTED, "options": options}, log=log)
+    assert result["status"] == "ok", result["error"]
+    return pd.read_excel(output)
+
+
+@pytest.mark.parametrize("rules", [("exact",), ("exact", "exact"), ("fuzzy",), ("fuzzy", "exact"),
+                                   ("exact", "fuzzy"), ("fuzzy", "fuzzy")])
+def test_matches_legacy_merge(tables, tmp_path, rules):
+    match_pairs = make_pairs(*rules)
+    expected_path = tmp_path / "expected.xlsx"
+    legacy_merge(pd.read_excel(tables[0]), pd.read_excel(tables[1]), match_pairs, SELECTED) \
+        .to_excel(expected_path, index=False)
+    result = merge(tables, tmp_path / "out.xlsx", match_pairs)
+    pd.testing.assert_frame_equal(result, pd.read_excel(expected_path))
+
+
+@pytest.mark.parametrize("rules", [("exact",), ("exact", "exact")])
+def test_all_mode_matches_pandas_merge(tables, tmp_path, rules):
+    match_pairs = make_pairs(*rules)
+    df1, df2 = pd.read_excel(tables[0]), pd.read_excel(tables[1])
+    expected = roundtrip(reference_all(df1, df2, match_pairs), tmp_path / "expected.xlsx")
+    assert len(expected) > len(df1)  # 存在多行匹配，结果行数多于表1
+    result = merge(tables, tmp_path / "out.xlsx", match_pairs, merge_mode="all")
+    pd.testing.assert_frame_equal(result, expected)
+
+
+@pytest.mark.parametrize("func", list(AGGREGATIONS))
+@pytest.mark.parametrize("rules", [("exact",), ("exact", "exact")])
+def test_aggregate_mode_matches_pandas_groupby(tables, tmp_path, rules, func):
+    match_pairs = make_pairs(*rules)
+    df1, df2 = pd.read_excel(tables[0]), pd.read_excel(tables[1])
+    expected = roundtrip(reference_aggregate(df1, df2, match_pairs, func), tmp_path / "expected.xlsx")
+    result = merge(tables, tmp_path / "out.xlsx", match_pairs, merge_mode="aggregate",
+                   aggregations={col: func for col in SELECTED})
+    pd.testing.assert_frame_equal(result, expected)
+
+
+@pytest.mark.parametrize("options", [{"workers": 2}, {"low_memory": False}], ids=["workers", "full_table"])
+@pytest.mark.parametrize("rules", [("exact", "exact"), ("fuzzy", "exact")])
+def test_modes_match_default(tables, tmp_path, rules, options):
+    match_pairs = make_pairs(*rules)
+    expected = merge(tables, tmp_path / "default.xlsx", match_pairs)
+    result = merge(tables, tmp_path / "mode.xlsx", match_pairs, **options)
+    pd.testing.assert_frame_equal(result, expected)
+
+
+@pytest.mark.parametrize("rules", [("exact",), ("exact", "exact")])
+def test_out_of_core_matches_default(tables, tmp_path, rules):
+    # 外存连接只支持完全相同/行政区名规则
+    match_pairs = make_pairs(*rules)
+    expected = merge(tables, tmp_path / "default.xlsx", match_pairs)
+    result = merge(tables, tmp_path / "external.xlsx", match_pairs, out_of_core=True)
+    pd.testing.assert_frame_equal(result, expected)
+
+
+@pytest.mark.parametrize("mode", [{"merge_mode": "first"}, {"merge_mode": "all"},
+                                  {"merge_mode": "aggregate", "aggregations": {"v": "sum", "w": "concat"}}],
+                         ids=["first", "all", "aggregate"])
+@pytest.mark.parametrize("rules", [("exact", "exact"), ("fuzzy", "exact")])
+def test_incremental_matches_full_merge(tables, tmp_path, rules, mode):
+    match_pairs = make_pairs(*rules)
+    file1 = str(tmp_path / "f1.xlsx")
+    df1 = pd.read_excel(tables[0])
+    df1.to_excel(file1, index=False)
+    output = tmp_path / "out.xlsx"
+    merge((file1, tables[1]), output, match_pairs, incremental=True, **mode)
+
+    # 修改部分行的匹配键，插入新行、删除末尾行并打乱行序
+    rng = random.Random(5)
+    for row in rng.sample(range(len(df1)), 50):
+        df1.loc[row, "a"] = rng.choice(["海南", "北京市", "abc", "新值"])
+    new_rows = pd.DataFrame({"a": ["海南省", "湖南"], "b": [1, "x"], "c": [-1, -2]})
+    df1 = pd.concat([df1.iloc[:100], new_rows, df1.iloc[100:-30]]).sample(frac=1, random_state=5)
+    df1.to_excel(file1, index=False)
+
+    logs = []
+    result = merge((file1, tables[1]), output, match_pairs, log=logs.append, incremental=True, **mode)
+    reuse = [msg for msg in logs if msg.startswith("增量模式")]
+    assert reuse and "沿用上次结果0行" not in reuse[0]
+    expected = merge((file1, tables[1]), tmp_path / "full.xlsx", match_pairs, **mode)
+    pd.testing.assert_frame_equal(result, expected)
+
+
+def test_out_of_core_checks_table1_columns_before_loading_table2(tables, tmp_path, monkeypatch):
+    read = []
+    monkeypatch.setattr(external_join, "iter_table_chunks", lambda path, *args: read.append(path) or iter(()))
+    TABLE_CACHE.clear()
+    output = tmp_path / "out.xlsx"
+    result = run_merge({"file1": tables[0], "file2": tables[1], "output": str(output),
+                        "match_pairs": [{"col1": "x", "col2": "A", "rule": "exact"}], "selected_cols": SELECTED,
+                        "options": {"out_of_core": True, "reuse_index": False}})
+    assert result["error"] == "表1中不存在列：['x']"
+    assert read == []
+    assert not os.path.exists(output)
+
+
+def test_low_memory_does_not_cache_full_lookup_table(tables, tmp_path):
+    file2 = tables[1]
+    merge(tables, tmp_path / "out.xlsx", make_pairs("exact", "exact"), low_memory=True)
+    assert not TABLE_CACHE.is_cached(file2)
+    assert len(TABLE_CACHE.peek(file2, 5)) == 5
+    assert not TABLE_CACHE.is_cached(file2)
+
+
+def test_concurrent_parallel_merges(tables, tmp_path):
+    # 两次多进程合并在不同线程中同时进行，各自的子进程状态互不干扰
+    runs = {"fuzzy": make_pairs("fuzzy"), "fuzzy_exact": make_pairs("fuzzy", "exact")}
+    expected = {name: merge(tables, tmp_path / f"{name}_default.xlsx", pairs) for name, pairs in runs.items()}
+    file1, file2 = tables
+    results = {}
+
+    def run(name):
+        results[name] = run_merge({"file1": file1, "file2": file2, "output": str(tmp_path / f"{name}.xlsx"),
+                                   "match_pairs": runs[name], "selected_cols": SELECTED,
+                                   "options": {"workers": 2, "reuse_index": False}})
+
+    threads = [threading.Thread(target=run, args=(name,)) for name in runs]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for name in runs:
+        assert results[name]["status"] == "ok", results[name]["error"]
+        pd.testing.assert_frame_equal(pd.read_excel(tmp_path / f"{name}.xlsx"), expected[name])
+
+
+@pytest.fixture
+def table3(tmp_path):
+    rng = random.Random(4)
+    df3 = pd.DataFrame({"K": [rng.choice(CODES) for _ in range(20)], "p": [f"p{i}" for i in range(20)]})
+    file3 = str(tmp_path / "f3.xlsx")
+    df3.to_excel(file3, index=False)
+    return file3
+
+
+def multi_spec(tables, table3, output, **options):
+    return {"file1": tables[0], "output": str(output), "options": dict(options, reuse_index=False),
+            "sources": [{"file2": tables[1], "match_pairs": make_pairs("fuzzy"), "selected_cols": SELECTED},
+                        {"file2": table3, "match_pairs": [{"col1": "b", "col2": "K", "rule": "exact"}],
+                         "selected_cols": ["p"]}]}
+
+
+def test_multi_merge_matches_chained_merges(tables, table3, tmp_path):
+    TABLE_CACHE.clear()
+    result = run_merge(multi_spec(tables, table3, tmp_path / "multi.xlsx"))
+    assert result["status"] == "ok", result["error"]
+
+    # 依次合并：表1与表2合并，其结果再与表3合并；第二张参照表的合并列改名为 _from_file3
+    first = tmp_path / "first.xlsx"
+    merge(tables, first, make_pairs("fuzzy"))
+    TABLE_CACHE.clear()
+    chained = run_merge({"file1": str(first), "file2": table3, "output": str(tmp_path / "chained.xlsx"),
+                         "match_pairs": [{"col1": "b", "col2": "K", "rule": "exact"}], "selected_cols": ["p"],
+                         "options": {"reuse_index": False}})
+    assert chained["status"] == "ok", chained["error"]
+    expected = pd.read_excel(tmp_path / "chained.xlsx").rename(columns={"p_from_file2": "p_from_file3"})
+    multi = pd.read_excel(tmp_path / "multi.xlsx")
+    assert list(multi.columns) == ["a", "b", "c", "v_from_file2", "w_from_file2", "p_from_file3"]
+    pd.testing.assert_frame_equal(multi, expected)
+
+
+def test_multi_merge_rejects_all_mode(tables, table3, tmp_path):
+    output = tmp_path / "multi.xlsx"
+    result = run_merge(multi_spec(tables, table3, output, merge_mode="all"))
+    assert result["status"] == "error"
+    assert "不支持" in result["error"]
+    assert not os.path.exists(output)
+
+
+def cancel_at_batch(monkeypatch, batch):
+    """第 batch 批逐行匹配开始前置位取消事件（每批100行），返回已调用的批次记录"""
+    calls = []
+    match_chunk = merge_runner.match_chunk
+
+    def cancelling(*args, **kwargs):
+        calls.append(args[2])
+        if len(calls) == batch:
+            kwargs["cancel_event"].set()
+        return match_chunk(*args, **kwargs)
+
+    monkeypatch.setattr(merge_runner, "match_chunk", cancelling)
+    return calls
+
+
+def test_resume_from_checkpoint(tables, tmp_path, monkeypatch):
+    match_pairs = make_pairs("fuzzy", "exact")
+    expected = merge(tables, tmp_path / "default.xlsx", match_pairs)
+    output = tmp_path / "out.xlsx"
+    calls = cancel_at_batch(monkeypatch, 3)
+    partial = merge(tables, output, match_pairs)
+    # 取消时写出已完成的前200行并保存断点
+    pd.testing.assert_frame_equal(partial, expected.iloc[:200])
+    assert os.path.exists(checkpoint_path(str(output)))
+
+    monkeypatch.undo()
+    calls = cancel_at_batch(monkeypatch, 0)
+    result = merge(tables, output, match_pairs)
+    pd.testing.assert_frame_equal(result, expected)
+    # 断点之后的200行中，匹配键已在断点中出现的行沿用已有结果，其余不足一批
+    assert calls == [0]
+    assert not os.path.exists(checkpoint_path(str(output)))
+
+
+def test_cancel_before_any_rows_leaves_no_files(tables, tmp_path, monkeypatch):
+    output = tmp_path / "out.csv"
+    cancel_at_batch(monkeypatch, 1)
+    TABLE_CACHE.clear()
+    result = run_merge({"file1": tables[0], "file2": tables[1], "output": str(output),
+                        "match_pairs": make_pairs("fuzzy"), "selected_cols": SELECTED,
+                        "options": {"reuse_index": False}})
+    assert result["status"] == "ok", result["error"]
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+"""
+合并指标测试：
+- 峰值内存按次采样，不受同一进程中之前运行的影响
+"""
+import time
+
+import numpy as np
+import pytest
+
+from merge_runner import MemorySampler, current_memory_mb
+
+
+@pytest.mark.skipif(current_memory_mb() is None, reason="无法获取常驻内存")
+def test_memory_sampler_is_per_run():
+    first = MemorySampler(interval=0.01)
+    first.start()
+    block = np.ones(100 * 2 ** 20 // 8)  # 约100MB
+    time.sleep(0.1)
+    del block
+    first_peak = first.stop()
+
+    second = MemorySampler(interval=0.01)
+    second.start()
+    time.sleep(0.05)
+    second_peak = second.stop()
+    assert first_peak - second_peak > 50
+    assert second.stop() == second_peak
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""
+相似度规则测试：
+- SimilarityIndex 的长度与 n-gram 计数过滤不漏掉任何相似度达标的取值，得分与逐对编辑距离一致
+- similarity 规则端到端合并结果与逐行暴力匹配一致
+"""
+import random
+
+import pandas as pd
+import pytest
+
+from merge_engine import SimilarityIndex
+from merge_runner import run_merge
+from table_reader import TABLE_CACHE
+
+ALPHABET = "abcde海南北京"
+THRESHOLDS = [0.3, 0.5, 0.6, 0.75, 0.8, 0.9, 1.0]
+
+
+def levenshtein(a, b):
+    prev = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        cur = [i]
+        for j, cb in enumerate(b, 1):
+            cur.append(min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (ca != cb)))
+        prev = cur
+    return prev[-1]
+
+
+def similarity(a, b):
+    return 1 - levenshtein(a, b) / max(len(a), len(b))
+
+
+def random_values(rng, count, max_len=9):
+    return ["".join(rng.choice(ALPHABET) for _ in range(rng.randint(1, max_len))) for _ in range(count)]
+
+
+def mutate(rng, value):
+    """随机替换、插入或删除一个字符，得到相似度较高的查询"""
+    pos = rng.randrange(len(value))
+    op = rng.choice(["replace", "insert", "delete"])
+    if op == "replace":
+        return value[:pos] + rng.choice(ALPHABET) + value[pos + 1:]
+    if op == "insert":
+        return value[:pos] + rng.choice(ALPHABET) + value[pos:]
+    return value[:pos] + value[pos + 1:] or value
+
+
+@pytest.mark.parametrize("threshold", THRESHOLDS)
+def test_index_matches_brute_force(threshold):
+    rng = random.Random(threshold)
+    values = list(dict.fromkeys(random_values(rng, 300)))
+    index = SimilarityIndex(values, threshold)
+    queries = random_values(rng, 100) + [mutate(rng, rng.choice(values)) for _ in range(100)]
+    for query in queries:
+        expected = {vid for vid, value in enumerate(values) if similarity(query, value) >= threshold - 1e-9}
+        ids = index.candidates(query)
+        assert expected <= set(ids), query
+        assert index.lookup(query) == expected, query
+        scores = index.score(query, ids)
+        assert list(scores) == pytest.approx([similarity(query, values[vid]) for vid in ids]), query
+
+
+@pytest.mark.parametrize("threshold", [0.6, 0.8])
+def test_similarity_merge_matches_brute_force(tmp_path, threshold):
+    rng = random.Random(2)
+    names = list(dict.fromkeys(random_values(rng, 80, max_len=8)))
+    df2 = pd.DataFrame({"name": [name.upper() if i % 3 == 0 else name for i, name in enumerate(names)],
+                        "v": range(len(names))})
+    keys = [mutate(rng, rng.choice(names)) for _ in range(150)] + random_values(rng, 50) + ["", None]
+    df1 = pd.DataFrame({"key": [f" {key} " if key and i % 4 == 0 else key for i, key in enumerate(keys)]})
+    file1, file2, output = str(tmp_path / "f1.csv"), str(tmp_path / "f2.csv"), str(tmp_path / "out.csv")
+    df1.to_csv(file1, index=False)
+    df2.to_csv(file2, index=False)
+
+    TABLE_CACHE.clear()
+    result = run_merge({"file1": file1, "file2": file2, "output": output, "selected_cols": ["v"],
+                        "match_pairs": [{"col1": "key", "col2": "name", "rule": "similarity",
+                                         "threshold": threshold}],
+                        "options": {"reuse_index": False}})
+    assert result["status"] == "ok", result["error"]
+
+    refs = df2["name"].str.strip().str.lower()
+    expected = []
+    for key in pd.read_csv(file1)["key"].fillna("").astype(str).str.strip().str.lower():
+        hits = [row for row, ref in enumerate(refs) if key and similarity(key, ref) >= threshold - 1e-9]
+        expected.append(float(df2["v"][hits[0]]) if hits else None)
+    merged = pd.read_csv(output)["v_from_file2"]
+    pd.testing.assert_series_equal(merged.astype("float64"), pd.Series(expected, dtype="float64", name="v_from_file2"))
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""
+流式写出测试：
+- xlsx 超过工作表行数上限时依次分到新工作表，各工作表均有表头
+- csv 分块写出与整表写出一致；parquet 数值/时间列保留类型，对象列存为字符串
+- 写出经临时文件完成，放弃写出不留下任何文件
+"""
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import table_writer
+from table_writer import open_writer
+
+
+def sample_frame(rows):
+    return pd.DataFrame({
+        "id": np.arange(rows, dtype="int64"),
+        "score": [i / 2 if i % 3 else np.nan for i in range(rows)],
+        "name": [f"名称{i}" if i % 4 else None for i in range(rows)],
+    })
+
+
+def write_chunks(path, df, sizes):
+    writer = open_writer(str(path), df.head(0))
+    start = 0
+    for size in sizes:
+        writer.write(df.iloc[start:start + size])
+        start += size
+    writer.close()
+    assert writer.rows_written == len(df)
+
+
+def test_xlsx_splits_sheets_at_row_limit(tmp_path, monkeypatch):
+    monkeypatch.setattr(table_writer, "EXCEL_MAX_ROWS", 4)  # 表头 + 3 行数据
+    df = sample_frame(10)
+    path = tmp_path / "out.xlsx"
+    write_chunks(path, df, [4, 6])
+    sheets = pd.read_excel(path, sheet_name=None)
+    assert list(sheets) == ["Sheet1", "Sheet2", "Sheet3", "Sheet4"]
+    assert [len(sheet) for sheet in sheets.values()] == [3, 3, 3, 1]
+    assert all(list(sheet.columns) == list(df.columns) for sheet in sheets.values())
+    pd.testing.assert_frame_equal(pd.concat(sheets.values(), ignore_index=True), df)
+
+
+def test_xlsx_without_rows_keeps_header(tmp_path):
+    path = tmp_path / "empty.xlsx"
+    write_chunks(path, sample_frame(0), [])
+    assert list(pd.read_excel(path).columns) == ["id", "score", "name"]
+
+
+def test_csv_chunks_match_to_csv(tmp_path):
+    df = sample_frame(25)
+    path = tmp_path / "out.csv"
+    write_chunks(path, df, [10, 0, 15])
+    df.to_csv(tmp_path / "expected.csv", index=False, encoding="utf-8-sig")
+    assert path.read_bytes() == (tmp_path / "expected.csv").read_bytes()
+
+
+def test_parquet_dtype_round_trip(tmp_path):
+    df = sample_frame(12).assign(
+        flag=[i % 2 == 0 for i in range(12)],
+        day=pd.date_range("2024-01-01", periods=12, freq="D"),
+        mixed=pd.Series([1, "x", None, 2.5] * 3, dtype=object),
+    )
+    path = tmp_path / "out.parquet"
+    write_chunks(path, df, [5, 7])
+    result = pd.read_parquet(path)
+    assert list(result.columns) == list(df.columns)
+    for col in ("id", "score", "flag", "day"):
+        assert result[col].dtype == df[col].dtype, col
+        pd.testing.assert_series_equal(result[col], df[col])
+    # 对象列存为字符串，空值保持为空
+    for col in ("mixed", "name"):
+        assert result[col].isna().tolist() == df[col].isna().tolist(), col
+        assert result[col].dropna().tolist() == df[col].dropna().astype(str).tolist(), col
+    assert result["mixed"].tolist()[:2] == ["1", "x"]
+
+
+@pytest.mark.parametrize("ext", [".xlsx", ".csv", ".parquet"])
+def test_abort_leaves_no_files(tmp_path, ext):
+    df = sample_frame(5)
+    writer = open_writer(str(tmp_path / f"out{ext}"), df.head(0))
+    writer.write(df)
+    writer.abort()
+    assert os.listdir(tmp_path) == []
+
+
+@pytest.mark.parametrize("ext", [".xlsx", ".csv", ".parquet"])
+def test_close_replaces_existing_output(tmp_path, ext):
+    path = tmp_path / f"out{ext}"
+    write_chunks(path, sample_frame(8), [8])
+    write_chunks(path, sample_frame(3), [3])
+    assert os.listdir(tmp_path) == [path.name]
+    read = {".xlsx": pd.read_excel, ".csv": pd.read_csv, ".parquet": pd.read_parquet}[ext]
+    assert len(read(path)) == 3
@@ -3,12 +3,10 @@ import glob
 import rasterio
 import geopandas as gpd
 import pandas as pd
-import numpy as np
 import matplotlib.pyplot as plt
-from rasterio.mask import mask
-from shapely.geometry import mapping, box
 from matplotlib.colors import LinearSegmentedColormap
 import time
+from zonal_stats import ZonalEngine
 
 # 设置中文字体
 plt.rcParams["font.family"] = ["SimHei"]
@@ -19,7 +17,7 @@ os.environ["SHAPE_RESTORE_SHX"] = "YES"
 
 
 def calculate_township_suitability(tiff_path, townships, admin_field_mapping,
-                                   shp_filename, output_folder, visualize=True):
+                                   shp_filename, output_folder, visualize=True, backend="mask"):
     """处理单个TIFF文件与矢量数据，包含矢量字段输出功能"""
     start_time = time.time()
     tiff_filename = os.path.basename(tiff_path).split('.')[0]
@@ -51,83 +49,30 @@ def calculate_township_suitability(tiff_path, townships, admin_field_mapping,
             print(f"   - {mf}")
         return None
 
-    # 2. 读取TIFF数据并处理
+    # 2. 调用分区统计引擎计算适宜性
     print(f"\n{'=' * 60}")
-    print(f"处理文件：SHP={shp_filename} | TIFF={tiff_filename}")
+    print(f"处理文件：SHP={shp_filename} | TIFF={tiff_filename} | 后端={backend}")
     print(f"{'=' * 60}")
+    engine = ZonalEngine(admin_field_mapping, backend=backend)
     with rasterio.open(tiff_path) as src:
         tiff_crs = src.crs
-        tiff_bounds = src.bounds
-        tiff_extent = box(*tiff_bounds)
-        print(f"✅ TIFF坐标系: {tiff_crs}")
-
-        # 处理矢量坐标系
-        if townships.crs is None:
-            print("⚠️  矢量无坐标系，默认设为EPSG:4326")
-            townships = townships.set_crs("EPSG:4326")
+    print(f"✅ TIFF坐标系: {tiff_crs}")
+    if townships.crs is None:
+        print("⚠️  矢量无坐标系，默认设为EPSG:4326")
+    try:
+        townships = engine.align_crs(townships, tiff_crs)
         print(f"✅ 矢量坐标系: {townships.crs}")
-
-        # 坐标系转换
-        if townships.crs != tiff_crs:
-            print(f"🔄 转换矢量坐标系至 {tiff_crs}")
-            try:
-                townships = townships.to_crs(tiff_crs)
-                print("✅ 坐标系转换完成")
-            except Exception as e:
-                print(f"❌ 坐标系转换失败: {str(e)}")
-                return None
-
-        # 检查空间重叠
-        townships_extent = box(*townships.total_bounds)
-        if not tiff_extent.intersects(townships_extent):
-            print("⚠️  矢量与TIFF无空间重叠，跳过")
-            return None
-
-        # 3. 提取信息并计算适宜性
-        total_townships = len(townships)
-        results = []
-        valid_indices = []
-
-        for idx, row in townships.iterrows():
-            if idx % 100 == 0:
-                progress = (idx / total_townships) * 100
-                print(f"🔄 进度: {progress:.1f}% ({idx}/{total_townships})")
-
-            try:
-                # 提取行政信息
-                admin_info = {}
-                for level, field in admin_field_mapping.items():
-                    if field:
-                        value = row[field] if field in row.index else "未知"
-                        admin_info[level] = str(value) if pd.notna(value) and str(value).strip() != '' else "未知"
-                    else:
-                        admin_info[level] = "未知"
-
-                # 空间检查
-                row_geom = row['geometry']
-                if not row_geom.intersects(tiff_extent):
-                    continue
-
-                # 计算均值
-                geom = [mapping(row_geom)]
-                out_image, _ = mask(src, geom, crop=True)
-                nodata = src.nodata
-
-                if nodata is not None:
-                    values = out_image[out_image != nodata]
-                else:
-                    values = out_image.flatten()
-
-                if len(values) > 0 and not np.all(np.isnan(values)):
-                    suitability_mean = round(np.nanmean(values), 4)
-                    results.append({
-                        **admin_info,
-                        "适宜性均值": suitability_mean
-                    })
-                    valid_indices.append(idx)
-
-            except Exception as e:
-                print(f"❌ 处理第{idx}个单元时出错: {str(e)}")
+        stats_df = engine.compute(
+            townships, tiff_path,
+            progress_callback=lambda done, total: print(
+                f"🔄 进度: {done / total * 100:.1f}% ({done}/{total})"),
+            log=lambda msg: print(f"❌ {msg}")
+        )
+    except ValueError as e:
+        print(f"❌ {str(e)}，跳过")
+        return None
+    valid_indices = stats_df.index.tolist()
+    results = stats_df.to_dict("records")
 
     # 4. 保存结果（添加序号列）
     if not results:
@@ -214,6 +159,7 @@ def visualize_suitability(gdf, shp_name, tiff_name, output_folder):
 if __name__ == "__main__":
     # 超参数设置
     ST_Class = "Sheng_Frame"  # 可选：Xian_Frame / Shi_Frame / Sheng_Frame
+    BACKEND = "mask"  # 分区统计后端：mask（默认，与原结果一致）/ rasterize / blocks（更快，差异见 zonal_stats.py）
     TIFF_FOLDER = "./Data/"
     OUTPUT_FOLDER = "./results/"
 
@@ -282,7 +228,8 @@ if __name__ == "__main__":
             admin_field_mapping=admin_field_mapping,
             shp_filename=shp_filename,
             output_folder=OUTPUT_FOLDER,
-            visualize=True
+            visualize=True,
+            backend=BACKEND
         )
 
     print(f"\n🎉 所有文件处理完成，结果保存在：{OUTPUT_FOLDER}")
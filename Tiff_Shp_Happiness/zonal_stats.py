@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+"""
+分区统计引擎（可复用库接口）
+- 输入 GeoDataFrame + 栅格路径，输出 DataFrame，不打印、不绘图
+- 可插拔后端：mask（逐单元掩膜）/ rasterize（栅格化 + bincount）/ blocks（分块流式）
+- Main.py 仅作为命令行外壳调用本模块
+"""
+
+from typing import Callable, Dict, Optional
+
+import numpy as np
+import pandas as pd
+import rasterio
+from rasterio.features import rasterize
+from rasterio.mask import mask
+from rasterio.windows import Window, bounds as window_bounds
+from rasterio.windows import transform as window_transform
+from shapely.geometry import box, mapping
+
+UNKNOWN = "未知"
+
+
+class ZonalEngine:
+    """分区均值计算引擎
+
+    backend:
+        mask      - 逐单元 rasterio.mask，允许单元重叠，速度最慢（默认，与原实现结果一致）
+        rasterize - 整幅栅格化单元编号后用 bincount 一次性聚合，需显式指定
+        blocks    - 按块读取栅格并逐块栅格化聚合，内存只与块大小相关，需显式指定
+
+    rasterize/blocks 与 mask 的结果差异：
+        - 栅格无 nodata 时，mask 会把裁剪框内、单元外的填充0值计入均值，栅格化后端只统计单元内像元；
+        - 单元编号栅格每个像元只有一个编号，单元相互重叠时重叠像元只计入最后写入的单元。
+    单元互不重叠且栅格设置了 nodata 时，三种后端结果一致。
+    """
+
+    BACKENDS = ("mask", "rasterize", "blocks")
+
+    def __init__(self, admin_field_mapping: Dict[str, str], backend: str = "mask",
+                 value_field: str = "适宜性均值", block_size: int = 1024, decimals: int = 4,
+                 default_crs: str = "EPSG:4326"):
+        if backend not in self.BACKENDS:
+            raise ValueError(f"未知的分区统计后端：{backend}（可选：{'/'.join(self.BACKENDS)}）")
+        self.admin_field_mapping = admin_field_mapping
+        self.backend = backend
+        self.value_field = value_field
+        self.block_size = block_size
+        self.decimals = decimals
+        self.default_crs = default_crs
+
+    def missing_fields(self, gdf) -> list:
+        """返回映射中存在但矢量数据缺失的字段（格式：级别（字段名：xx））"""
+        return [f"{level}（字段名：{field}）" for level, field in self.admin_field_mapping.items()
+                if field and field not in gdf.columns]
+
+    def admin_info(self, gdf) -> pd.DataFrame:
+        """提取行政信息列，空值统一为“未知”"""
+        def clean(value):
+            return str(value) if pd.notna(value) and str(value).strip() != '' else UNKNOWN
+
+        info = {}
+        for level, field in self.admin_field_mapping.items():
+            if field and field in gdf.columns:
+                info[level] = gdf[field].map(clean)
+            else:
+                info[level] = pd.Series(UNKNOWN, index=gdf.index)
+        return pd.DataFrame(info, index=gdf.index)
+
+    def align_crs(self, gdf, raster_crs):
+        """矢量坐标系对齐到栅格坐标系（无坐标系时使用 default_crs）"""
+        if gdf.crs is None:
+            gdf = gdf.set_crs(self.default_crs)
+        if gdf.crs != raster_crs:
+            try:
+                gdf = gdf.to_crs(raster_crs)
+            except Exception as e:
+                raise ValueError(f"坐标系转换失败: {str(e)}")
+        return gdf
+
+    def compute(self, gdf, raster_path: str,
+                progress_callback: Optional[Callable[[int, int], None]] = None,
+                log: Optional[Callable[[str], None]] = None) -> pd.DataFrame:
+        """计算每个单元的栅格均值
+
+        返回以原 gdf 索引为索引的 DataFrame，列为映射级别 + value_field，
+        仅包含有有效像元的单元；字段缺失、坐标系转换失败或无空间重叠时抛出 ValueError。
+        mask 后端逐单元计算，单个单元出错（如几何无效）时跳过该单元，错误信息交给 log。
+        """
+        missing = self.missing_fields(gdf)
+        if missing:
+            raise ValueError(f"以下必要字段不存在：{'、'.join(missing)}")
+
+        with rasterio.open(raster_path) as src:
+            gdf = self.align_crs(gdf, src.crs)
+            raster_extent = box(*src.bounds)
+            if len(gdf) == 0 or not raster_extent.intersects(box(*gdf.total_bounds)):
+                raise ValueError("矢量与TIFF无空间重叠")
+
+            # 与栅格范围相交的单元（位置下标）
+            candidates = np.flatnonzero(gdf.geometry.intersects(raster_extent).to_numpy())
+
+            if self.backend == "mask":
+                sums, counts = self._stats_mask(src, gdf, candidates, progress_callback, log)
+            elif self.backend == "rasterize":
+                sums, counts = self._stats_rasterize(src, gdf, candidates, progress_callback)
+            else:
+                sums, counts = self._stats_blocks(src, gdf, candidates, progress_callback)
+
+        valid = counts > 0
+        positions = np.flatnonzero(valid)
+        means = np.round(sums[valid] / counts[valid], self.decimals)
+
+        info = self.admin_info(gdf.iloc[positions])
+        result = info[list(self.admin_field_mapping.keys())].copy()
+        result[self.value_field] = means
+        return result
+
+    # ---------------- 后端实现：均返回 (sums, counts)，长度为 len(gdf) ----------------
+
+    @staticmethod
+    def _valid_values(values: np.ndarray, nodata) -> np.ndarray:
+        """剔除 nodata 与 NaN 像元"""
+        if nodata is not None:
+            values = values[values != nodata]
+        if np.issubdtype(values.dtype, np.floating):
+            values = values[~np.isnan(values)]
+        return values
+
+    def _stats_mask(self, src, gdf, candidates, progress_callback, log=None):
+        """逐单元掩膜（原实现，nodata 为空时保留掩膜填充的0值；单元出错时跳过）"""
+        n = len(gdf)
+        sums = np.zeros(n, dtype="float64")
+        counts = np.zeros(n, dtype="int64")
+        geometries = gdf.geometry.to_numpy()
+        for done, pos in enumerate(candidates, 1):
+            try:
+                out_image, _ = mask(src, [mapping(geometries[pos])], crop=True)
+                values = self._valid_values(out_image.ravel(), src.nodata)
+                sums[pos] = values.sum(dtype="float64")
+                counts[pos] = values.size
+            except ValueError:
+                # 单元与栅格不重叠
+                pass
+            except Exception as e:
+                if log:
+                    log(f"处理第{gdf.index[pos]}个单元时出错: {str(e)}")
+            if progress_callback and done % 100 == 0:
+                progress_callback(done, len(candidates))
+        return sums, counts
+
+    def _accumulate(self, ids: np.ndarray, data: np.ndarray, nodata, sums, counts):
+        """将一块像元按单元编号（1起，0为背景）累加到 sums/counts"""
+        n = len(sums)
+        for band in data:
+            valid = ids > 0
+            if nodata is not None:
+                valid &= band != nodata
+            if np.issubdtype(band.dtype, np.floating):
+                valid &= ~np.isnan(band)
+            zone = ids[valid] - 1
+            sums += np.bincount(zone, weights=band[valid].astype("float64"), minlength=n)
+            counts += np.bincount(zone, minlength=n)
+
+    def _stats_rasterize(self, src, gdf, candidates, progress_callback):
+        """整幅栅格化单元编号，一次读取、一次聚合"""
+        n = len(gdf)
+        sums = np.zeros(n, dtype="float64")
+        counts = np.zeros(n, dtype="int64")
+        geometries = gdf.geometry.to_numpy()
+        shapes = ((geometries[pos], int(pos) + 1) for pos in candidates)
+        ids = rasterize(shapes, out_shape=(src.height, src.width), transform=src.transform,
+                        fill=0, dtype="int32")
+        self._accumulate(ids, src.read(), src.nodata, sums, counts)
+        if progress_callback:
+            progress_callback(len(candidates), len(candidates))
+        return sums, counts
+
+    def _stats_blocks(self, src, gdf, candidates, progress_callback):
+        """按块读取栅格，仅栅格化与当前块相交的单元"""
+        n = len(gdf)
+        sums = np.zeros(n, dtype="float64")
+        counts = np.zeros(n, dtype="int64")
+        geometries = gdf.geometry.to_numpy()
+        sindex = gdf.iloc[candidates].sindex
+
+        windows = [
+            Window(col, row, min(self.block_size, src.width - col), min(self.block_size, src.height - row))
+            for row in range(0, src.height, self.block_size)
+            for col in range(0, src.width, self.block_size)
+        ]
+        for done, win in enumerate(windows, 1):
+            hits = sindex.query(box(*window_bounds(win, src.transform)))
+            if len(hits):
+                positions = candidates[hits]
+                shapes = ((geometries[pos], int(pos) + 1) for pos in positions)
+                ids = rasterize(shapes, out_shape=(int(win.height), int(win.width)),
+                                transform=window_transform(win, src.transform), fill=0, dtype="int32")
+                self._accumulate(ids, src.read(window=win), src.nodata, sums, counts)
+            if progress_callback:
+                progress_callback(done, len(windows))
+        return sums, counts